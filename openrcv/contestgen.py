@@ -119,11 +119,8 @@ class BallotGenerator(object):
         Arguments:
           choices: a sequence of integers.
         """
-        with ballots_resource.writing() as gen:
-            for i in range(count):
-                choices = self.make_choices()
-                ballot = 1, choices
-                gen.send(ballot)
+        make_choices = self.make_choices
+        ballots_resource.write_many((1, make_choices()) for i in range(count))
 
 
 class UniqueBallotGenerator(BallotGenerator):
@@ -0,0 +1,341 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+"""
+Support for converting ballots between file formats.
+
+A contest is opened from the input file with its ballots resource
+reading from disk, and the contest is then written with an output
+format's writer.  Ballots are thus streamed rather than loaded into
+memory, except where a format requires it (e.g. the npz writer).
+
+Only the BLT format stores a contest's seat count and withdrawn
+candidates.  Other input formats are read as single-seat contests with
+no withdrawn candidates, and converting to them logs a warning if the
+seat count or withdrawn candidates would be lost.
+
+"""
+
+from contextlib import contextmanager
+import logging
+import os
+from tempfile import TemporaryDirectory
+import timeit
+
+from openrcv import contestgen, jsonlib, streams
+from openrcv.counting import read_blt_contest
+from openrcv.formats.binary import BinaryBallotsResource
+from openrcv.formats.blt import unquote_blt_text
+from openrcv.formats.csvranks import CSVRanksReader
+from openrcv.formats.internal import (internal_ballots_resource, parse_internal_ballot,
+                                      ENCODING_BALLOT_FILE)
+from openrcv.formats.npz import NpzBallotsResource
+from openrcv.models import ContestInput, SQLiteBallotsResource
+from openrcv.parsing import ChunkedBLTParser
+from openrcv.utils import logged_open, COMPRESSION_AUTO, COMPRESSION_EXTENSIONS
+
+
+log = logging.getLogger(__name__)
+
+INPUT_FORMAT_BINARY = 'binary'
+INPUT_FORMAT_BLT = 'blt'
+INPUT_FORMAT_CSV = 'csv'
+INPUT_FORMAT_INTERNAL = 'internal'
+INPUT_FORMAT_NPZ = 'npz'
+INPUT_FORMAT_TEST = 'jscase'
+
+# The input format of each file extension.  Other extensions are read
+# as internal ballot files.
+INPUT_FORMAT_EXTENSIONS = {
+    '.bin': INPUT_FORMAT_BINARY,
+    '.blt': INPUT_FORMAT_BLT,
+    '.csv': INPUT_FORMAT_CSV,
+    '.json': INPUT_FORMAT_TEST,
+    '.npz': INPUT_FORMAT_NPZ,
+}
+
+
+def detect_input_format(path):
+    """Return the input format of a path, based on its extension.
+
+    A compression extension (e.g. ".gz") is skipped.
+    """
+    base, ext = os.path.splitext(path)
+    if ext.lower() in COMPRESSION_EXTENSIONS:
+        ext = os.path.splitext(base)[1]
+    return INPUT_FORMAT_EXTENSIONS.get(ext.lower(), INPUT_FORMAT_INTERNAL)
+
+
+def _get_max_choice(ballots_resource):
+    max_choice = 0
+    with ballots_resource.reading() as ballots:
+        for weight, choices in ballots:
+            if choices:
+                max_choice = max(max_choice, max(choices))
+    return max_choice
+
+
+def _make_contest(ballots_resource, candidate_count=None, **kwargs):
+    """Return a ContestInput with standard candidate names.
+
+    Arguments:
+      candidate_count: defaults to the largest choice.
+    """
+    if candidate_count is None:
+        candidate_count = _get_max_choice(ballots_resource)
+    candidates = contestgen.make_standard_candidate_names(candidate_count)
+    return ContestInput(candidates=candidates, ballots_resource=ballots_resource, **kwargs)
+
+
+@contextmanager
+def _staging_resource(store):
+    """Yield a resource to stage ballots to (on disk)."""
+    if store is not None:
+        yield store
+        return
+    with TemporaryDirectory() as temp_dir:
+        ballots_path = os.path.join(temp_dir, "ballots.txt")
+        backing = streams.FilePathResource(ballots_path, encoding=ENCODING_BALLOT_FILE)
+        yield internal_ballots_resource(backing)
+
+
+class JsonCaseBallotsResource(streams.StreamResourceMixin):
+
+    """A read-only ballots resource for the ballots of a JSON test case.
+
+    The ballots are read incrementally with jsonlib.iter_json_items().
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def repr_info(self):
+        return "path=%r" % (self.path, )
+
+    @contextmanager
+    def reading(self):
+        with logged_open(self.path, "rb", compression=COMPRESSION_AUTO) as f:
+            items = jsonlib.iter_json_items(f, "ballots")
+            yield (parse_internal_ballot(item) for item in items)
+
+
+def read_json_case_info(path):
+    """Return the contest name and candidate count of a JSON test case.
+
+    The file is read incrementally, so the ballots are not loaded.
+    """
+    name = candidate_count = None
+    with logged_open(path, "rb", compression=COMPRESSION_AUTO) as f:
+        for prefix, event, value in jsonlib.iter_json_events(f):
+            if prefix == "_meta.name":
+                name = value
+            elif prefix == "candidate_count":
+                candidate_count = value
+    return name, candidate_count
+
+
+def _unquote_blt_contest(contest):
+    """Remove the quotes around the candidate names and title of a BLT contest."""
+    contest.candidates = [unquote_blt_text(name) for name in contest.candidates]
+    contest.name = unquote_blt_text(contest.name)
+    return contest
+
+
+@contextmanager
+def _open_blt(path, store):
+    if store is None:
+        # The ballots are staged to a temporary internal ballot file.
+        with read_blt_contest(path) as contest:
+            yield _unquote_blt_contest(contest)
+        return
+    parser = ChunkedBLTParser(ballots_resource=store)
+    with logged_open(path, "rb", compression=COMPRESSION_AUTO) as f:
+        contest = parser.parse_file(f)
+    contest.ballots_resource = store
+    yield _unquote_blt_contest(contest)
+
+
+@contextmanager
+def _open_csv(path, store):
+    reader = CSVRanksReader()
+    # The candidates are only known after reading, so stage the ballots.
+    with _staging_resource(store) as staging:
+        reader.read_path(path, staging)
+        yield ContestInput(candidates=reader.candidates, ballots_resource=staging)
+
+
+@contextmanager
+def _open_internal(path, store):
+    resource = streams.FilePathResource(path, encoding=ENCODING_BALLOT_FILE,
+                                        compression=COMPRESSION_AUTO)
+    yield _make_contest(internal_ballots_resource(resource))
+
+
+@contextmanager
+def _open_binary(path, store):
+    resource = BinaryBallotsResource(path)
+    header = resource.read_header()
+    yield _make_contest(resource, candidate_count=header.candidate_count)
+
+
+@contextmanager
+def _open_npz(path, store):
+    resource = NpzBallotsResource(path)
+    with resource.reading_arrays() as arrays:
+        choices = arrays['choices']
+        candidate_count = int(choices.max()) if len(choices) else 0
+    yield _make_contest(resource, candidate_count=candidate_count)
+
+
+@contextmanager
+def _open_json_case(path, store):
+    name, candidate_count = read_json_case_info(path)
+    yield _make_contest(JsonCaseBallotsResource(path), candidate_count=candidate_count,
+                        name=name)
+
+
+_OPENERS = {
+    INPUT_FORMAT_BINARY: _open_binary,
+    INPUT_FORMAT_BLT: _open_blt,
+    INPUT_FORMAT_CSV: _open_csv,
+    INPUT_FORMAT_INTERNAL: _open_internal,
+    INPUT_FORMAT_NPZ: _open_npz,
+    INPUT_FORMAT_TEST: _open_json_case,
+}
+
+INPUT_FORMATS = sorted(_OPENERS)
+
+
+@contextmanager
+def open_contest(path, input_format=None, normalize=False):
+    """Return a context manager that yields a ContestInput for a file.
+
+    The contest's ballots resource reads the ballots from disk.
+    Temporary files are deleted on exit.
+
+    Arguments:
+      input_format: one of INPUT_FORMATS.  Defaults to detecting the
+        format from the file extension.
+      normalize: whether to normalize the ballots.  The ballots are
+        normalized through a temporary SQLite database, so they need
+        not fit in memory.
+    """
+    if input_format is None:
+        input_format = detect_input_format(path)
+    try:
+        opener = _OPENERS[input_format]
+    except KeyError:
+        raise ValueError("unknown input format %r (choose from: %s)" %
+                         (input_format, ", ".join(INPUT_FORMATS)))
+    if not normalize:
+        with opener(path, None) as contest:
+            yield contest
+        return
+    with SQLiteBallotsResource.temp() as store:
+        with opener(path, store) as contest:
+            if contest.ballots_resource is not store:
+                with contest.ballots_resource.reading() as ballots:
+                    store.add_ballots(ballots)
+                contest.ballots_resource = store
+            yield contest
+
+
+class CountingResource(streams.WrapperResource):
+
+    """Wraps a ballots resource to count the ballots read.
+
+    Attributes:
+      ballot_count: the number of ballots in the last complete read.
+      total_weight: the total weight of the ballots in the last
+        complete read.
+    """
+
+    def __init__(self, resource):
+        super().__init__(resource)
+        self.ballot_count = 0
+        self.total_weight = 0
+
+    def _iter_counted(self, ballots):
+        ballot_count = 0
+        total_weight = 0
+        for ballot in ballots:
+            ballot_count += 1
+            total_weight += ballot[0]
+            yield ballot
+        self.ballot_count = ballot_count
+        self.total_weight = total_weight
+
+    @contextmanager
+    def reading(self):
+        with self.resource.reading() as ballots:
+            yield self._iter_counted(ballots)
+
+
+class ConversionStats(object):
+
+    def __init__(self, ballot_count, input_bytes, seconds, output_paths):
+        self.ballot_count = ballot_count
+        self.input_bytes = input_bytes
+        self.output_paths = output_paths
+        self.seconds = seconds
+
+    def summary(self):
+        seconds = self.seconds or 1e-9
+        return ("converted %d ballots (%.1f MB) in %.3f seconds: "
+                "%.0f ballots/s, %.1f MB/s" %
+                (self.ballot_count, self.input_bytes / (1 << 20), self.seconds,
+                 self.ballot_count / seconds, self.input_bytes / (1 << 20) / seconds))
+
+
+def _warn_dropped_rules(contest, format_cls):
+    """Log a warning if the output format cannot store the contest's rules."""
+    dropped = []
+    if contest.seat_count != 1:
+        dropped.append("seat count %d" % contest.seat_count)
+    if contest.withdrawn:
+        dropped.append("withdrawn candidates %s" % contest.withdrawn)
+    if dropped:
+        log.warning("%s does not store the %s: these are lost in the output" %
+                    (format_cls.__name__, " and ".join(dropped)))
+
+
+def convert_contest(input_path, format_cls, output_dir=None, input_format=None,
+                    normalize=False, stdout=None):
+    """Convert a ballot file to another format, and return a ConversionStats.
+
+    Arguments:
+      format_cls: the output Format class.
+      output_dir: the directory to write to.  Defaults to stdout.
+    """
+    start_time = timeit.default_timer()
+    with open_contest(input_path, input_format=input_format, normalize=normalize) as contest:
+        if not format_cls.stores_contest_rules:
+            _warn_dropped_rules(contest, format_cls)
+        counter = CountingResource(contest.ballots_resource)
+        contest.ballots_resource = counter
+        output_paths = format_cls().write_contest(contest, output_dir=output_dir,
+                                                  stdout=stdout)
+    seconds = timeit.default_timer() - start_time
+    stats = ConversionStats(ballot_count=counter.ballot_count,
+                            input_bytes=os.path.getsize(input_path), seconds=seconds,
+                            output_paths=output_paths)
+    log.info(stats.summary())
+    return stats
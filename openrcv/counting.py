@@ -22,9 +22,19 @@
 
 """Support for counting ballots."""
 
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, ExitStack
+from itertools import chain
 import logging
 import os
 import string
+from tempfile import TemporaryDirectory
+
+try:
+    import numpy
+except ImportError:
+    # NumPy is optional.  NumpyTabulator falls back to Tabulator without it.
+    numpy = None
 
 # This module should not import the module containing the JSON objects.
 # In particular, it should not use any of the JSON object classes.  There
@@ -34,14 +44,22 @@ import string
 # to any counting and not a prerequisite.
 # TODO: move some of the above comments to the module docstring.
 
-from openrcv import models
-from openrcv.formats.internal import parse_internal_ballot, to_internal_ballot
+from openrcv import models, streams
+from openrcv.formats.blt import read_blt_ballots_range, IndexedBLTBallotsResource, BLT_ENCODING
+from openrcv.formats.index import BallotIndex, FORMAT_BLT
+from openrcv.formats.internal import (get_internal_ballots_path, internal_ballots_resource,
+                                      parse_internal_ballot, read_internal_ballots_range,
+                                      to_internal_ballot, ENCODING_BALLOT_FILE)
 from openrcv.models import ContestResults, RoundResults
-from openrcv.parsing import BLTParser, Parser
+from openrcv.parsing import BLTParser, ChunkedBLTParser, Parser
+from openrcv.utils import logged_open, PathInfo, COMPRESSION_AUTO
 
 
 log = logging.getLogger(__name__)
 
+# Float sums of integer weights are exact below this bound.
+_MAX_EXACT_FLOAT_SUM = 2 ** 53
+
 
 def any_value(dict_):
     """Return any value in dict."""
@@ -89,24 +107,193 @@ def get_lowest(totals):
     return lowest_candidates
 
 
+def get_batch_lowest(totals):
+    """Return the largest set of candidates that can be eliminated at once.
+
+    This is the largest set of lowest candidates whose combined total is
+    less than the total of the next-higher candidate.  Eliminating such
+    a set is mathematically safe: even if every vote of the set transferred
+    to one of its members, that member would still be behind the
+    next-higher candidate, so eliminating the candidates one at a time
+    would eliminate the whole set before anyone else.
+
+    Returns the empty set if no such set exists (i.e. if the two lowest
+    candidates are tied).
+
+    Arguments:
+      totals: dict of candidate to vote total.
+    """
+    ordered = sorted(totals.values())
+    batch_size = 0
+    combined = 0
+    for i in range(len(ordered) - 1):
+        combined += ordered[i]
+        if combined < ordered[i + 1]:
+            batch_size = i + 1
+    if not batch_size:
+        return set()
+    highest_total = ordered[batch_size - 1]
+    return set(c for c, total in totals.items() if total <= highest_total)
+
+
+def make_stv_tabulator(contest, arithmetic=None):
+    """Return an STVTabulator for a multi-seat contest.
+
+    Arguments:
+      arithmetic: see stv.make_arithmetic().
+    """
+    # Imported here because the stv module imports this module.
+    from openrcv.stv import STVTabulator
+    return STVTabulator(contest, arithmetic=arithmetic)
+
+
 # TODO: remove this method.
-def count_irv_contest(contest):
-    """Tabulate a contest using IRV, and return a ContestResults object.
+def count_irv_contest(contest, batch_elimination=False, arithmetic=None):
+    """Tabulate a contest, and return a ContestResults object.
+
+    A contest with more than one seat is counted using STV, and any
+    other contest using IRV.
 
     Arguments:
       contest: a ContestInput object.
+      batch_elimination: whether to use batch elimination (IRV only).
+      arithmetic: the arithmetic to count STV with (see
+        stv.make_arithmetic()).
     """
     # TODO: handle case of 0 total (no winner, probably)?  And add a test case.
     # TODO: add tests for degenerate cases (0 candidates, 1 candidate, 0 votes, etc).
-    tabulator = Tabulator(contest)
+    if contest.seat_count > 1:
+        tabulator = make_stv_tabulator(contest, arithmetic=arithmetic)
+    else:
+        tabulator = Tabulator(contest, batch_elimination=batch_elimination)
+    return tabulator.count()
+
+
+@contextmanager
+def read_blt_contest(blt_path):
+    """Parse a BLT file, and yield a ContestInput object.
+
+    The ballots are converted to a temporary internal ballot file, which
+    is deleted on exit.
+
+    Arguments:
+      blt_path: path to a BLT file.
+    """
+    with TemporaryDirectory() as temp_dir:
+        ballots_path = os.path.join(temp_dir, "ballots.txt")
+        output_info = PathInfo(ballots_path, encoding=ENCODING_BALLOT_FILE)
+        parser = ChunkedBLTParser(output_info)
+        contest = parser.parse(PathInfo(blt_path, encoding=BLT_ENCODING,
+                                        compression=COMPRESSION_AUTO))
+        backing_resource = streams.FilePathResource(ballots_path, encoding=ENCODING_BALLOT_FILE)
+        contest.ballots_resource = internal_ballots_resource(backing_resource)
+        yield contest
+
+
+def read_blt_trie_contest(blt_path):
+    """Parse a BLT file, and return a ContestInput object.
+
+    The file is read once, and its ballots are aggregated directly into
+    an in-memory BallotTrie, which is the contest's ballots resource.
+
+    Arguments:
+      blt_path: path to a BLT file.
+    """
+    trie = models.BallotTrie()
+    parser = ChunkedBLTParser(ballots_resource=trie)
+    # Reading bytes skips decoding the ballot lines.
+    with logged_open(blt_path, "rb", compression=COMPRESSION_AUTO) as f:
+        contest = parser.parse_file(f)
+    contest.ballots_resource = trie
+    return contest
+
+
+def read_indexed_blt_contest(blt_path):
+    """Parse the header and trailer of an indexed BLT file.
+
+    Returns a ContestInput object whose ballots resource reads the
+    ballot lines of the BLT file on demand (see IndexedBLTBallotsResource),
+    or None if the file has no fresh index (see build_ballot_index()).
+
+    Arguments:
+      blt_path: path to a BLT file.
+    """
+    index = BallotIndex.load(blt_path, file_format=FORMAT_BLT)
+    if index is None:
+        return None
+    # The header lines end where the first ballot line starts.
+    start = index.offsets[0] if index.offsets else index.end
+    with logged_open(blt_path, "rb", compression=False) as f:
+        header = f.read(start).decode(BLT_ENCODING).splitlines()
+        f.seek(index.end)
+        trailer = f.read().decode(BLT_ENCODING).splitlines()
+    parser = BLTParser()
+    parser.info = models.ContestInput()
+    candidate_count, ballot_line = parser.parse_header(iter(header))
+    lines = iter(trailer)
+    # Skip the line that ends the ballots.
+    next(lines)
+    parser.parse_trailer(lines, candidate_count)
+    contest = parser.info
+    contest.ballot_count = index.ballot_count
+    contest.ballots_resource = IndexedBLTBallotsResource(blt_path, index)
+    return contest
+
+
+def count_blt_path(blt_path, jobs=None, arithmetic=None):
+    """Tabulate a BLT file, and return a ContestResults object.
+
+    The contest is counted using IRV, or using STV if the BLT file has
+    more than one seat.
+
+    The ballots are parsed straight into a BallotTrie (see
+    read_blt_trie_contest()), so no temporary files are written, and
+    each round is counted from the trie.
+
+    When counting IRV with more than one job, if the BLT file has a fresh
+    index, each worker process instead reads its own byte range of the
+    ballot lines (see read_indexed_blt_contest()).  STV is always
+    counted in a single process.
+
+    Arguments:
+      blt_path: path to a BLT file.
+      jobs: the number of worker processes to count with.  Defaults to 1.
+      arithmetic: the arithmetic to count STV with (see
+        stv.make_arithmetic()).
+    """
+    parallel = jobs is not None and jobs > 1
+    contest = read_indexed_blt_contest(blt_path) if parallel else None
+    if contest is None:
+        contest = read_blt_trie_contest(blt_path)
+    if contest.seat_count > 1:
+        tabulator = make_stv_tabulator(contest, arithmetic=arithmetic)
+    elif parallel:
+        tabulator = ParallelTabulator(contest, jobs=jobs)
+    else:
+        tabulator = Tabulator(contest)
     return tabulator.count()
 
 
+def count_irv(blt_path, jobs=None):
+    """Tabulate a BLT file using IRV, and return a ContestResults object.
+
+    This is the same as count_blt_path().
+    """
+    return count_blt_path(blt_path, jobs=jobs)
+
 
 class Tabulator(object):
 
-    def __init__(self, contest):
+    def __init__(self, contest, batch_elimination=False):
+        """
+        Arguments:
+          contest: a ContestInput object.
+          batch_elimination: whether to eliminate in each round the
+            largest set of candidates returned by get_batch_lowest().
+            Eliminated candidates are then recorded on each round.
+        """
         self.contest = contest
+        self.batch_elimination = batch_elimination
 
     def count_ballots(self, candidate_numbers):
         """Count one round, and return a RoundResults object.
@@ -114,11 +301,16 @@ class Tabulator(object):
         Arguments:
           candidate_numbers: a set of candidates eligible to receive votes.
         """
+        ballots_resource = self.contest.ballots_resource
+        if isinstance(ballots_resource, models.BallotTrie):
+            # Then walk the trie nodes instead of the individual ballots.
+            return ballots_resource.tabulate(candidate_numbers)
+
         totals = {}
         for candidate_number in candidate_numbers:
             totals[candidate_number] = 0
 
-        with self.contest.ballots_resource.reading() as ballots:
+        with ballots_resource.reading() as ballots:
             for weight, choices in ballots:
                 # TODO: replace with call to self.count_ballot().
                 for choice in choices:
@@ -131,7 +323,7 @@ class Tabulator(object):
     def count(self):
         contest = self.contest
         candidates_info = contest.make_candidates_info()
-        candidate_numbers = set(self.contest.get_candidate_numbers())
+        candidate_numbers = self.contest.get_running_numbers()
         outcome = models.ContestOutcome()
         rounds = []
         while True:
@@ -146,6 +338,12 @@ class Tabulator(object):
             if winner is not None:
                 round_results.elected = [winner]
                 break
+            if self.batch_elimination:
+                eliminated = get_batch_lowest(totals)
+                if eliminated:
+                    round_results.eliminated = sorted(eliminated)
+                    candidate_numbers -= eliminated
+                    continue
             last_place = get_lowest(totals)
             if len(last_place) > 1:
                 # Then there is a tie.
@@ -157,3 +355,500 @@ class Tabulator(object):
         outcome.last_round = len(rounds)
         results = ContestResults(outcome=outcome, rounds=rounds)
         return results
+
+
+class WinnerTabulator(Tabulator):
+
+    """A tabulator that only determines the winner.
+
+    Each round's scan of the ballots stops as soon as the round's outcome
+    is certain, namely once the leader holds a majority even if all of
+    the unscanned weight went to the other candidates, or once the
+    trailing candidate would remain in last place even if all of the
+    unscanned weight went to that candidate.  This requires the total
+    weight of the ballots to be known up front.
+
+    The winner is the same as with the Tabulator class, but the returned
+    results are partial: rounds that stopped early have no totals, and
+    the number of rounds can differ.
+    """
+
+    def __init__(self, contest, total_weight=None, check_interval=None, **kwargs):
+        """
+        Arguments:
+          total_weight: the total weight of the contest's ballots.  If
+            None, it is computed with one extra pass over the ballots.
+          check_interval: the number of ballots to scan between checks
+            for a certain outcome.  Defaults to 1000.
+        """
+        super().__init__(contest, **kwargs)
+        if check_interval is None:
+            check_interval = 1000
+        self.check_interval = check_interval
+        self.total_weight = total_weight
+
+    def get_total_weight(self):
+        ballots_resource = self.contest.ballots_resource
+        count_ballots = getattr(ballots_resource, 'count_ballots', None)
+        if count_ballots is not None:
+            return count_ballots()
+        with ballots_resource.reading() as ballots:
+            return sum(weight for weight, choices in ballots)
+
+    def get_decision(self, totals, remaining):
+        """Return the outcome of a round if it is already certain, or None.
+
+        The outcome is returned as an (elected, eliminated) pair, one of
+        which is None.
+
+        Arguments:
+          totals: the round's vote totals so far.
+          remaining: the weight of the ballots not yet scanned.
+        """
+        if not totals:
+            # Then there are no candidates left, so nothing is decided.
+            return None
+        ordered = sorted(totals.items(), key=lambda item: item[1])
+        leader, leader_total = ordered[-1]
+        if leader_total >= get_majority(sum(totals.values()) + remaining):
+            return [leader], None
+        if len(ordered) > 1:
+            trailing, trailing_total = ordered[0]
+            if trailing_total + remaining < ordered[1][1]:
+                if len(ordered) == 2:
+                    # Then the leader will end with more than half.
+                    return [leader], None
+                return None, [trailing]
+        return None
+
+    def scan_round(self, candidate_numbers):
+        """Count one round, stopping as soon as its outcome is certain.
+
+        Returns a (totals, decision) pair, where decision is the return
+        value of get_decision(), or None if the whole round was counted.
+
+        Arguments:
+          candidate_numbers: a set of candidates eligible to receive votes.
+        """
+        totals = {number: 0 for number in candidate_numbers}
+        remaining = self.total_weight
+        check_interval = self.check_interval
+        get_decision = self.get_decision
+        with self.contest.ballots_resource.reading() as ballots:
+            for i, (weight, choices) in enumerate(ballots, start=1):
+                remaining -= weight
+                for choice in choices:
+                    if choice in candidate_numbers:
+                        totals[choice] += weight
+                        break
+                if i % check_interval == 0:
+                    decision = get_decision(totals, remaining)
+                    if decision is not None:
+                        return totals, decision
+        return totals, None
+
+    def count(self):
+        if self.total_weight is None:
+            self.total_weight = self.get_total_weight()
+        candidates_info = self.contest.make_candidates_info()
+        candidate_numbers = self.contest.get_running_numbers()
+        outcome = models.ContestOutcome()
+        rounds = []
+        while True:
+            totals, decision = self.scan_round(candidate_numbers)
+            round_results = RoundResults(candidates_info=candidates_info)
+            rounds.append(round_results)
+            if decision is not None:
+                elected, eliminated = decision
+                if elected is not None:
+                    round_results.elected = elected
+                    break
+                round_results.eliminated = eliminated
+                candidate_numbers -= set(eliminated)
+                continue
+            # Otherwise, the round was counted to the end.
+            round_results.totals = totals
+            winner = get_winner(totals)
+            if winner is not None:
+                round_results.elected = [winner]
+                break
+            if self.batch_elimination:
+                eliminated = get_batch_lowest(totals)
+                if eliminated:
+                    round_results.eliminated = sorted(eliminated)
+                    candidate_numbers -= eliminated
+                    continue
+            last_place = get_lowest(totals)
+            if len(last_place) > 1:
+                # Then there is a tie.
+                outcome.tied_last_place = last_place
+                break
+            round_results.eliminated = sorted(last_place)
+            candidate_numbers -= last_place
+
+        outcome.elected = rounds[-1].elected
+        outcome.last_round = len(rounds)
+        return ContestResults(outcome=outcome, rounds=rounds, partial=True)
+
+
+def deal_to_piles(ballots, candidate_numbers, piles, totals):
+    """Place ballots on the piles of their top eligible choice.
+
+    Ballots with no remaining eligible choices are dropped.
+
+    Arguments:
+      ballots: an iterable of (weight, choices, start) 3-tuples, where
+        start is the index of the first choice to examine.
+      candidate_numbers: a set of candidates eligible to receive votes.
+      piles: a dict mapping each eligible candidate to a list of
+        (weight, choices, start) 3-tuples, where start is the index of
+        the choice after the one the ballot is counted for.
+      totals: a dict mapping each eligible candidate to the total
+        weight of its pile.
+    """
+    for weight, choices, start in ballots:
+        for index in range(start, len(choices)):
+            choice = choices[index]
+            if choice in candidate_numbers:
+                piles[choice].append((weight, choices, index + 1))
+                totals[choice] += weight
+                break
+
+
+class PileTabulator(Tabulator):
+
+    """A tabulator that reads the ballots only once.
+
+    In the first round, each ballot is placed on the "pile" of the first
+    candidate on the ballot who is eligible to receive votes.  In later
+    rounds, only the piles of the newly eliminated candidates are
+    examined.  Each ballot on such a pile resumes from the choice after
+    the one it was counted for, so the total work grows with the number
+    of choices read rather than with the number of rounds times the
+    number of ballots.
+
+    The results are identical to those of the Tabulator class.
+    """
+
+    def __init__(self, contest, **kwargs):
+        super().__init__(contest, **kwargs)
+        self.reset()
+
+    def reset(self):
+        # A dict mapping candidate number to a list of (weight, choices,
+        # start) 3-tuples, where start is the index of the next choice to
+        # examine if the candidate is eliminated.
+        self.piles = None
+        self.totals = None
+        # The candidates eligible as of the last call to count_ballots().
+        self.candidate_numbers = None
+
+    def deal(self, ballots, candidate_numbers):
+        """Place ballots on the piles of their top eligible choice.
+
+        Ballots with no remaining eligible choices are exhausted and
+        are dropped.
+
+        Arguments:
+          ballots: an iterable of (weight, choices, start) 3-tuples, where
+            start is the index of the first choice to examine.
+          candidate_numbers: a set of candidates eligible to receive votes.
+        """
+        deal_to_piles(ballots, candidate_numbers, self.piles, self.totals)
+
+    def _start_piles(self, candidate_numbers):
+        self.piles = {number: [] for number in candidate_numbers}
+        self.totals = {number: 0 for number in candidate_numbers}
+        with self.contest.ballots_resource.reading() as ballots:
+            self.deal(((weight, choices, 0) for weight, choices in ballots),
+                      candidate_numbers)
+
+    def _transfer(self, removed, candidate_numbers):
+        """Move the piles of the removed candidates."""
+        for number in removed:
+            pile = self.piles.pop(number)
+            del self.totals[number]
+            self.deal(pile, candidate_numbers)
+
+    def count_ballots(self, candidate_numbers):
+        """Count one round, and return a dict of vote totals.
+
+        Arguments:
+          candidate_numbers: a set of candidates eligible to receive votes.
+        """
+        previous = self.candidate_numbers
+        if previous is None or not previous >= candidate_numbers:
+            # Piles can only shrink, so start over if a candidate was added.
+            self._start_piles(candidate_numbers)
+        else:
+            self._transfer(previous - candidate_numbers, candidate_numbers)
+        # Make a copy since the caller can modify the set in place.
+        self.candidate_numbers = set(candidate_numbers)
+        return dict(self.totals)
+
+    def count(self):
+        self.reset()
+        return super().count()
+
+
+class NumpyTabulator(Tabulator):
+
+    """A tabulator that counts rounds using NumPy array operations.
+
+    The ballots are loaded once into a 2-D integer matrix of choices
+    (padded with zeros) and a vector of weights.  Each round, the first
+    eligible choice of every ballot whose current choice was eliminated
+    is found with array operations, and the totals are computed with a
+    weighted bincount.
+
+    If NumPy is not installed, this class counts the same way as the
+    Tabulator class.  The results are identical in either case.
+    """
+
+    def __init__(self, contest, **kwargs):
+        super().__init__(contest, **kwargs)
+        if numpy is None:
+            log.warning("NumPy is not installed: counting without it")
+        self.reset()
+
+    def reset(self):
+        self.choices = None
+        self.weights = None
+        # The choice currently counted for each ballot (0 if exhausted).
+        self.tops = None
+        self.candidate_numbers = None
+
+    def _read_arrays(self):
+        """Return the ballots as (weights, lengths, flat) arrays."""
+        ballots_resource = self.contest.ballots_resource
+        reading_arrays = getattr(ballots_resource, 'reading_arrays', None)
+        if reading_arrays is not None:
+            # Then the ballots are already arrays (e.g. an npz file).
+            with reading_arrays() as arrays:
+                weights = numpy.array(arrays['weights'], dtype=numpy.int64)
+                lengths = numpy.diff(arrays['offsets']).astype(numpy.intp)
+                flat = numpy.array(arrays['choices'], dtype=numpy.int64)
+            return weights, lengths, flat
+        weights = []
+        rankings = []
+        with ballots_resource.reading() as ballots:
+            for weight, choices in ballots:
+                weights.append(weight)
+                rankings.append(choices)
+        lengths = numpy.fromiter((len(choices) for choices in rankings),
+                                 dtype=numpy.intp, count=len(rankings))
+        flat = numpy.fromiter(chain.from_iterable(rankings), dtype=numpy.int64,
+                              count=int(lengths.sum()))
+        return numpy.array(weights, dtype=numpy.int64), lengths, flat
+
+    def load(self):
+        """Read the ballots into a matrix of choices and a weight vector."""
+        weights, lengths, flat = self._read_arrays()
+        ballot_count = len(weights)
+        width = int(lengths.max()) if len(lengths) else 0
+        # Use the smallest integer type that holds the choices.
+        max_choice = max(int(flat.max()) if len(flat) else 0,
+                         len(self.contest.candidates))
+        dtype = numpy.min_scalar_type(max_choice)
+        matrix = numpy.zeros((ballot_count, width), dtype=dtype)
+        # Scatter the flattened choices into their (row, column) positions.
+        rows = numpy.repeat(numpy.arange(ballot_count), lengths)
+        starts = numpy.cumsum(lengths) - lengths
+        columns = numpy.arange(len(flat)) - numpy.repeat(starts, lengths)
+        matrix[rows, columns] = flat
+
+        self.choices = matrix
+        self.weights = weights
+        self.tops = numpy.zeros(ballot_count, dtype=dtype)
+        self.eligible_size = max_choice + 1
+        self.exact_floats = int(weights.sum()) < _MAX_EXACT_FLOAT_SUM
+
+    def _advance(self, rows, eligible):
+        """Set the current choice of the given ballots."""
+        if not len(rows):
+            return
+        sub_matrix = self.choices[rows]
+        mask = eligible[sub_matrix]
+        first = mask.argmax(axis=1)
+        tops = sub_matrix[numpy.arange(len(rows)), first]
+        # Ballots without an eligible choice are exhausted.
+        tops[~mask.any(axis=1)] = 0
+        self.tops[rows] = tops
+
+    def _make_eligible(self, candidate_numbers):
+        eligible = numpy.zeros(self.eligible_size, dtype=bool)
+        numbers = [n for n in candidate_numbers if 0 < n < self.eligible_size]
+        eligible[numbers] = True
+        return eligible
+
+    def count_ballots(self, candidate_numbers):
+        """Count one round, and return a dict of vote totals.
+
+        Arguments:
+          candidate_numbers: a set of candidates eligible to receive votes.
+        """
+        if numpy is None:
+            return super().count_ballots(candidate_numbers)
+        if self.choices is None:
+            self.load()
+        eligible = self._make_eligible(candidate_numbers)
+
+        previous = self.candidate_numbers
+        if previous is None or not previous >= candidate_numbers:
+            rows = numpy.arange(len(self.tops))
+        else:
+            # Only ballots whose choice was just eliminated need to move.
+            tops = self.tops
+            rows = numpy.flatnonzero((tops != 0) & ~eligible[tops])
+        self._advance(rows, eligible)
+        self.candidate_numbers = set(candidate_numbers)
+
+        size = self.eligible_size
+        if self.exact_floats:
+            sums = numpy.bincount(self.tops, weights=self.weights, minlength=size)
+        else:
+            sums = numpy.zeros(size, dtype=numpy.int64)
+            numpy.add.at(sums, self.tops, self.weights)
+        return {number: int(sums[number]) if number < size else 0
+                for number in candidate_numbers}
+
+    def count(self):
+        self.reset()
+        return super().count()
+
+
+# The shard of ballots loaded by the current worker process.
+_worker_shard = None
+
+
+def _init_worker(shard):
+    """Load a shard in a worker process (a ProcessPoolExecutor initializer)."""
+    global _worker_shard
+    shard.load()
+    _worker_shard = shard
+
+
+def _count_worker_shard(eliminated):
+    """Count one round of the worker process's shard, and return the totals.
+
+    Arguments:
+      eliminated: a frozenset of the candidates no longer eligible.
+    """
+    shard = _worker_shard
+    return shard.tabulator.count_ballots(shard.candidate_numbers - eliminated)
+
+
+class _Shard(object):
+
+    """The part of the ballots counted by one worker process.
+
+    A shard is either a byte range of a ballot file or a list of ballots.
+    """
+
+    def __init__(self, candidate_count, ballots=None, path=None, byte_range=None,
+                 read_range=None):
+        """
+        Arguments:
+          read_range: a function that accepts a path and byte range, and
+            returns a list of ballots.  Defaults to
+            read_internal_ballots_range().
+        """
+        if read_range is None:
+            read_range = read_internal_ballots_range
+        self.ballots = ballots
+        self.byte_range = byte_range
+        self.candidate_count = candidate_count
+        self.path = path
+        self.read_range = read_range
+
+    def load(self):
+        if self.path is not None:
+            start, end = self.byte_range
+            ballots = self.read_range(self.path, start, end)
+        else:
+            ballots = self.ballots
+        contest = models.ContestInput(ballots_resource=streams.ListResource(ballots))
+        self.candidate_numbers = frozenset(models.make_candidate_numbers(self.candidate_count))
+        self.tabulator = PileTabulator(contest)
+
+
+class ParallelTabulator(Tabulator):
+
+    """A tabulator that counts shards of the ballots in worker processes.
+
+    Each shard is loaded once by its own worker process, which keeps the
+    ballots on piles between rounds (see PileTabulator).  Each round, the
+    master process sends every worker only the set of eliminated
+    candidates, and receives back only the shard's vote totals, which it
+    adds together.
+
+    If the ballots are backed by an internal ballot file or an indexed
+    BLT file, each worker reads its own line-aligned byte range of the
+    file.  Otherwise, the master process reads the ballots and deals them
+    out to the workers.
+    """
+
+    def __init__(self, contest, jobs=None, **kwargs):
+        """
+        Arguments:
+          jobs: the number of worker processes.  Defaults to the number
+            of CPUs.
+        """
+        super().__init__(contest, **kwargs)
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        self.jobs = jobs
+        self.executors = None
+
+    def make_shards(self):
+        """Return a list of _Shard objects."""
+        contest = self.contest
+        candidate_count = len(contest.candidates)
+        ballots_resource = contest.ballots_resource
+        path = get_internal_ballots_path(ballots_resource)
+        read_range = read_internal_ballots_range
+        if isinstance(ballots_resource, IndexedBLTBallotsResource):
+            path = ballots_resource.path
+            read_range = read_blt_ballots_range
+        if path is not None:
+            byte_ranges = ballots_resource.byte_ranges(self.jobs)
+            return [_Shard(candidate_count, path=path, byte_range=byte_range,
+                           read_range=read_range)
+                    for byte_range in byte_ranges]
+        ballot_lists = [[] for i in range(self.jobs)]
+        with ballots_resource.reading() as ballots:
+            for i, ballot in enumerate(ballots):
+                ballot_lists[i % self.jobs].append(ballot)
+        return [_Shard(candidate_count, ballots=ballots) for ballots in ballot_lists]
+
+    def count_ballots(self, candidate_numbers):
+        """Count one round, and return a dict of vote totals.
+
+        Arguments:
+          candidate_numbers: a set of candidates eligible to receive votes.
+        """
+        all_numbers = set(self.contest.get_candidate_numbers())
+        eliminated = frozenset(all_numbers - candidate_numbers)
+        futures = [executor.submit(_count_worker_shard, eliminated)
+                   for executor in self.executors]
+        totals = {number: 0 for number in candidate_numbers}
+        for future in futures:
+            for number, total in future.result().items():
+                totals[number] += total
+        return totals
+
+    def count(self):
+        shards = self.make_shards()
+        log.info("counting with %d worker process(es)" % len(shards))
+        with ExitStack() as stack:
+            # Each executor has exactly one worker process so that a
+            # shard stays loaded in the same process between rounds.
+            self.executors = [
+                stack.enter_context(ProcessPoolExecutor(max_workers=1,
+                                                        initializer=_init_worker,
+                                                        initargs=(shard, )))
+                for shard in shards]
+            try:
+                return super().count()
+            finally:
+                self.executors = None
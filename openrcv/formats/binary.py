@@ -0,0 +1,434 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+"""
+Support for reading and writing ballots in OpenRCV's binary format.
+
+Parsing the text formats costs about as much as counting, and the
+counting code may read the ballots once per round.  The binary format
+is cheaper to read.  A binary ballot file begins with a 24-byte header
+(all integers are little-endian):
+
+    bytes  0-3    magic number b"ORCB"
+    byte   4      format version (currently 1)
+    byte   5      size of each choice code in bytes (1 or 2)
+    bytes  6-7    candidate count (uint16)
+    bytes  8-15   ballot count, i.e. the number of records (uint64)
+    bytes 16-23   total weight of the ballots (uint64)
+
+Each ballot is then a record of the form--
+
+    WEIGHT  CHOICE_COUNT  CHOICE1 CHOICE2 ...
+
+where WEIGHT and CHOICE_COUNT are unsigned LEB128 varints, and each
+choice is a fixed-width unsigned integer (uint8 when there are fewer than
+256 candidates, and uint16 otherwise).
+
+"""
+
+from contextlib import contextmanager
+import logging
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+
+from openrcv.formats.common import Format, FormatWriter
+from openrcv import streams
+from openrcv.streams import FilePathResource, WRITE_BATCH_SIZE
+from openrcv.utils import get_compression, iter_batches, logged_open, COMPRESSION_AUTO
+
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"ORCB"
+VERSION = 1
+
+# The header structure (see the module docstring).
+HEADER = struct.Struct("<4sBBHQQ")
+
+MAX_CANDIDATE_COUNT = 0xFFFF
+
+
+class BinaryFormatError(ValueError):
+    pass
+
+
+def get_choice_size(candidate_count):
+    """Return the number of bytes needed for each choice code."""
+    if candidate_count > MAX_CANDIDATE_COUNT:
+        raise BinaryFormatError("too many candidates: %d" % candidate_count)
+    return 1 if candidate_count < 0x100 else 2
+
+
+def encode_varint(value):
+    """Return a nonnegative integer as an unsigned LEB128 varint."""
+    if value < 0:
+        raise BinaryFormatError("negative value: %r" % value)
+    data = bytearray()
+    while value >= 0x80:
+        data.append((value & 0x7F) | 0x80)
+        value >>= 7
+    data.append(value)
+    return bytes(data)
+
+
+def decode_varint(buf, pos):
+    """Decode a varint from a buffer, and return a (value, new_pos) pair."""
+    value = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode_ballot(ballot, choice_size):
+    """Return a ballot as a binary record."""
+    weight, choices = ballot
+    try:
+        if choice_size == 1:
+            choice_data = bytes(choices)
+        else:
+            choice_data = struct.pack("<%dH" % len(choices), *choices)
+    except (ValueError, struct.error):
+        raise BinaryFormatError("choices do not fit in %d byte(s): %r" %
+                                (choice_size, choices))
+    return encode_varint(weight) + encode_varint(len(choices)) + choice_data
+
+
+def make_header(candidate_count, ballot_count, total_weight, choice_size=None):
+    if choice_size is None:
+        choice_size = get_choice_size(candidate_count)
+    elif candidate_count > MAX_CANDIDATE_COUNT:
+        raise BinaryFormatError("too many candidates: %d" % candidate_count)
+    return HEADER.pack(MAGIC, VERSION, choice_size, candidate_count,
+                       ballot_count, total_weight)
+
+
+class BinaryHeader(object):
+
+    """The header of a binary ballot file."""
+
+    def __init__(self, choice_size, candidate_count, ballot_count, total_weight):
+        self.ballot_count = ballot_count
+        self.candidate_count = candidate_count
+        self.choice_size = choice_size
+        self.total_weight = total_weight
+
+    @classmethod
+    def parse(cls, data):
+        if len(data) < HEADER.size:
+            raise BinaryFormatError("file too short for header: %d bytes" % len(data))
+        magic, version, choice_size, candidate_count, ballot_count, total_weight = \
+            HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise BinaryFormatError("not a binary ballot file (magic number %r)" % magic)
+        if version != VERSION:
+            raise BinaryFormatError("unsupported binary format version: %d" % version)
+        if choice_size not in (1, 2):
+            raise BinaryFormatError("bad choice size: %d" % choice_size)
+        return cls(choice_size, candidate_count, ballot_count, total_weight)
+
+
+def iter_binary_records(buf, choice_size, raw=False):
+    """Return an iterator over the ballots in a binary ballot buffer.
+
+    Yields (weight, choices) pairs.  If raw is true, choices is a
+    memoryview of the record's choice codes instead of a tuple.
+
+    Arguments:
+      buf: a bytes-like object, starting with the header.
+      choice_size: the size of each choice code in bytes.
+    """
+    view = memoryview(buf)
+    pos = HEADER.size
+    end = len(view)
+    # Cache a Struct object for each choice count seen.
+    structs = {}
+    try:
+        while pos < end:
+            # Weights and choice counts are nearly always less than 128,
+            # so check for a one-byte varint before calling the function.
+            weight = view[pos]
+            if weight < 0x80:
+                pos += 1
+            else:
+                weight, pos = decode_varint(view, pos)
+            count = view[pos]
+            if count < 0x80:
+                pos += 1
+            else:
+                count, pos = decode_varint(view, pos)
+            stop = pos + count * choice_size
+            if stop > end:
+                raise BinaryFormatError("truncated record at byte %d" % pos)
+            if raw:
+                choices = view[pos:stop]
+            elif choice_size == 1:
+                choices = tuple(view[pos:stop])
+            else:
+                try:
+                    unpack_from = structs[count]
+                except KeyError:
+                    unpack_from = structs[count] = struct.Struct("<%dH" % count).unpack_from
+                choices = unpack_from(view, pos)
+            pos = stop
+            yield weight, choices
+    except IndexError:
+        raise BinaryFormatError("truncated record at byte %d" % pos)
+    finally:
+        view.release()
+
+
+class _BinaryWriter(object):
+
+    """Writes ballots to a seekable binary file, and then its header."""
+
+    def __init__(self, f, candidate_count=None):
+        self.ballot_count = 0
+        self.candidate_count = candidate_count
+        # Without a candidate count, allow the largest choice codes.
+        self.choice_size = 2 if candidate_count is None else get_choice_size(candidate_count)
+        self.file = f
+        self.max_choice = 0
+        self.total_weight = 0
+
+    def write_ballot(self, ballot):
+        weight, choices = ballot
+        self.file.write(encode_ballot(ballot, self.choice_size))
+        self.ballot_count += 1
+        self.total_weight += weight
+        if choices:
+            self.max_choice = max(self.max_choice, max(choices))
+
+    def write_ballots(self, ballots):
+        """Write a sequence of ballots with one write() call."""
+        choice_size = self.choice_size
+        max_choice = self.max_choice
+        total_weight = 0
+        records = []
+        for ballot in ballots:
+            weight, choices = ballot
+            records.append(encode_ballot(ballot, choice_size))
+            total_weight += weight
+            if choices:
+                max_choice = max(max_choice, max(choices))
+        self.file.write(b"".join(records))
+        self.ballot_count += len(records)
+        self.total_weight += total_weight
+        self.max_choice = max_choice
+
+    def write_header(self):
+        candidate_count = self.candidate_count
+        if candidate_count is None:
+            candidate_count = self.max_choice
+        self.file.write(make_header(candidate_count, self.ballot_count, self.total_weight,
+                                    choice_size=self.choice_size))
+
+
+@contextmanager
+def binary_writing(f, candidate_count=None, seekable=None):
+    """Return a context manager that yields a _BinaryWriter for a file.
+
+    A header with zero counts is written first, and then overwritten
+    with the real counts on exit.  If the file is not seekable (e.g.
+    stdout or a compressed file), the ballots are written to a temporary
+    file first and then copied to the file.
+
+    Arguments:
+      f: a binary file object.
+      candidate_count: the number of candidates.  Defaults to the
+        largest choice.
+      seekable: whether the file can be seeked back to the header.
+        Defaults to f.seekable().  Pass False for a compressed file.
+    """
+    if seekable is None:
+        seekable = f.seekable()
+    if not seekable:
+        with tempfile.TemporaryFile() as temp:
+            with binary_writing(temp, candidate_count, seekable=True) as writer:
+                yield writer
+            temp.seek(0)
+            shutil.copyfileobj(temp, f)
+        return
+    start = f.tell()
+    f.write(bytes(HEADER.size))
+    writer = _BinaryWriter(f, candidate_count=candidate_count)
+    yield writer
+    end = f.tell()
+    f.seek(start)
+    writer.write_header()
+    f.seek(end)
+
+
+def write_binary_ballots(f, ballots_resource, candidate_count=None, seekable=None):
+    """Write ballots in binary format to a binary file object.
+
+    The ballots are read once.  See binary_writing() for the arguments.
+    """
+    with binary_writing(f, candidate_count, seekable=seekable) as writer:
+        with ballots_resource.reading() as ballots:
+            for batch in iter_batches(ballots, WRITE_BATCH_SIZE):
+                writer.write_ballots(batch)
+
+
+class BinaryBallotsResource(streams.StreamResourceBase):
+
+    """A ballots resource backed by a binary ballot file.
+
+    The file is read through mmap, so reading does not copy the file
+    into memory, and the ballot count and total weight are available
+    from the header without reading the ballots.
+    """
+
+    def __init__(self, path, candidate_count=None, compression=None):
+        """
+        Arguments:
+          path: the path to the file.
+          candidate_count: the number of candidates, for writing.  If
+            None, choices are written as uint16 and the header records
+            the largest choice as the candidate count.
+          compression: the compression argument to utils.logged_open()
+            for writing.  Reading always detects the compression.
+        """
+        self.candidate_count = candidate_count
+        self.compression = compression
+        self.path = path
+
+    def repr_info(self):
+        return "path=%r" % (self.path, )
+
+    def read_header(self):
+        """Return a BinaryHeader object."""
+        with logged_open(self.path, "rb", compression=COMPRESSION_AUTO) as f:
+            data = f.read(HEADER.size)
+        return BinaryHeader.parse(data)
+
+    def count(self):
+        return self.read_header().ballot_count
+
+    def count_ballots(self):
+        return self.read_header().total_weight
+
+    @contextmanager
+    def _mapped(self):
+        if get_compression(self.path, compression=COMPRESSION_AUTO) is not None:
+            # Then the file cannot be memory-mapped, so decompress it
+            # into memory instead.
+            with logged_open(self.path, "rb", compression=COMPRESSION_AUTO) as f:
+                buf = f.read()
+            yield buf, BinaryHeader.parse(buf)
+            return
+        with logged_open(self.path, "rb", compression=False) as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # An empty file cannot be memory-mapped.
+                raise BinaryFormatError("empty binary ballot file: %s" % self.path)
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            header = BinaryHeader.parse(buf)
+            yield buf, header
+        finally:
+            try:
+                buf.close()
+            except BufferError:
+                # Then a raw view is still referenced, and the map is
+                # closed when the last view is garbage collected.
+                log.debug("mmap still exported: %s" % self.path)
+
+    @contextmanager
+    def open_read(self):
+        with self._mapped() as (buf, header):
+            gen = iter_binary_records(buf, header.choice_size)
+            try:
+                yield gen
+            finally:
+                gen.close()
+
+    @contextmanager
+    def reading_raw(self):
+        """Return a context manager that yields raw (weight, view) pairs.
+
+        Each view is a memoryview of the record's choice codes, as
+        little-endian integers of the header's choice_size.  The views
+        are only valid until the context manager exits.
+        """
+        with self._mapped() as (buf, header):
+            gen = iter_binary_records(buf, header.choice_size, raw=True)
+            try:
+                yield gen
+            finally:
+                gen.close()
+
+    @contextmanager
+    def open_write(self):
+        # A compressed file is not seekable.
+        seekable = get_compression(self.path, "wb", self.compression) is None
+        with logged_open(self.path, "wb", compression=self.compression) as f:
+            with binary_writing(f, self.candidate_count, seekable=seekable) as writer:
+                yield writer
+
+    def write(self, writer, ballot):
+        writer.write_ballot(ballot)
+
+    def write_batch(self, writer, ballots):
+        writer.write_ballots(ballots)
+
+
+class BinaryFormat(Format):
+
+    @property
+    def contest_writer_cls(self):
+        return BinaryContestWriter
+
+
+class BinaryContestWriter(FormatWriter):
+
+    @property
+    def get_output_infos(self):
+        return (self.get_output_info, )
+
+    def get_output_info(self, output_dir):
+        return os.path.join(output_dir, "ballots.bin"), None
+
+    def resource_write(self, resource, contest):
+        candidate_count = len(contest.candidates)
+        if isinstance(resource, FilePathResource):
+            # A compressed file is not seekable.
+            compression = resource.compression
+            seekable = get_compression(resource.path, "wb", compression) is None
+            with logged_open(resource.path, "wb", compression=compression) as f:
+                write_binary_ballots(f, contest.ballots_resource, candidate_count,
+                                     seekable=seekable)
+            return
+        # Otherwise, write to the underlying binary stream (e.g. stdout).
+        try:
+            f = resource.file.buffer
+        except AttributeError:
+            raise BinaryFormatError("cannot write binary ballots to a text stream: %r" %
+                                    resource)
+        write_binary_ballots(f, contest.ballots_resource, candidate_count)
+        f.flush()
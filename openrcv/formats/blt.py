@@ -40,20 +40,154 @@ Here is an example BLT file (taken from: https://code.google.com/p/droop/wiki/Bl
     "Donald"
     "Title"
 
+The second line lists the withdrawn candidates as negative integers.
+It is left out if no candidate withdrew.
+
 """
 
+from contextlib import contextmanager
+from itertools import islice
 import os
 
+from openrcv import models, streams
 from openrcv.formats.common import Format, FormatWriter
-from openrcv.utils import FileWriter
+from openrcv.streams import WRITE_BATCH_SIZE
+from openrcv.utils import iter_batches, logged_open, FileWriter
 
 
 BLT_ENCODING = 'utf-8'
 
 # TODO: move the code to parse BLT files here.
 
+
+def is_withdrawn_line(line):
+    """Return whether the second line of a BLT file lists withdrawn candidates.
+
+    The line is taken to be present if it starts with a negative integer
+    (or is blank), and otherwise the line is the first ballot line.
+
+    Arguments:
+      line: a str or bytes line.
+    """
+    line = line.strip()
+    return not line or line[:1] in ("-", b"-")
+
+
+def unquote_blt_text(text):
+    """Return a candidate name or title from a BLT file without its quotes.
+
+    The BLT parser leaves the quotes in place.
+    """
+    if len(text) >= 2 and text[0] == text[-1] == '"':
+        text = text[1:-1]
+    return text
+
+
+def iter_blt_ballots_range(path, start, end):
+    """Return an iterator over the BLT ballot lines in a byte range of a file.
+
+    Arguments:
+      path: path to an uncompressed BLT file.
+      start: the offset of the beginning of a ballot line.
+      end: the offset just after the end of a ballot line.
+    """
+    with logged_open(path, "rb", compression=False) as f:
+        f.seek(start)
+        offset = start
+        while offset < end:
+            line = f.readline()
+            if not line:
+                raise ValueError("BLT file ended at byte %d before byte %d: %s" %
+                                 (offset, end, path))
+            offset += len(line)
+            ints = tuple(map(int, line.split()))
+            yield ints[0], ints[1:-1]
+
+
+def read_blt_ballots_range(path, start, end):
+    """Parse the BLT ballot lines in a byte range of a file, and return a list.
+
+    See iter_blt_ballots_range().
+    """
+    return list(iter_blt_ballots_range(path, start, end))
+
+
+class IndexedBLTBallotsResource(streams.StreamResourceMixin, models.BallotsResourceMixin):
+
+    """A read-only ballots resource for the ballot lines of an indexed BLT file.
+
+    The ballots are read from the BLT file on demand.  The index (see
+    the openrcv.formats.index module) provides the ballot count and
+    total weight without reading the ballots, and splits the ballot
+    lines into byte ranges, e.g. for ParallelTabulator.
+    """
+
+    def __init__(self, path, index):
+        """
+        Arguments:
+          path: path to an uncompressed BLT file.
+          index: a fresh BallotIndex object for the file.
+        """
+        self.index = index
+        self.path = path
+
+    def repr_info(self):
+        return "path=%r" % self.path
+
+    def _iter_from(self, offset):
+        return iter_blt_ballots_range(self.path, offset, self.index.end)
+
+    @contextmanager
+    def reading(self):
+        index = self.index
+        gen = self._iter_from(index.offsets[0] if index.offsets else index.end)
+        try:
+            yield gen
+        finally:
+            gen.close()
+
+    @contextmanager
+    def reading_from(self, number):
+        """Return a context manager that yields the ballots from a ballot on.
+
+        This seeks to the nearest indexed ballot instead of reading the
+        ballots before it.
+
+        Arguments:
+          number: the 0-based number of the first ballot.
+        """
+        index = self.index
+        if number >= index.ballot_count:
+            yield iter(())
+            return
+        offset, skip = index.locate(number)
+        gen = self._iter_from(offset)
+        try:
+            yield islice(gen, skip, None)
+        finally:
+            gen.close()
+
+    @contextmanager
+    def writing(self):
+        raise TypeError("An indexed BLT ballots resource does not allow writing.")
+
+    def count(self):
+        return self.index.ballot_count
+
+    def count_ballots(self):
+        return self.index.total_weight
+
+    def byte_ranges(self, count):
+        """Split the ballot lines into at most count byte ranges.
+
+        See BallotIndex.byte_ranges().
+        """
+        return self.index.byte_ranges(count)
+
 class BLTFormat(Format):
 
+    stores_contest_rules = True
+
     @property
     def contest_writer_cls(self):
         return BLTContestWriter
@@ -87,14 +221,18 @@ class BLTFileWriter(FileWriter):
         seat_count = contest.seat_count
         assert seat_count is not None
         self.write_values([len(contest.candidates), seat_count])
+        if contest.withdrawn:
+            self.write_values([-1 * number for number in contest.withdrawn])
+        join = " ".join
         with contest.ballots_resource.reading() as ballots:
-            for ballot in ballots:
-                weight, choices = ballot
-                self.write_values([weight] + list(choices) + [0])
+            for batch in iter_batches(ballots, WRITE_BATCH_SIZE):
+                self.writelines(["%s %s 0\n" % (weight, join(map(str, choices))) if choices
+                                 else "%s 0\n" % weight for weight, choices in batch])
         self.write_values([0])
         for candidate in contest.candidates:
             self.write_text(candidate)
-        self.write_text(contest.name)
+        # A contest without a name gets an empty title.
+        self.write_text(contest.name or "")
 
     def write_contest(self, contest):
         """
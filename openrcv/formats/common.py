@@ -28,6 +28,9 @@ from openrcv.utils import NoImplementation
 
 class Format(object):
 
+    # Whether the format stores the seat count and withdrawn candidates.
+    stores_contest_rules = False
+
     def write_contest(self, contest, output_dir=None, stdout=None):
         """
         Arguments:
@@ -0,0 +1,311 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+"""
+Support for reading and writing ballots as CSV with one column per rank.
+
+This is the layout most vendors use to export ranked ballots, e.g.:
+
+    BallotID,Precinct,Rank 1,Rank 2,Rank 3
+    1,P1,Alice,Bob,
+    2,P2,Bob,overvote,Alice
+    3,P1,,Alice,undervote
+
+The cells of the rank columns are candidate names.  A cell can also be
+empty or an undervote marker (in which case the rank is skipped), or an
+overvote marker (in which case the rest of the ballot is ignored).  A
+candidate ranked more than once counts only at the highest rank.  An
+optional "Weight" column gives the weight of each row.
+
+For speed, choices are computed once per distinct combination of rank
+cells and cached, rather than looking up each cell of each row.
+
+"""
+
+import csv
+from io import StringIO
+from operator import itemgetter
+import os
+import re
+
+from openrcv.formats.common import Format, FormatWriter
+from openrcv.utils import logged_open, COMPRESSION_AUTO
+
+
+CSV_ENCODING = 'utf-8'
+
+# The buffer size to use when reading CSV files.
+READ_BUFFER_SIZE = 1 << 20
+
+# The number of rows to write at a time.
+WRITE_BATCH_SIZE = 10000
+
+# The maximum number of distinct rankings to cache when reading or writing.
+MAX_CACHED_RANKINGS = 1 << 16
+
+OVERVOTE_MARKERS = ("overvote", )
+UNDERVOTE_MARKERS = ("", "undervote", "skipped")
+
+WEIGHT_COLUMN = "Weight"
+
+_RANK_COLUMN_RE = re.compile(r"^\s*(?:rank|choice)\s*(\d+)\s*$", re.IGNORECASE)
+
+
+class CSVRanksFormatError(ValueError):
+    pass
+
+
+def get_rank_columns(header):
+    """Return the indices of the rank columns of a header, in rank order.
+
+    Rank columns are those named like "Rank 1" or "Choice 1".
+    """
+    ranks = []
+    for index, name in enumerate(header):
+        match = _RANK_COLUMN_RE.match(name)
+        if match:
+            ranks.append((int(match.group(1)), index))
+    return [index for rank, index in sorted(ranks)]
+
+
+class CSVRanksReader(object):
+
+    """
+    Reads ballots from a CSV file with one column per rank.
+
+    If no candidates are given, candidate names are numbered 1, 2, ...
+    in the order they are first seen.  Afterwards, the name of
+    candidate number i is candidates[i - 1].
+    """
+
+    def __init__(self, candidates=None, rank_columns=None, weight_column=None,
+                 overvote_markers=None, undervote_markers=None):
+        """
+        Arguments:
+          candidates: a list of the candidate names.  If given, other
+            names are an error.
+          rank_columns: the names of the rank columns, in rank order.
+            Defaults to the columns named like "Rank 1".
+          weight_column: the name of the weight column.  Defaults to a
+            column named "Weight" (if any), otherwise each row has
+            weight 1.
+          overvote_markers: the cell values (compared case-insensitively)
+            that mark an overvote.
+          undervote_markers: the cell values (compared case-insensitively)
+            that mark an undervote.
+        """
+        if overvote_markers is None:
+            overvote_markers = OVERVOTE_MARKERS
+        if undervote_markers is None:
+            undervote_markers = UNDERVOTE_MARKERS
+        self.candidates = [] if candidates is None else list(candidates)
+        self.fixed_candidates = candidates is not None
+        self.rank_columns = rank_columns
+        self.weight_column = weight_column
+        self.overvote_markers = set(m.lower() for m in overvote_markers)
+        self.undervote_markers = set(m.lower() for m in undervote_markers)
+        self.ballot_count = 0
+        self._candidate_numbers = {name: number for number, name in
+                                   enumerate(self.candidates, start=1)}
+
+    def _get_indices(self, header):
+        """Return the rank column indices and weight column index."""
+        def get_index(name):
+            try:
+                return header.index(name)
+            except ValueError:
+                raise CSVRanksFormatError("CSV has no column named %r: %r" % (name, header))
+
+        if self.rank_columns is None:
+            rank_indices = get_rank_columns(header)
+            if not rank_indices:
+                raise CSVRanksFormatError("CSV has no rank columns: %r" % (header, ))
+        else:
+            rank_indices = [get_index(name) for name in self.rank_columns]
+        if self.weight_column is not None:
+            weight_index = get_index(self.weight_column)
+        else:
+            lowered = [name.strip().lower() for name in header]
+            try:
+                weight_index = lowered.index(WEIGHT_COLUMN.lower())
+            except ValueError:
+                weight_index = None
+        return rank_indices, weight_index
+
+    def _get_number(self, name, line_number):
+        try:
+            return self._candidate_numbers[name]
+        except KeyError:
+            pass
+        if self.fixed_candidates:
+            raise CSVRanksFormatError("unknown candidate at line %d: %r" % (line_number, name))
+        self.candidates.append(name)
+        number = len(self.candidates)
+        self._candidate_numbers[name] = number
+        return number
+
+    def cells_to_choices(self, cells, line_number=None):
+        """Return the choices for the rank cells of a row."""
+        choices = []
+        for cell in cells:
+            name = cell.strip()
+            lowered = name.lower()
+            if lowered in self.undervote_markers:
+                continue
+            if lowered in self.overvote_markers:
+                break
+            number = self._get_number(name, line_number)
+            if number not in choices:
+                choices.append(number)
+        return tuple(choices)
+
+    def iter_ballots(self, f):
+        """Return an iterator over the (weight, choices) ballots of a file.
+
+        Arguments:
+          f: a text file object opened with newline="".
+        """
+        self.ballot_count = 0
+        reader = csv.reader(f)
+        try:
+            header = next(reader)
+        except StopIteration:
+            raise CSVRanksFormatError("CSV file is empty")
+        rank_indices, weight_index = self._get_indices(header)
+        if len(rank_indices) == 1:
+            index = rank_indices[0]
+            get_cells = lambda row: (row[index], )
+        else:
+            # itemgetter() returns a tuple, which serves as the cache key.
+            get_cells = itemgetter(*rank_indices)
+        cache = {}
+        cells_to_choices = self.cells_to_choices
+        weight = 1
+        # The row is None if the reader fails on the first data row.
+        row = None
+        try:
+            for row in reader:
+                if not row:
+                    continue
+                cells = get_cells(row)
+                try:
+                    choices = cache[cells]
+                except KeyError:
+                    if len(cache) >= MAX_CACHED_RANKINGS:
+                        cache.clear()
+                    choices = cache[cells] = cells_to_choices(cells, reader.line_num)
+                if weight_index is not None:
+                    weight = int(row[weight_index])
+                self.ballot_count += 1
+                yield weight, choices
+        except (IndexError, ValueError, csv.Error) as exc:
+            if isinstance(exc, CSVRanksFormatError):
+                raise
+            raise CSVRanksFormatError("error at line %d: %s: %r" % (reader.line_num, exc, row))
+
+    def read(self, f, ballots_resource):
+        """Write the ballots of a file to a ballots resource.
+
+        Returns the number of ballots written.
+        """
+        with ballots_resource.writing() as gen:
+            for ballot in self.iter_ballots(f):
+                gen.send(ballot)
+        return self.ballot_count
+
+    def read_path(self, path, ballots_resource, encoding=None):
+        """Write the ballots of a CSV file (possibly compressed) to a resource."""
+        if encoding is None:
+            encoding = CSV_ENCODING
+        with logged_open(path, "r", encoding=encoding, newline="",
+                         buffering=READ_BUFFER_SIZE, compression=COMPRESSION_AUTO) as f:
+            return self.read(f, ballots_resource)
+
+
+class CSVRanksFormat(Format):
+
+    @property
+    def contest_writer_cls(self):
+        return CSVRanksContestWriter
+
+
+class CSVRanksContestWriter(FormatWriter):
+
+    @property
+    def get_output_infos(self):
+        return (self.get_output_info, )
+
+    def get_output_info(self, output_dir):
+        return os.path.join(output_dir, "ballots.csv"), CSV_ENCODING
+
+    def resource_write(self, resource, contest):
+        with resource.writing() as gen:
+            write_csv_ranks(gen, contest)
+
+
+def write_csv_ranks(gen, contest, batch_size=None):
+    """Write the ballots of a contest as CSV, a batch of rows at a time.
+
+    There is one rank column per candidate.  Since the reader counts a
+    candidate ranked more than once only at the highest rank, a ballot
+    ranking a candidate more than once is an error rather than written
+    in a form that would not read back the same.
+
+    Arguments:
+      gen: a generator (e.g. from a resource's writing()) to send text to.
+      contest: a ContestInput object.
+    """
+    if batch_size is None:
+        batch_size = WRITE_BATCH_SIZE
+    names = contest.candidates
+    rank_count = len(names)
+    header = [WEIGHT_COLUMN] + ["Rank %d" % (rank, ) for rank in range(1, rank_count + 1)]
+    padding = [""] * rank_count
+    # A cache of the rank cells of each distinct ranking.
+    cells_cache = {}
+    buf = StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(header)
+    batch = []
+    with contest.ballots_resource.reading() as ballots:
+        for weight, choices in ballots:
+            try:
+                cells = cells_cache[choices]
+            except KeyError:
+                if len(cells_cache) >= MAX_CACHED_RANKINGS:
+                    cells_cache.clear()
+                if len(set(choices)) != len(choices):
+                    raise CSVRanksFormatError("ballot ranks a candidate more than once: %r" %
+                                              ((weight, choices), ))
+                if not all(1 <= choice <= rank_count for choice in choices):
+                    raise CSVRanksFormatError("ballot ranks an unknown candidate: %r" %
+                                              ((weight, choices), ))
+                cells = [names[choice - 1] for choice in choices]
+                cells = cells_cache[choices] = cells + padding[len(cells):]
+            batch.append([weight] + cells)
+            if len(batch) >= batch_size:
+                writer.writerows(batch)
+                batch = []
+                gen.send(buf.getvalue())
+                buf.seek(0)
+                buf.truncate()
+    writer.writerows(batch)
+    gen.send(buf.getvalue())
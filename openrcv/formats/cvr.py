@@ -0,0 +1,236 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+"""
+Support for reading ballots from cast-vote-record (CVR) JSON exports.
+
+Vendor CVR exports are single JSON documents that can be several GB in
+size, so they are read a session at a time with jsonlib.iter_json_items()
+rather than with json.load(), and ballots are emitted as they are parsed.
+
+The supported layout is that of Dominion's CVR_Export.json:
+
+    {"Sessions": [
+      {"Original": {"Cards": [
+         {"Contests": [
+            {"Id": 1,
+             "Marks": [{"CandidateId": 7, "Rank": 1, "IsAmbiguous": false},
+                       ...]},
+            ...]},
+         ...]},
+       "Modified": {...}},
+      ...]}
+
+Older exports without "Cards" (i.e. with "Contests" directly inside
+"Original") are also supported.  If a session has a "Modified" record
+(e.g. after adjudication), it is used instead of the "Original".
+
+"""
+
+import logging
+import time
+
+from openrcv import jsonlib
+
+
+log = logging.getLogger(__name__)
+
+# The number of bytes read between progress log messages.
+PROGRESS_INTERVAL = 64 << 20
+
+# The prefix of the array of sessions (i.e. ballots) in an export.
+SESSIONS_PREFIX = "Sessions"
+
+
+class CVRFormatError(ValueError):
+    pass
+
+
+class _ProgressReader(object):
+
+    """Wraps a file object to log read throughput."""
+
+    def __init__(self, f, interval=None):
+        if interval is None:
+            interval = PROGRESS_INTERVAL
+        self.f = f
+        self.interval = interval
+        self.bytes_read = 0
+        self.start_time = time.time()
+        self._next_report = interval
+
+    def elapsed(self):
+        return time.time() - self.start_time
+
+    def rate(self):
+        """Return the throughput in MB per second."""
+        elapsed = self.elapsed()
+        return self.bytes_read / (1 << 20) / elapsed if elapsed else 0.0
+
+    def read(self, size):
+        data = self.f.read(size)
+        self.bytes_read += len(data)
+        if self.bytes_read >= self._next_report:
+            log.info("CVR: read %.1f MB (%.1f MB/s)" %
+                     (self.bytes_read / (1 << 20), self.rate()))
+            self._next_report += self.interval
+        return data
+
+
+def marks_to_choices(marks):
+    """Return the choices of a ballot as a tuple of candidate numbers.
+
+    Ambiguous marks are ignored, as are repeat rankings of a candidate.
+    An overvote (more than one candidate at a rank) ends the ballot.
+
+    Arguments:
+      marks: an iterable of (rank, candidate) pairs.
+    """
+    by_rank = {}
+    for rank, candidate in marks:
+        by_rank.setdefault(rank, set()).add(candidate)
+    choices = []
+    for rank in sorted(by_rank):
+        candidates = by_rank[rank]
+        if len(candidates) > 1:
+            break
+        candidate = candidates.pop()
+        if candidate not in choices:
+            choices.append(candidate)
+    return tuple(choices)
+
+
+class CVRReader(object):
+
+    """
+    Reads the ballots of one contest from a CVR JSON export.
+
+    Candidate IDs are interned to the numbers 1, 2, ... in the order
+    they are first seen, so a ballot's choices are candidate numbers
+    like those of the other formats.  The original IDs are available
+    afterwards from the candidates attribute: the ID of candidate
+    number i is candidates[i - 1].
+
+    Memory use is constant in the size of the export: only the current
+    session is held in memory.  Parse throughput is logged.
+    """
+
+    def __init__(self, contest_id=None, chunk_size=None, progress_interval=None):
+        """
+        Arguments:
+          contest_id: the "Id" of the contest to read.  Defaults to the
+            only contest in the export (it is an error if the export
+            has more than one).
+          chunk_size: the number of bytes to read at a time.
+          progress_interval: the number of bytes read between progress
+            log messages.
+        """
+        self.contest_id = contest_id
+        self.chunk_size = chunk_size
+        self.progress_interval = progress_interval
+        self.candidates = []
+        self.ballot_count = 0
+        self._candidate_numbers = {}
+
+    def _intern_candidate(self, candidate_id):
+        try:
+            return self._candidate_numbers[candidate_id]
+        except KeyError:
+            pass
+        self.candidates.append(candidate_id)
+        number = len(self.candidates)
+        self._candidate_numbers[candidate_id] = number
+        return number
+
+    def _check_contest_id(self, contest_id):
+        """Return whether a contest should be read."""
+        if self.contest_id is None:
+            self.contest_id = contest_id
+            return True
+        if contest_id == self.contest_id:
+            return True
+        if self._single_contest:
+            raise CVRFormatError("CVR has more than one contest (%r and %r): "
+                                 "a contest ID must be given" %
+                                 (self.contest_id, contest_id))
+        return False
+
+    def _iter_contests(self, session):
+        """Return an iterator over the contests of a session to read."""
+        record = session.get("Modified") or session.get("Original")
+        if record is None:
+            return
+        cards = record.get("Cards")
+        if cards is None:
+            # Then the export predates cards.
+            cards = (record, )
+        for card in cards:
+            for contest in card.get("Contests", ()):
+                try:
+                    contest_id = contest["Id"]
+                except KeyError:
+                    raise CVRFormatError("contest is missing an Id (record %r)" %
+                                         session.get("RecordId"))
+                if self._check_contest_id(contest_id):
+                    yield contest
+
+    def _get_choices(self, contest):
+        intern_candidate = self._intern_candidate
+        try:
+            marks = [(mark["Rank"], intern_candidate(mark["CandidateId"]))
+                     for mark in contest.get("Marks", ()) if not mark.get("IsAmbiguous")]
+        except KeyError as exc:
+            raise CVRFormatError("mark is missing %s (contest %r)" % (exc, contest["Id"]))
+        return marks_to_choices(marks)
+
+    def iter_ballots(self, f):
+        """Return an iterator over the (weight, choices) ballots of a file.
+
+        Arguments:
+          f: a binary (or text) file object of the CVR export.
+        """
+        self._single_contest = self.contest_id is None
+        self.ballot_count = 0
+        reader = _ProgressReader(f, interval=self.progress_interval)
+        try:
+            sessions = jsonlib.iter_json_items(reader, SESSIONS_PREFIX,
+                                               chunk_size=self.chunk_size)
+            for session in sessions:
+                for contest in self._iter_contests(session):
+                    self.ballot_count += 1
+                    yield 1, self._get_choices(contest)
+        except jsonlib.JsonStreamError as exc:
+            raise CVRFormatError("error parsing CVR (after %d ballots): %s" %
+                                 (self.ballot_count, exc))
+        log.info("CVR: read %d ballots (%d candidates) from %.1f MB in %.2f seconds "
+                 "(%.1f MB/s)" % (self.ballot_count, len(self.candidates),
+                                  reader.bytes_read / (1 << 20), reader.elapsed(),
+                                  reader.rate()))
+
+    def read(self, f, ballots_resource):
+        """Write the ballots of a file to a ballots resource.
+
+        Returns the number of ballots written.
+        """
+        with ballots_resource.writing() as gen:
+            for ballot in self.iter_ballots(f):
+                gen.send(ballot)
+        return self.ballot_count
@@ -0,0 +1,250 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+"""
+Support for sidecar offset indexes of ballot files.
+
+An index is a JSON file written next to an internal or BLT ballot file,
+at the ballot file's path plus ".idx".  Every `interval` ballots, it
+records the byte offset of the ballot's line and the total weight of the
+ballots before it.  It also records the ballot count and total weight,
+so these are available without reading the ballots, and the size and
+modification time of the ballot file, so a stale index can be detected.
+
+The index of an internal ballot file is used by the file's ballots
+resource (see openrcv.formats.internal).  The index of a BLT file is
+used when counting with more than one job (see
+openrcv.counting.read_indexed_blt_contest()).
+
+"""
+
+from itertools import chain
+import logging
+import os
+
+from openrcv import jsonlib
+from openrcv.formats.blt import is_withdrawn_line
+from openrcv.utils import get_compression, logged_open, ReprMixin, COMPRESSION_AUTO
+
+
+log = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".idx"
+
+DEFAULT_INTERVAL = 10000
+
+FORMAT_BLT = 'blt'
+FORMAT_INTERNAL = 'internal'
+
+
+class BallotIndexError(ValueError):
+    pass
+
+
+def get_index_path(path):
+    """Return the path of the index of a ballot file."""
+    return path + INDEX_SUFFIX
+
+
+def _get_file_key(path):
+    """Return the (size, mtime_ns) of a file, for detecting changes."""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class BallotIndex(ReprMixin):
+
+    """An offset index of the ballot lines of a ballot file.
+
+    Attributes:
+      end: the byte offset just after the last ballot line.
+      offsets: a list of the byte offsets of ballots 0, interval,
+        2 * interval, etc.
+      weights: a list of the total weight of the ballots before each
+        ballot in offsets.
+    """
+
+    def __init__(self, file_format, size, mtime_ns, interval, ballot_count, total_weight,
+                 offsets, weights, end):
+        self.ballot_count = ballot_count
+        self.end = end
+        self.file_format = file_format
+        self.interval = interval
+        self.mtime_ns = mtime_ns
+        self.offsets = offsets
+        self.size = size
+        self.total_weight = total_weight
+        self.weights = weights
+
+    def repr_info(self):
+        return "format=%s, ballots=%d, interval=%d" % (self.file_format, self.ballot_count,
+                                                       self.interval)
+
+    def to_jsobj(self):
+        return {
+            '_meta': {'version': INDEX_VERSION},
+            'ballot_count': self.ballot_count,
+            'end': self.end,
+            'format': self.file_format,
+            'interval': self.interval,
+            'mtime_ns': self.mtime_ns,
+            'offsets': self.offsets,
+            'size': self.size,
+            'total_weight': self.total_weight,
+            'weights': self.weights,
+        }
+
+    @classmethod
+    def from_jsobj(cls, jsobj):
+        version = jsobj['_meta']['version']
+        if version != INDEX_VERSION:
+            raise BallotIndexError("unsupported index version: %r" % (version, ))
+        return cls(file_format=jsobj['format'], size=jsobj['size'],
+                   mtime_ns=jsobj['mtime_ns'], interval=jsobj['interval'],
+                   ballot_count=jsobj['ballot_count'], total_weight=jsobj['total_weight'],
+                   offsets=jsobj['offsets'], weights=jsobj['weights'], end=jsobj['end'])
+
+    def save(self, path):
+        """Write the index of the ballot file at path."""
+        index_path = get_index_path(path)
+        temp_path = index_path + ".tmp"
+        jsonlib.write_json(self.to_jsobj(), path=temp_path)
+        os.replace(temp_path, index_path)
+
+    @classmethod
+    def load(cls, path, file_format=None):
+        """Return the index of the ballot file at path, or None.
+
+        None is returned if there is no index, or if the index is stale
+        (i.e. the ballot file changed after the index was built) or is
+        for a different format or version.
+        """
+        index_path = get_index_path(path)
+        if not os.path.exists(index_path):
+            return None
+        try:
+            index = cls.from_jsobj(jsonlib.read_json_path(index_path))
+        except BallotIndexError as exc:
+            log.warning("ignoring index: %s: %s" % (exc, index_path))
+            return None
+        if not index.is_fresh(path):
+            log.warning("ignoring stale index: %s" % index_path)
+            return None
+        if file_format is not None and index.file_format != file_format:
+            return None
+        return index
+
+    def is_fresh(self, path):
+        """Return whether the index matches the current ballot file."""
+        return _get_file_key(path) == (self.size, self.mtime_ns)
+
+    def locate(self, number):
+        """Return the position of a ballot as an (offset, skip) pair.
+
+        The ballot is the skip-th ballot line starting at byte offset.
+
+        Arguments:
+          number: the 0-based number of the ballot.
+        """
+        if not 0 <= number < self.ballot_count:
+            raise BallotIndexError("ballot number out of range: %d" % number)
+        i, skip = divmod(number, self.interval)
+        return self.offsets[i], skip
+
+    def byte_ranges(self, count):
+        """Split the ballot lines into at most count byte ranges.
+
+        The ranges are split at indexed ballots, and have roughly equal
+        numbers of ballots.  Returns a list of (start, end) pairs like
+        FilePathResource.byte_ranges().
+        """
+        if not self.ballot_count:
+            return []
+        offsets = [self.offsets[0]]
+        last = len(self.offsets) - 1
+        for k in range(1, count):
+            # Round the target ballot number to the nearest indexed ballot.
+            i = ((2 * self.ballot_count * k + count * self.interval) //
+                 (2 * count * self.interval))
+            offset = self.offsets[min(i, last)]
+            if offset > offsets[-1]:
+                offsets.append(offset)
+        offsets.append(self.end)
+        return list(zip(offsets, offsets[1:]))
+
+
+def build_ballot_index(path, file_format=None, interval=None):
+    """Build and save the index of a ballot file, and return it.
+
+    Arguments:
+      path: the path to an uncompressed internal or BLT ballot file.
+      file_format: FORMAT_INTERNAL or FORMAT_BLT.  Defaults to FORMAT_BLT
+        if the path ends in ".blt", and FORMAT_INTERNAL otherwise.
+      interval: the number of ballots between indexed ballots.
+    """
+    if file_format is None:
+        file_format = FORMAT_BLT if path.lower().endswith(".blt") else FORMAT_INTERNAL
+    if interval is None:
+        interval = DEFAULT_INTERVAL
+    if get_compression(path, compression=COMPRESSION_AUTO) is not None:
+        raise BallotIndexError("cannot index a compressed file: %s" % path)
+    size, mtime_ns = _get_file_key(path)
+
+    offsets = []
+    weights = []
+    ballot_count = 0
+    total_weight = 0
+    offset = 0
+    with logged_open(path, "rb", compression=False) as f:
+        lines = f
+        if file_format == FORMAT_BLT:
+            # Skip the header lines.
+            offset += len(f.readline())
+            line = f.readline()
+            if is_withdrawn_line(line):
+                offset += len(line)
+            else:
+                lines = chain([line], f)
+        for line in lines:
+            try:
+                weight = int(line.split(None, 1)[0])
+            except (IndexError, ValueError):
+                raise BallotIndexError("invalid ballot line at byte %d of %s: %r" %
+                                       (offset, path, line))
+            if file_format == FORMAT_BLT and weight == 0:
+                # Then this line ends the ballots.
+                break
+            if ballot_count % interval == 0:
+                offsets.append(offset)
+                weights.append(total_weight)
+            ballot_count += 1
+            total_weight += weight
+            offset += len(line)
+
+    index = BallotIndex(file_format=file_format, size=size, mtime_ns=mtime_ns,
+                        interval=interval, ballot_count=ballot_count,
+                        total_weight=total_weight, offsets=offsets, weights=weights,
+                        end=offset)
+    index.save(path)
+    log.info("indexed %d ballots: %s" % (ballot_count, path))
+    return index
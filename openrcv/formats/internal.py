@@ -26,17 +26,31 @@ Support for parsing and writing files in OpenRCV's internal format.
 """
 
 from contextlib import contextmanager
+from itertools import islice
+import mmap
 import os
 
 from openrcv.formats.common import Format, FormatWriter
+from openrcv.formats.index import BallotIndex, FORMAT_INTERNAL
 from openrcv import models, streams
-from openrcv.streams import StreamResourceBase
-from openrcv.utils import join_values, parse_integer_line, FileWriter, NoImplementation
+from openrcv.streams import StreamResourceBase, WRITE_BATCH_SIZE
+from openrcv.utils import (iter_batches, join_values, logged_open, parse_integer_line,
+                           FileWriter, NoImplementation)
 
 
 # ASCII makes reading and parsing the file faster.
 ENCODING_BALLOT_FILE = 'ascii'
 
+# Encodings for which a ballot file can be parsed as bytes without decoding.
+_BYTES_ENCODINGS = frozenset(('ascii', 'utf-8', 'utf8', 'latin-1'))
+
+# The approximate number of bytes parsed at a time from a ballot file.
+PARSE_BLOCK_SIZE = 1 << 20
+
+
+class InternalFormatError(ValueError):
+    pass
+
 
 def to_internal_ballot(ballot):
     """Return the ballot as an internal ballot string."""
@@ -45,6 +59,16 @@ def to_internal_ballot(ballot):
     return join_values([weight] + list(choices))
 
 
+def to_internal_lines(ballots):
+    """Return a list of the ballots as internal ballot lines.
+
+    Each line includes its line ending.
+    """
+    join = " ".join
+    return ["%s %s\n" % (weight, join(map(str, choices))) if choices else "%s\n" % weight
+            for weight, choices in ballots]
+
+
 def parse_internal_ballot(line):
     """
     Parse an internal ballot line (with or without a trailing newline).
@@ -64,6 +88,135 @@ def parse_internal_ballot(line):
     return weight, choices
 
 
+def _parse_lines(lines):
+    """Parse a list of internal ballot lines as bytes, and return a list."""
+    distinct = set(lines)
+    if 2 * len(distinct) > len(lines):
+        return [(values[0], values[1:]) for values in
+                (tuple(map(int, line.split())) for line in lines)]
+    # Then the lines repeat a lot (as in an unnormalized ballot file),
+    # so parse each distinct line only once.
+    parsed = {}
+    for line in distinct:
+        values = tuple(map(int, line.split()))
+        parsed[line] = values[0], values[1:]
+    return [parsed[line] for line in lines]
+
+
+def _raise_line_error(lines, offset, source, line_number=None):
+    """Raise InternalFormatError for the first bad line in lines.
+
+    Arguments:
+      offset: the byte offset of the first line.
+      line_number: the line number of the first line, if known.
+    """
+    for line in lines:
+        try:
+            _parse_lines([line])
+        except (IndexError, ValueError):
+            location = "byte offset %d" % offset
+            if line_number is not None:
+                location = "line %d (%s)" % (line_number, location)
+            raise InternalFormatError("invalid internal ballot at %s of %s: %r" %
+                                      (location, source, line))
+        offset += len(line) + 1
+        if line_number is not None:
+            line_number += 1
+
+
+def iter_internal_ballots_bytes(buf, start=0, end=None, source=None, first_line=1):
+    """Return an iterator over the internal ballots in a bytes-like buffer.
+
+    The buffer is parsed a block of lines at a time without decoding to
+    str, so this is much faster than reading the ballots line by line
+    through a ConvertingResource.  InternalFormatError is raised for a
+    bad line, with the line's number and byte offset.
+
+    Arguments:
+      buf: a bytes-like object supporting find() and slicing (e.g. bytes
+        or an mmap).
+      start: the offset of the beginning of a line.
+      end: the offset just after the end of a line.  Defaults to the
+        length of the buffer.
+      source: the source of the buffer (for display purposes).
+      first_line: the line number of the line at start, or None if
+        not known.
+    """
+    if end is None:
+        end = len(buf)
+    line_number = first_line
+    while start < end:
+        block_end = end
+        if start + PARSE_BLOCK_SIZE < end:
+            newline = buf.find(b"\n", start + PARSE_BLOCK_SIZE, end)
+            if newline >= 0:
+                block_end = newline + 1
+        lines = buf[start:block_end].split(b"\n")
+        if not lines[-1]:
+            # Then the block ends with a newline.
+            lines.pop()
+        try:
+            ballots = _parse_lines(lines)
+        except (IndexError, ValueError):
+            _raise_line_error(lines, start, source, line_number=line_number)
+            raise
+        yield from ballots
+        if line_number is not None:
+            line_number += len(lines)
+        start = block_end
+
+
+@contextmanager
+def mapped_internal_ballots(path, start=0, end=None):
+    """Return a context manager that yields an iterator over the ballots.
+
+    The file is memory-mapped, and the ballots are parsed with
+    iter_internal_ballots_bytes().
+
+    Arguments:
+      path: path to an uncompressed internal ballot file.
+      start: see iter_internal_ballots_bytes().
+      end: see iter_internal_ballots_bytes().
+    """
+    with logged_open(path, "rb", compression=False) as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # An empty file cannot be memory-mapped.
+            yield iter(())
+            return
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    first_line = 1 if start == 0 else None
+    gen = iter_internal_ballots_bytes(buf, start=start, end=end, source=path,
+                                      first_line=first_line)
+    try:
+        yield gen
+    finally:
+        gen.close()
+        buf.close()
+
+
+def read_internal_ballots_range(path, start, end):
+    """Parse the internal ballots in a byte range of a file, and return a list.
+
+    Arguments:
+      path: path to an internal ballot file.
+      start: the offset of the beginning of a line.
+      end: the offset just after the end of a line (or the file size).
+    """
+    with mapped_internal_ballots(path, start=start, end=end) as ballots:
+        return list(ballots)
+
+
+def get_internal_ballots_path(ballots_resource):
+    """Return the path of a file-backed internal ballots resource, or None.
+
+    None is also returned if the file cannot be memory-mapped (e.g. if
+    it is compressed).
+    """
+    if not isinstance(ballots_resource, _InternalBallotsResource):
+        return None
+    return ballots_resource._get_mappable_path()
+
+
 def internal_ballots_resource(resource):
         """
         Arguments:
@@ -82,9 +235,83 @@ class _InternalBallotsConverter(streams.Converter):
         line = to_internal_ballot(item)
         return line + "\n"
 
+    def to_resource_many(self, items):
+        return to_internal_lines(items)
+
 
 class _InternalBallotsResource(streams.ConvertingResource, models.BallotsResourceMixin):
-    pass
+
+    def _get_mappable_path(self):
+        """Return the path of the backing file if it can be mapped as bytes."""
+        resource = self.resource
+        if (isinstance(resource, streams.FilePathResource) and
+            resource.encoding.lower() in _BYTES_ENCODINGS and
+            not resource.is_compressed()):
+            return resource.path
+        return None
+
+    def load_index(self):
+        """Return the sidecar index of the backing file, or None.
+
+        See the openrcv.formats.index module.
+        """
+        path = self._get_mappable_path()
+        if path is None:
+            return None
+        return BallotIndex.load(path, file_format=FORMAT_INTERNAL)
+
+    @contextmanager
+    def reading(self):
+        path = self._get_mappable_path()
+        if path is None:
+            with super().reading() as gen:
+                yield gen
+            return
+        with mapped_internal_ballots(path) as gen:
+            yield gen
+
+    @contextmanager
+    def reading_from(self, number):
+        """Return a context manager that yields the ballots from a ballot on.
+
+        With an index, this seeks to the nearest indexed ballot instead
+        of reading the ballots before it.
+
+        Arguments:
+          number: the 0-based number of the first ballot.
+        """
+        index = self.load_index()
+        if index is None or number >= index.ballot_count:
+            with self.reading() as gen:
+                yield islice(gen, number, None)
+            return
+        offset, skip = index.locate(number)
+        with mapped_internal_ballots(self._get_mappable_path(), start=offset) as gen:
+            yield islice(gen, skip, None)
+
+    def count(self):
+        index = self.load_index()
+        if index is None:
+            return super().count()
+        return index.ballot_count
+
+    def count_ballots(self):
+        index = self.load_index()
+        if index is not None:
+            return index.total_weight
+        with self.reading() as gen:
+            return sum(weight for weight, choices in gen)
+
+    def byte_ranges(self, count):
+        """Split the backing file into at most count line-aligned byte ranges.
+
+        See FilePathResource.byte_ranges().  With an index, this does not
+        read the file.
+        """
+        index = self.load_index()
+        if index is None:
+            return self.resource.byte_ranges(count)
+        return index.byte_ranges(count)
 
 
 class InternalFormat(Format):
@@ -114,8 +341,8 @@ class InternalBallotsWriter(FileWriter):
 
     def _write_ballots(self, contest):
         with contest.ballots_resource.reading() as ballots:
-            for ballot in ballots:
-                self.writeln(to_internal_ballot(ballot))
+            for batch in iter_batches(ballots, WRITE_BATCH_SIZE):
+                self.writelines(to_internal_lines(batch))
 
     def write_ballots(self, contest):
         """
@@ -42,8 +42,24 @@ class JsonCaseFormat(Format):
         return JsonCaseContestWriter
 
 
+class CompactJsonCaseFormat(JsonCaseFormat):
+
+    @property
+    def contest_writer_cls(self):
+        return CompactJsonCaseContestWriter
+
+
 class JsonCaseContestWriter(FormatWriter):
 
+    """Writes a contest as a JSON test case.
+
+    The ballots are streamed from the contest's ballots resource to the
+    output, so they are never all in memory.
+    """
+
+    # Whether to write compact (non-indented) JSON.
+    compact = False
+
     @property
     def get_output_infos(self):
         return (self.get_output_info, )
@@ -52,5 +68,11 @@ class JsonCaseContestWriter(FormatWriter):
         return os.path.join(output_dir, "contest.json"), ENCODING_JSON
 
     def resource_write(self, resource, contest):
-        jc_contest = JsonCaseContestInput.from_model(contest)
-        write_json(jc_contest, resource=resource)
+        with contest.ballots_resource.reading() as ballots:
+            jc_contest = JsonCaseContestInput.from_model_ballots(contest, ballots)
+            write_json(jc_contest, resource=resource, compact=self.compact)
+
+
+class CompactJsonCaseContestWriter(JsonCaseContestWriter):
+
+    compact = True
@@ -0,0 +1,383 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+"""
+Support for reading and writing ballots as NumPy arrays in a .npz file.
+
+The ballots are stored in compressed sparse row (CSR) layout as three
+arrays:
+
+    weights   the weight of each ballot (int64)
+    choices   the choices of all ballots, concatenated (the smallest
+              unsigned integer type that holds the candidate numbers)
+    offsets   the offset in choices of the choices of each ballot, plus
+              a final entry equal to the length of choices (int64)
+
+The choices of ballot i are thus choices[offsets[i]:offsets[i + 1]].
+
+The arrays are written to an uncompressed .npz file so that reading can
+memory-map them.  Writing streams the arrays to temporary files a block
+of ballots at a time, so it does not hold the ballots in memory.
+
+Note that numpy.load() ignores mmap_mode for .npz files, so the arrays
+are mapped directly from their offsets in the zip file.  Compressed .npz
+files (e.g. from numpy.savez_compressed()) can also be read, but are
+loaded into memory.
+
+NumPy is optional, but is required for this format.
+"""
+
+from contextlib import contextmanager
+import logging
+import os
+import struct
+import tempfile
+import zipfile
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from openrcv.formats.common import Format, FormatWriter
+from openrcv import streams
+from openrcv.streams import FilePathResource
+from openrcv.utils import iter_batches, logged_open
+
+
+log = logging.getLogger(__name__)
+
+ARRAY_NAMES = ('weights', 'choices', 'offsets')
+
+# The number of ballots converted to Python objects at a time when reading.
+READ_BLOCK_SIZE = 1 << 16
+
+# The number of ballots converted to arrays at a time when writing.
+WRITE_BLOCK_SIZE = 1 << 16
+
+# The fixed-size part of a zip file's local file header.
+_ZIP_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+
+
+class NpzFormatError(ValueError):
+    pass
+
+
+def _check_numpy():
+    if numpy is None:
+        raise NpzFormatError("the npz ballot format requires NumPy")
+
+
+def ballots_to_arrays(ballots, candidate_count=None):
+    """Return a dict of the CSR arrays of an iterable of ballots.
+
+    Arguments:
+      candidate_count: the number of candidates.  Defaults to the
+        largest choice.
+    """
+    _check_numpy()
+    weights = []
+    flat = []
+    offsets = [0]
+    for weight, choices in ballots:
+        weights.append(weight)
+        flat.extend(choices)
+        offsets.append(len(flat))
+    max_choice = max(flat) if flat else 0
+    if candidate_count is not None:
+        max_choice = max(max_choice, candidate_count)
+    return {
+        'weights': numpy.array(weights, dtype=numpy.int64),
+        'choices': numpy.array(flat, dtype=numpy.min_scalar_type(max_choice)),
+        'offsets': numpy.array(offsets, dtype=numpy.int64),
+    }
+
+
+def _map_member(path, f, info):
+    """Memory-map an uncompressed .npy member of a zip file."""
+    f.seek(info.header_offset)
+    fields = _ZIP_LOCAL_HEADER.unpack(f.read(_ZIP_LOCAL_HEADER.size))
+    name_length, extra_length = fields[-2:]
+    f.seek(info.header_offset + _ZIP_LOCAL_HEADER.size + name_length + extra_length)
+    version = numpy.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran_order, dtype = numpy.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran_order, dtype = numpy.lib.format.read_array_header_2_0(f)
+    if not all(shape):
+        # An empty array cannot be memory-mapped.
+        return numpy.zeros(shape, dtype=dtype)
+    order = 'F' if fortran_order else 'C'
+    return numpy.memmap(path, dtype=dtype, mode='r', shape=shape, order=order,
+                        offset=f.tell())
+
+
+def load_npz_arrays(path):
+    """Return a dict of the CSR arrays in a .npz file.
+
+    The arrays are memory-mapped if the file is uncompressed.
+    """
+    _check_numpy()
+    arrays = {}
+    with logged_open(path, "rb", compression=False) as f:
+        try:
+            zip_file = zipfile.ZipFile(f)
+        except zipfile.BadZipFile as exc:
+            raise NpzFormatError("not an npz file: %s: %s" % (path, exc))
+        with zip_file:
+            for name in ARRAY_NAMES:
+                try:
+                    info = zip_file.getinfo(name + ".npy")
+                except KeyError:
+                    raise NpzFormatError("array %r missing from npz file: %s" % (name, path))
+                if info.compress_type == zipfile.ZIP_STORED:
+                    arrays[name] = _map_member(path, f, info)
+                else:
+                    with zip_file.open(info) as member:
+                        arrays[name] = numpy.lib.format.read_array(member)
+    weights, offsets = arrays['weights'], arrays['offsets']
+    if len(offsets) != len(weights) + 1 or (len(offsets) and
+                                            offsets[-1] != len(arrays['choices'])):
+        raise NpzFormatError("inconsistent array lengths in npz file: %s" % path)
+    return arrays
+
+
+def iter_npz_ballots(weights, choices, offsets):
+    """Return an iterator over the ballots in CSR arrays.
+
+    The arrays are converted to Python objects a block at a time, so
+    memory-mapped arrays are read lazily.
+    """
+    for start in range(0, len(weights), READ_BLOCK_SIZE):
+        end = min(start + READ_BLOCK_SIZE, len(weights))
+        block_weights = weights[start:end].tolist()
+        block_offsets = offsets[start:end + 1].tolist()
+        base = block_offsets[0]
+        block_choices = choices[base:block_offsets[-1]].tolist()
+        for i, weight in enumerate(block_weights):
+            yield weight, tuple(block_choices[block_offsets[i] - base:
+                                              block_offsets[i + 1] - base])
+
+
+class _NpzWriter(object):
+
+    """Writes ballots to a .npz file of CSR arrays.
+
+    The ballots are converted to arrays a block at a time, and the raw
+    array data appended to a temporary file per array.  Since the
+    smallest choice type is only known at the end, choices are stored
+    as uint64 until then.
+    """
+
+    temp_dtypes = {'weights': 'int64', 'choices': 'uint64', 'offsets': 'int64'}
+
+    def __init__(self, candidate_count=None):
+        self.candidate_count = candidate_count
+        self.choice_count = 0
+        self.max_choice = 0
+        self.lengths = dict.fromkeys(ARRAY_NAMES, 0)
+        self.files = {name: tempfile.TemporaryFile() for name in ARRAY_NAMES}
+        self.values = {name: [] for name in ARRAY_NAMES}
+        self.values['offsets'].append(0)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+    def write_ballot(self, ballot):
+        self.write_ballots((ballot, ))
+
+    def write_ballots(self, ballots):
+        weights = self.values['weights']
+        flat = self.values['choices']
+        offsets = self.values['offsets']
+        choice_count = self.choice_count
+        for weight, choices in ballots:
+            weights.append(weight)
+            flat.extend(choices)
+            choice_count += len(choices)
+            offsets.append(choice_count)
+        self.choice_count = choice_count
+        if len(weights) >= WRITE_BLOCK_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Append the buffered values to the temporary files."""
+        for name, values in self.values.items():
+            if not values:
+                continue
+            array = numpy.array(values, dtype=self.temp_dtypes[name])
+            if name == 'choices':
+                self.max_choice = max(self.max_choice, int(array.max()))
+            self.files[name].write(array.tobytes())
+            self.lengths[name] += len(values)
+            values.clear()
+
+    def write_npz(self, f):
+        """Write the arrays to an uncompressed .npz file.
+
+        Arguments:
+          f: a binary file object, which need not be seekable.
+        """
+        self.flush()
+        max_choice = self.max_choice
+        if self.candidate_count is not None:
+            max_choice = max(max_choice, self.candidate_count)
+        dtypes = dict(self.temp_dtypes, choices=numpy.min_scalar_type(max_choice))
+        with zipfile.ZipFile(f, "w", compression=zipfile.ZIP_STORED) as zip_file:
+            for name in ARRAY_NAMES:
+                temp_dtype = numpy.dtype(self.temp_dtypes[name])
+                dtype = numpy.dtype(dtypes[name])
+                header = {'descr': numpy.lib.format.dtype_to_descr(dtype),
+                          'fortran_order': False, 'shape': (self.lengths[name], )}
+                temp = self.files[name]
+                temp.seek(0)
+                with zip_file.open(name + ".npy", "w", force_zip64=True) as member:
+                    numpy.lib.format.write_array_header_1_0(member, header)
+                    while True:
+                        data = temp.read(WRITE_BLOCK_SIZE * temp_dtype.itemsize)
+                        if not data:
+                            break
+                        array = numpy.frombuffer(data, dtype=temp_dtype)
+                        member.write(array.astype(dtype).tobytes())
+
+
+@contextmanager
+def npz_writing(f, candidate_count=None):
+    """Return a context manager that yields an _NpzWriter for a file.
+
+    The .npz file is written to f on exit.
+
+    Arguments:
+      f: a binary file object, which need not be seekable.
+      candidate_count: the number of candidates.  Defaults to the
+        largest choice.
+    """
+    _check_numpy()
+    writer = _NpzWriter(candidate_count=candidate_count)
+    try:
+        yield writer
+        writer.write_npz(f)
+    finally:
+        writer.close()
+
+
+def write_npz_ballots(f, ballots_resource, candidate_count=None):
+    """Write the ballots of a resource to an uncompressed .npz file.
+
+    The ballots are read once.  See npz_writing() for the arguments.
+    """
+    with npz_writing(f, candidate_count=candidate_count) as writer:
+        with ballots_resource.reading() as ballots:
+            for batch in iter_batches(ballots, WRITE_BLOCK_SIZE):
+                writer.write_ballots(batch)
+
+
+class NpzBallotsResource(streams.StreamResourceBase):
+
+    """A ballots resource backed by a .npz file of CSR arrays."""
+
+    def __init__(self, path, candidate_count=None):
+        """
+        Arguments:
+          path: the path to the file.
+          candidate_count: the number of candidates, for writing.
+        """
+        self.candidate_count = candidate_count
+        self.path = path
+
+    def repr_info(self):
+        return "path=%r" % (self.path, )
+
+    @contextmanager
+    def reading_arrays(self):
+        """Return a context manager that yields a dict of the CSR arrays.
+
+        The arrays are read-only, and should not be used after the context
+        manager exits.
+        """
+        arrays = load_npz_arrays(self.path)
+        try:
+            yield arrays
+        finally:
+            # Release the memory maps.
+            arrays.clear()
+
+    def count(self):
+        with self.reading_arrays() as arrays:
+            return len(arrays['weights'])
+
+    def count_ballots(self):
+        with self.reading_arrays() as arrays:
+            return int(arrays['weights'].sum())
+
+    @contextmanager
+    def open_read(self):
+        with self.reading_arrays() as arrays:
+            gen = iter_npz_ballots(arrays['weights'], arrays['choices'], arrays['offsets'])
+            try:
+                yield gen
+            finally:
+                gen.close()
+
+    @contextmanager
+    def open_write(self):
+        with logged_open(self.path, "wb", compression=False) as f:
+            with npz_writing(f, candidate_count=self.candidate_count) as writer:
+                yield writer
+
+    def write(self, writer, ballot):
+        writer.write_ballot(ballot)
+
+    def write_batch(self, writer, ballots):
+        writer.write_ballots(ballots)
+
+
+class NpzFormat(Format):
+
+    @property
+    def contest_writer_cls(self):
+        return NpzContestWriter
+
+
+class NpzContestWriter(FormatWriter):
+
+    @property
+    def get_output_infos(self):
+        return (self.get_output_info, )
+
+    def get_output_info(self, output_dir):
+        return os.path.join(output_dir, "ballots.npz"), None
+
+    def resource_write(self, resource, contest):
+        if isinstance(resource, FilePathResource):
+            with logged_open(resource.path, "wb", compression=False) as f:
+                write_npz_ballots(f, contest.ballots_resource, len(contest.candidates))
+            return
+        # Otherwise, write to the underlying binary stream (e.g. stdout),
+        # which need not be seekable.
+        try:
+            f = resource.file.buffer
+        except AttributeError:
+            raise NpzFormatError("cannot write npz ballots to a text stream: %r" % resource)
+        write_npz_ballots(f, contest.ballots_resource, len(contest.candidates))
+        f.flush()
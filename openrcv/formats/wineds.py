@@ -0,0 +1,391 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+"""
+Support for reading WinEDS ballot-image and master-lookup files.
+
+WinEDS (used e.g. by San Francisco) exports ranked-choice ballots as a
+"ballot image" file of fixed-width records, one record per rank of each
+ballot, for example:
+
+    000000200000149000000270020000120001000004300
+
+The fields of a ballot-image record are:
+
+    contest ID     7   the ID of the contest
+    voter ID       9   the ID of the ballot
+    serial number  7
+    tally type     3
+    precinct ID    7
+    vote rank      3   the rank of the record (1, 2, ...)
+    candidate ID   7   the ID of the candidate ranked (0 for none)
+    overvote       1   "1" if the rank is overvoted
+    undervote      1   "1" if the rank is blank
+
+The records of a ballot are consecutive.  The names of the candidates
+and contests are in a companion "master lookup" file of fixed-width
+records (see MasterLookup).
+
+Records are sliced straight out of blocks of bytes with struct, without
+decoding lines to str, and choices are computed once per distinct
+combination of rank records and cached.
+
+"""
+
+from collections import namedtuple, Counter
+from itertools import islice
+import logging
+import struct
+
+from openrcv.models import ContestInput
+from openrcv.utils import logged_open, COMPRESSION_AUTO
+
+
+log = logging.getLogger(__name__)
+
+MASTER_LOOKUP_ENCODING = 'latin-1'
+
+# The length of a ballot-image record, not counting the line ending.
+RECORD_LENGTH = 45
+
+# The number of records read at a time.
+READ_BLOCK_RECORDS = 1 << 15
+
+# The number of ballots aggregated at a time when reading into a resource.
+AGGREGATE_BATCH_SIZE = 1 << 16
+
+# The maximum number of distinct rankings to cache.
+MAX_CACHED_RANKINGS = 1 << 16
+
+# The contest and voter IDs (as one key), skipping the serial number,
+# tally type and precinct ID, followed by the rank, candidate ID,
+# overvote and undervote fields (as one "tail").
+_RECORD_FORMAT = "16s17x12s%dx"
+
+RECORD_TYPE_CANDIDATE = "Candidate"
+RECORD_TYPE_CONTEST = "Contest"
+
+# The (start, end) of the fields of a master-lookup record.
+_LOOKUP_FIELDS = (
+    ('record_type', 0, 10),
+    ('id', 10, 17),
+    ('description', 17, 67),
+    ('list_order', 67, 74),
+    ('contest_id', 74, 81),
+    ('is_writein', 81, 82),
+    ('is_provisional', 82, 83),
+)
+
+LookupCandidate = namedtuple('LookupCandidate',
+                             'id name contest_id list_order is_writein')
+
+
+class WinEDSFormatError(ValueError):
+    pass
+
+
+class MasterLookup(object):
+
+    """
+    The contents of a WinEDS master-lookup file.
+
+    The fields of a master-lookup record are: record type (10, e.g.
+    "Candidate" or "Contest"), ID (7), description (50), list order (7),
+    contest ID (7, for candidates), is write-in (1) and is provisional (1).
+
+    Attributes:
+      candidates: a dict mapping candidate ID to LookupCandidate.
+      contests: a dict mapping contest ID to contest name.
+    """
+
+    def __init__(self, candidates=None, contests=None):
+        if candidates is None:
+            candidates = {}
+        if contests is None:
+            contests = {}
+        self.candidates = candidates
+        self.contests = contests
+
+    @classmethod
+    def parse(cls, f):
+        """Parse a master-lookup file, and return a MasterLookup object.
+
+        Records of types other than candidates and contests (e.g.
+        precincts and tally types) are ignored.
+
+        Arguments:
+          f: a text file object.
+        """
+        lookup = cls()
+        for line_number, line in enumerate(f, start=1):
+            line = line.rstrip("\r\n")
+            if not line.strip():
+                continue
+            fields = {name: line[start:end].strip() for name, start, end in _LOOKUP_FIELDS}
+            record_type = fields['record_type']
+            if record_type not in (RECORD_TYPE_CANDIDATE, RECORD_TYPE_CONTEST):
+                continue
+            try:
+                record_id = int(fields['id'])
+                if record_type == RECORD_TYPE_CONTEST:
+                    lookup.contests[record_id] = fields['description']
+                    continue
+                candidate = LookupCandidate(id=record_id, name=fields['description'],
+                                            contest_id=int(fields['contest_id']),
+                                            list_order=int(fields['list_order']),
+                                            is_writein=fields['is_writein'] == "1")
+            except ValueError as exc:
+                raise WinEDSFormatError("invalid master lookup record at line %d: %s: %r" %
+                                        (line_number, exc, line))
+            lookup.candidates[record_id] = candidate
+        return lookup
+
+    @classmethod
+    def read_path(cls, path):
+        with logged_open(path, "r", encoding=MASTER_LOOKUP_ENCODING,
+                         compression=COMPRESSION_AUTO) as f:
+            return cls.parse(f)
+
+    def get_candidate_ids(self, contest_id):
+        """Return the IDs of the candidates in a contest, in list order."""
+        candidates = [c for c in self.candidates.values() if c.contest_id == contest_id]
+        candidates.sort(key=lambda c: (c.list_order, c.id))
+        return [c.id for c in candidates]
+
+
+class WinEDSReader(object):
+
+    """
+    Reads the ballots of one contest from a WinEDS ballot-image file.
+
+    Candidate IDs are converted to the numbers 1, 2, ... in the order of
+    candidate_ids, if given, and otherwise in the order they are first
+    seen.  Afterwards, the ID of candidate number i is candidates[i - 1].
+    """
+
+    def __init__(self, contest_id=None, candidate_ids=None):
+        """
+        Arguments:
+          contest_id: the ID of the contest to read.  Defaults to the
+            only contest in the file (it is an error if the file has
+            more than one).
+          candidate_ids: a list of the IDs of the candidates.  If given,
+            other IDs are an error.
+        """
+        self.contest_id = contest_id
+        self.candidates = [] if candidate_ids is None else list(candidate_ids)
+        self.fixed_candidates = candidate_ids is not None
+        self.ballot_count = 0
+        self._candidate_numbers = {candidate_id: number for number, candidate_id in
+                                   enumerate(self.candidates, start=1)}
+
+    def _get_number(self, candidate_id):
+        try:
+            return self._candidate_numbers[candidate_id]
+        except KeyError:
+            pass
+        if self.fixed_candidates:
+            raise WinEDSFormatError("unknown candidate ID: %d" % candidate_id)
+        self.candidates.append(candidate_id)
+        number = len(self.candidates)
+        self._candidate_numbers[candidate_id] = number
+        return number
+
+    def tails_to_choices(self, tails):
+        """Return the choices for the rank records of a ballot.
+
+        Blank ranks are skipped, and an overvoted rank ends the ballot.
+
+        Arguments:
+          tails: an iterable of the last 12 bytes of the records (i.e.
+            the rank, candidate ID, overvote and undervote fields).
+        """
+        choices = []
+        # The rank fields are zero-padded, so the bytes sort by rank.
+        for tail in sorted(tails):
+            if tail[10:11] == b"1":
+                break
+            try:
+                candidate_id = int(tail[3:10])
+            except ValueError:
+                raise WinEDSFormatError("invalid candidate ID: %r" % tail[3:10])
+            if tail[11:12] == b"1" or not candidate_id:
+                continue
+            number = self._get_number(candidate_id)
+            if number not in choices:
+                choices.append(number)
+        return tuple(choices)
+
+    def _iter_blocks(self, f):
+        """Yield blocks of bytes of whole records, and set self._struct."""
+        first = f.readline()
+        if not first:
+            return
+        line_ending = first[RECORD_LENGTH:]
+        if b"\n" in first[:RECORD_LENGTH] or line_ending not in (b"\n", b"\r\n", b""):
+            raise WinEDSFormatError("ballot-image records must be %d characters: %r" %
+                                    (RECORD_LENGTH, first))
+        if not line_ending:
+            # Then the file has one record and no final line ending.
+            line_ending = b"\n"
+            first += line_ending
+        self._struct = struct.Struct(_RECORD_FORMAT % len(line_ending))
+        size = self._struct.size
+        block = first + f.read(size * READ_BLOCK_RECORDS - len(first))
+        while block:
+            extra = len(block) % size
+            if extra:
+                block += f.read(size - extra)
+                extra = len(block) % size
+            if extra:
+                # Then the file ends with a partial record.
+                last = block[-extra:].rstrip(b"\r\n")
+                if len(last) == RECORD_LENGTH:
+                    block = block[:-extra] + last + line_ending
+                elif not last.strip():
+                    block = block[:-extra]
+                else:
+                    raise WinEDSFormatError("truncated ballot-image record at end of "
+                                            "file: %r" % last)
+            if block[-1:] != b"\n":
+                raise WinEDSFormatError("ballot-image records must be %d characters "
+                                        "(near: %r)" % (RECORD_LENGTH, block[-size:]))
+            yield block
+            block = f.read(size * READ_BLOCK_RECORDS)
+
+    def _iter_choices(self, f):
+        """Return an iterator over the choices of the ballots of a file."""
+        self.ballot_count = 0
+        contest_key = None
+        if self.contest_id is not None:
+            contest_key = ("%07d" % self.contest_id).encode('ascii')
+        single_contest = contest_key is None
+        cache = {}
+
+        def tails_to_choices(tails, line_no):
+            try:
+                return self.tails_to_choices(tails)
+            except WinEDSFormatError as exc:
+                raise WinEDSFormatError("invalid ballot starting at line %d: %s" %
+                                        (line_no, exc))
+
+        key = None
+        skipping = False
+        tails = []
+        # The line numbers of the last record read, and of the first
+        # record of the current ballot.
+        line_no = ballot_line_no = 0
+        for block in self._iter_blocks(f):
+            records = self._struct.iter_unpack(block)
+            for line_no, (record_key, tail) in enumerate(records, start=line_no + 1):
+                if record_key == key:
+                    if not skipping:
+                        tails.append(tail)
+                    continue
+                if tails:
+                    ranking = tuple(tails)
+                    try:
+                        choices = cache[ranking]
+                    except KeyError:
+                        if len(cache) >= MAX_CACHED_RANKINGS:
+                            cache.clear()
+                        choices = cache[ranking] = tails_to_choices(ranking, ballot_line_no)
+                    self.ballot_count += 1
+                    yield choices
+                    tails = []
+                key = record_key
+                ballot_line_no = line_no
+                record_contest = record_key[:7]
+                if contest_key is None:
+                    contest_key = record_contest
+                skipping = record_contest != contest_key
+                if not skipping:
+                    tails.append(tail)
+                elif single_contest:
+                    raise WinEDSFormatError("ballot image has more than one contest "
+                                            "(%s and %s): a contest ID must be given" %
+                                            (contest_key.decode(), record_contest.decode()))
+        if tails:
+            self.ballot_count += 1
+            yield tails_to_choices(tails, ballot_line_no)
+        if contest_key is not None:
+            self.contest_id = int(contest_key)
+
+    def iter_ballots(self, f):
+        """Return an iterator over the (weight, choices) ballots of a file.
+
+        Arguments:
+          f: a binary file object of the ballot-image file.
+        """
+        for choices in self._iter_choices(f):
+            yield 1, choices
+
+    def read(self, f, ballots_resource):
+        """Write the ballots of a file to a ballots resource.
+
+        Identical ballots are aggregated (a batch at a time) into ballots
+        with a larger weight.  Returns the number of ballots read.
+        """
+        choices_iter = self._iter_choices(f)
+        with ballots_resource.writing() as gen:
+            while True:
+                counts = Counter(islice(choices_iter, AGGREGATE_BATCH_SIZE))
+                if not counts:
+                    break
+                for choices, weight in counts.items():
+                    gen.send((weight, choices))
+        return self.ballot_count
+
+    def read_path(self, path, ballots_resource):
+        """Write the ballots of a ballot-image file to a ballots resource."""
+        with logged_open(path, "rb", compression=COMPRESSION_AUTO) as f:
+            count = self.read(f, ballots_resource)
+        log.info("read %d WinEDS ballots: %s" % (count, path))
+        return count
+
+
+def read_wineds_contest(ballots_path, lookup_path, ballots_resource, contest_id=None):
+    """Read a WinEDS contest, and return a ContestInput object.
+
+    Arguments:
+      ballots_path: the path to the ballot-image file.
+      lookup_path: the path to the master-lookup file.
+      ballots_resource: the ballots resource to write the ballots to
+        (e.g. a BallotTrie).
+      contest_id: the ID of the contest.  Defaults to the only contest
+        in the master lookup or ballot-image file.
+    """
+    lookup = MasterLookup.read_path(lookup_path)
+    if contest_id is None and len(lookup.contests) == 1:
+        contest_id, = lookup.contests
+    if contest_id is None:
+        candidate_ids = None
+    else:
+        candidate_ids = lookup.get_candidate_ids(contest_id)
+    reader = WinEDSReader(contest_id=contest_id, candidate_ids=candidate_ids)
+    reader.read_path(ballots_path, ballots_resource)
+    try:
+        names = [lookup.candidates[candidate_id].name for candidate_id in reader.candidates]
+    except KeyError as exc:
+        raise WinEDSFormatError("candidate ID missing from master lookup: %s" % exc)
+    contest = ContestInput(name=lookup.contests.get(reader.contest_id), candidates=names,
+                           ballots_resource=ballots_resource)
+    return contest
@@ -0,0 +1,155 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+"""Support for tabulating a contest incrementally as ballots arrive.
+
+On election night, ballots arrive in batches over several days.  An
+IncrementalTally absorbs each batch into a BallotTrie (the compressed
+ballot aggregate) and keeps the first-round totals up to date, so that
+the full round sequence can be re-derived at any time without rereading
+earlier batches.  Its state can be checkpointed to a JSON file between
+batches.
+"""
+
+import logging
+import os
+
+from openrcv import jsonlib, models
+from openrcv.counting import Tabulator
+from openrcv.formats.internal import parse_internal_ballot, to_internal_ballot
+from openrcv.models import BallotTrie, ContestInput
+
+
+log = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 1
+
+
+class IncrementalTally(object):
+
+    """A running tally of a contest whose ballots arrive in batches.
+
+    Attributes:
+      batch_count: the number of batches absorbed.
+      candidates: a list of the candidate names.
+      first_round_totals: a dict mapping candidate number to first-round
+        vote total.
+      trie: a BallotTrie of all ballots absorbed.
+    """
+
+    def __init__(self, candidates, name=None):
+        """
+        Arguments:
+          candidates: an iterable of the candidate names.
+          name: the contest name.
+        """
+        self.candidates = list(candidates)
+        self.name = name
+        self.clear()
+
+    def clear(self):
+        self.batch_count = 0
+        self.candidate_numbers = set(models.make_candidate_numbers(len(self.candidates)))
+        self.first_round_totals = {number: 0 for number in self.candidate_numbers}
+        self.trie = BallotTrie()
+
+    @property
+    def total_weight(self):
+        return self.trie.count_ballots()
+
+    def add_batch(self, ballots_resource):
+        """Absorb a batch of ballots, and return the batch's total weight.
+
+        The batch is read into its own trie before being merged, so the
+        tally is unchanged if reading the batch fails partway through.
+
+        Arguments:
+          ballots_resource: a ballots resource.
+        """
+        batch = BallotTrie.build(ballots_resource)
+        # A batch's first-round totals are the same as the totals of its
+        # trie for the round with every candidate eligible.
+        batch_totals = batch.tabulate(self.candidate_numbers)
+        self.trie.merge(batch)
+        for number, total in batch_totals.items():
+            self.first_round_totals[number] += total
+        self.batch_count += 1
+        weight = batch.count_ballots()
+        log.info("absorbed batch %d: weight=%d, total weight=%d, trie nodes=%d" %
+                 (self.batch_count, weight, self.total_weight, self.trie.node_count))
+        return weight
+
+    def make_contest(self):
+        """Return a ContestInput object backed by the trie."""
+        return ContestInput(name=self.name, candidates=self.candidates,
+                            ballots_resource=self.trie)
+
+    def count(self, **kwargs):
+        """Count the ballots absorbed so far, and return a ContestResults object.
+
+        The rounds are counted from the trie, so earlier batches are not
+        reread.
+
+        Arguments:
+          **kwargs: keyword arguments to pass to the Tabulator.
+        """
+        return Tabulator(self.make_contest(), **kwargs).count()
+
+    def to_jsobj(self):
+        ballots = [to_internal_ballot(ballot) for ballot in self.trie.iter_ballots()]
+        return {
+            '_meta': {
+                'version': CHECKPOINT_VERSION,
+                'batch_count': self.batch_count,
+            },
+            'ballots': ballots,
+            'candidates': self.candidates,
+            'name': self.name,
+        }
+
+    def save(self, path):
+        """Write a checkpoint of the tally to a JSON file.
+
+        The file is written under a temporary name and then renamed, so
+        an interrupted save does not corrupt an earlier checkpoint.
+        """
+        temp_path = path + ".tmp"
+        jsonlib.write_json(self.to_jsobj(), path=temp_path)
+        os.replace(temp_path, path)
+        log.info("saved checkpoint after batch %d: %s" % (self.batch_count, path))
+
+    @classmethod
+    def load(cls, path):
+        """Read a tally from a checkpoint written by save()."""
+        jsobj = jsonlib.read_json_path(path)
+        meta = jsobj['_meta']
+        version = meta['version']
+        if version != CHECKPOINT_VERSION:
+            raise ValueError("unsupported checkpoint version %r: %s" % (version, path))
+        tally = cls(jsobj['candidates'], name=jsobj.get('name'))
+        trie = tally.trie
+        for line in jsobj['ballots']:
+            weight, choices = parse_internal_ballot(line)
+            trie.add(weight, choices)
+        tally.first_round_totals.update(trie.tabulate(tally.candidate_numbers))
+        tally.batch_count = meta['batch_count']
+        return tally
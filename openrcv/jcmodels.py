@@ -40,13 +40,14 @@ The classes in this module should be used only for small sets of ballots
 (e.g. those that arise in JSON test cases).  For large numbers of ballots,
 ballot data should be backed by a concrete file and ballots read and
 processed one at a time -- as opposed to having to load them into memory
-all at once.
+all at once.  The exception is JsonCaseContestInput.from_model_ballots(),
+which streams ballots to JSON without creating JsonCaseBallot objects.
 """
 
 from openrcv import contestgen, models, streams
 from openrcv.formats.internal import parse_internal_ballot, to_internal_ballot
 from openrcv.jsonlib import (from_jsobj, Attribute, JsonableError, JsonableMixin,
-                             JsonDeserializeError)
+                             JsonDeserializeError, JsonStream)
 from openrcv.utils import StringInfo
 
 
@@ -152,12 +153,33 @@ class JsonCaseContestInput(JsonableMixin):
         Arguments:
           contest: a ContestInput object.
         """
-        candidate_count = None if contest.candidates is None else len(contest.candidates)
         with contest.ballots_resource.reading() as ballots:
             ballots = [JsonCaseBallot.from_model(b) for b in ballots]
+        self._save_from_model_ballots(contest, ballots)
+
+    def _save_from_model_ballots(self, contest, ballots):
+        candidate_count = None if contest.candidates is None else len(contest.candidates)
         kwargs = self.model_to_kwargs(contest)
         self.__init__(candidate_count=candidate_count, ballots=ballots, **kwargs)
 
+    @classmethod
+    def from_model_ballots(cls, contest, ballots):
+        """Create an instance whose ballots are streamed from an iterable.
+
+        The ballots attribute is a JsonStream of ballot JSON objects, so
+        the instance is meant to be serialized once (e.g. with
+        jsonlib.write_json()) while the iterable is still readable.
+
+        Arguments:
+          contest: a ContestInput object.
+          ballots: an iterable of ballots (e.g. from the contest's ballots
+            resource).
+        """
+        jsonable = cls()
+        jsonable._save_from_model_ballots(contest,
+                                          JsonStream(map(to_internal_ballot, ballots)))
+        return jsonable
+
     # TODO: think about how the creation of a new ballots resource should
     # be handled, since it involves managing another resource.
     # TODO: DRY this up by making last two lines part of base class.
@@ -221,8 +243,14 @@ class JsonCaseRoundResult(JsonableMixin):
         return [from_number(n) for n in numbers]
 
     def totals_to_named_totals(self, totals):
+        """Return the totals keyed by candidate name.
+
+        Totals that are not integers (e.g. Fraction totals from STV
+        surplus transfers) are written as floats.
+        """
         from_number = self.candidates_info.from_number
-        return {from_number(number): total for number, total in totals.items()}
+        return {from_number(number): total if isinstance(total, int) else float(total)
+                for number, total in totals.items()}
 
     def to_jsobj(self):
         jsobj = {}
@@ -234,8 +262,20 @@ class JsonCaseRoundResult(JsonableMixin):
 
 class JsonCaseTestOutput(JsonableMixin):
 
+    """The results of a contest for testing purposes.
+
+    Attributes:
+      partial: True if the results are partial (see ContestResults), and
+        otherwise None, so that complete results serialize as before.
+    """
+
     meta_attrs = ()
-    data_attrs = (Attribute('rounds', cls=JsonCaseRoundResult), )
+    data_attrs = (Attribute('partial'),
+                  Attribute('rounds', cls=JsonCaseRoundResult), )
+
+    def save_from_model(self, results):
+        if not self.partial:
+            self.partial = None
 
 
 class JsonCaseTestInstance(JsonableMixin):
@@ -41,8 +41,12 @@ JSON should be a deliberate decision (and in the Python world, None
 is the usual default value).
 """
 
+import codecs
 import json
+from json.decoder import scanstring
+from json.encoder import encode_basestring_ascii
 import logging
+import re
 
 from openrcv import streams
 from openrcv import utils
@@ -61,8 +65,31 @@ class JsNull(object):
 JS_NULL = JsNull()
 
 
+class JsonStream(object):
+
+    """A JSON array whose items are produced lazily.
+
+    The items are JSON objects.  Since the iterable is typically a
+    generator, a stream can usually be serialized only once.  The
+    iter_json() function serializes a stream without materializing it.
+    """
+
+    def __init__(self, iterable):
+        self.iterable = iterable
+
+    def __iter__(self):
+        return iter(self.iterable)
+
+
+def _default(obj):
+    # Materialize streams when serializing with the json module.
+    if isinstance(obj, JsonStream):
+        return list(obj)
+    raise TypeError("%r is not JSON serializable" % obj)
+
+
 def call_json(json_func, *args, **kwargs):
-    return json_func(*args, indent=4, sort_keys=True, **kwargs)
+    return json_func(*args, indent=4, sort_keys=True, default=_default, **kwargs)
 
 
 def to_json(jsobj):
@@ -80,10 +107,13 @@ def read_json_path(path):
 
 # TODO: remove the path argument?
 # TODO: create a write_json_path() function?
-def write_json(obj, resource=None, path=None):
+def write_json(obj, resource=None, path=None, compact=False):
     """
+    The JSON is written incrementally using iter_json().
+
     Arguments:
       resource: a stream resource object.
+      compact: see iter_json().
     """
     try:
         jsobj = obj.to_jsobj()
@@ -93,7 +123,9 @@ def write_json(obj, resource=None, path=None):
         assert resource is None
         resource = streams.FilePathResource(path, encoding=ENCODING_JSON)
     with resource.open_write() as f:
-        return call_json(json.dump, jsobj, f)
+        write = f.write
+        for chunk in iter_json(jsobj, compact=compact):
+            write(chunk)
 
 
 def from_model(obj, cls):
@@ -129,14 +161,373 @@ def from_jsobj(jsobj, cls=None):
 
 
 def to_jsobj(obj):
-    """Convert a Jsonable object to a JSON object, and return it."""
+    """Convert a Jsonable object to a JSON object, and return it.
+
+    JsonStream objects are returned as is.
+    """
     if isinstance(obj, LIST_TYPES):
         return [to_jsobj(o) for o in obj]
-    if obj.__class__.__module__ == "builtins":
+    if obj.__class__.__module__ == "builtins" or isinstance(obj, JsonStream):
         return obj
     return obj.to_jsobj()
 
 
+# The number of array items encoded at a time when serializing JSON
+# incrementally.
+STREAM_ENCODE_BATCH_SIZE = 1000
+
+
+def _encode_value(value, newline, indent):
+    """Return the JSON for a value, with nested lines starting with newline."""
+    if type(value) is str:
+        return encode_basestring_ascii(value)
+    return "".join(_iter_json(value, newline, indent))
+
+
+def _iter_json_array(items, newline, indent):
+    item_newline = newline + indent if indent is not None else newline
+    sep = "," + item_newline
+    prefix = "[" + item_newline
+    for batch in utils.iter_batches(items, STREAM_ENCODE_BATCH_SIZE):
+        yield prefix + sep.join([_encode_value(item, item_newline, indent)
+                                 for item in batch])
+        prefix = sep
+    yield "[]" if prefix != sep else newline + "]"
+
+
+def _iter_json_dict(jsdict, newline, indent):
+    if not jsdict:
+        yield "{}"
+        return
+    item_newline = newline + indent if indent is not None else newline
+    key_sep = ": " if indent is not None else ":"
+    prefix = "{" + item_newline
+    for key in sorted(jsdict):
+        yield prefix + encode_basestring_ascii(key) + key_sep
+        yield from _iter_json(jsdict[key], item_newline, indent)
+        prefix = "," + item_newline
+    yield newline + "}"
+
+
+def _iter_json(jsobj, newline, indent):
+    if isinstance(jsobj, dict):
+        yield from _iter_json_dict(jsobj, newline, indent)
+    elif isinstance(jsobj, LIST_TYPES) or isinstance(jsobj, JsonStream):
+        yield from _iter_json_array(jsobj, newline, indent)
+    elif jsobj.__class__.__module__ == "builtins":
+        yield json.dumps(jsobj)
+    else:
+        yield from _iter_json(to_jsobj(jsobj), newline, indent)
+
+
+def iter_json(jsobj, compact=False):
+    """Serialize a JSON object incrementally, and yield chunks of JSON.
+
+    Unless compact, the JSON is the same as that written by write_json()
+    (i.e. indented with sorted keys).  Arrays (including JsonStream
+    objects and generators) are consumed lazily, a batch of items at a
+    time, so a large array of scalars is never held in memory as a
+    whole.  Jsonable objects are converted using to_jsobj().
+
+    Arguments:
+      compact: whether to omit the indentation and the whitespace
+        after separators, for JSON meant for machines.
+    """
+    if compact:
+        return _iter_json(jsobj, "", None)
+    return _iter_json(jsobj, "\n", " " * 4)
+
+
+# The number of characters (or bytes) read at a time when streaming JSON.
+STREAM_CHUNK_SIZE = 1 << 16
+
+# Matches optional whitespace followed by one JSON token.
+_TOKEN_RE = re.compile(r"""[ \t\n\r]*(?:
+    ([{}\[\],:])                                  # punctuation
+    |("[^"\\]*(?:\\.[^"\\]*)*")                   # string
+    |(-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?)  # number
+    |(true|false|null)                             # literal
+)""", re.VERBOSE)
+
+# The size above which a value that fails to decode is treated as invalid
+# rather than incomplete.
+MAX_STREAM_VALUE_SIZE = 1 << 26
+
+_WHITESPACE_RE = re.compile(r"[ \t\n\r]*")
+
+# The characters that can start a token.
+_TOKEN_START_CHARS = '{}[],:"-0123456789tfn'
+
+# Matches the rest of a buffer if it could continue a number token.
+_NUMBER_TAIL_RE = re.compile(r"[0-9.eE+-]*\Z")
+
+_LITERALS = {
+    'true': ('boolean', True),
+    'false': ('boolean', False),
+    'null': ('null', None),
+}
+
+
+class JsonStreamError(ValueError):
+    pass
+
+
+class _JsonTokenizer(object):
+
+    """Splits a JSON stream into tokens, reading it a chunk at a time."""
+
+    def __init__(self, f, chunk_size=None):
+        if chunk_size is None:
+            chunk_size = STREAM_CHUNK_SIZE
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = None
+        self.buf = ""
+        # The position in buf of the next token.
+        self.pos = 0
+        # The number of characters before the start of buf.
+        self.offset = 0
+        self.eof = False
+
+    def read_more(self, size=None):
+        """Read another chunk into the buffer, discarding consumed text."""
+        chunk = self.f.read(self.chunk_size if size is None else size)
+        if not chunk:
+            self.eof = True
+        if isinstance(chunk, bytes):
+            if self.decoder is None:
+                self.decoder = codecs.getincrementaldecoder(ENCODING_JSON)()
+            # The decoder holds back a partial multi-byte character.
+            chunk = self.decoder.decode(chunk, final=self.eof)
+        self.offset += self.pos
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+
+    def raise_error(self, message=None):
+        rest = self.buf[self.pos:].lstrip()
+        if message is None:
+            message = "invalid JSON"
+        raise JsonStreamError("%s at character %d: %r" %
+                              (message, self.offset + len(self.buf) - len(rest), rest[:20]))
+
+    def is_complete(self, end):
+        """Return whether a value ending at end can't continue in the next chunk."""
+        return self.eof or _NUMBER_TAIL_RE.match(self.buf, end) is None
+
+    def peek(self):
+        """Skip whitespace, and return the next character ("" at the end)."""
+        while True:
+            self.pos = _WHITESPACE_RE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos + 1]
+            self.read_more()
+
+    def decode_value(self, raw_decode):
+        """Decode and return the next value using a raw_decode() function.
+
+        Arguments:
+          raw_decode: a json.JSONDecoder instance's raw_decode() method.
+        """
+        while True:
+            char = self.peek()
+            if not char:
+                self.raise_error("unexpected end of JSON")
+            if char not in _TOKEN_START_CHARS:
+                self.raise_error()
+            try:
+                value, end = raw_decode(self.buf, self.pos)
+            except ValueError:
+                if self.eof:
+                    self.raise_error()
+                if len(self.buf) - self.pos > MAX_STREAM_VALUE_SIZE:
+                    self.raise_error("JSON value too large or invalid")
+            else:
+                if char in '{["' or self.is_complete(end):
+                    self.pos = end
+                    return value
+            # Grow the buffer geometrically so large values decode in
+            # linear time.
+            self.read_more(max(self.chunk_size, len(self.buf) - self.pos))
+
+    def tokens(self):
+        """Return an iterator over the (kind, value) tokens of the stream.
+
+        The kind of a punctuation token is the punctuation character, and
+        the kind of a value token is its event name (e.g. "string").
+        The pos attribute is past the token when each token is yielded.
+        """
+        match = _TOKEN_RE.match
+        number_tail = _NUMBER_TAIL_RE.match
+        buf = self.buf
+        pos = self.pos
+        while True:
+            m = match(buf, pos)
+            # A token at the end of the buffer may continue in the next chunk.
+            if m is None or (not self.eof and (m.end() == len(buf) or
+                                               (m.lastindex == 3 and
+                                                number_tail(buf, m.end()) is not None))):
+                self.pos = pos
+                rest = buf[pos:].lstrip()
+                # Fail early rather than buffering the rest of the stream.
+                if rest and (self.eof or rest[0] not in _TOKEN_START_CHARS):
+                    self.raise_error()
+                if self.eof:
+                    return
+                self.read_more()
+                buf = self.buf
+                pos = 0
+                continue
+            pos = self.pos = m.end()
+            index = m.lastindex
+            token = m.group(index)
+            if index == 1:
+                yield token, None
+            elif index == 2:
+                if "\\" in token:
+                    yield 'string', scanstring(token, 1)[0]
+                else:
+                    yield 'string', token[1:-1]
+            elif index == 3:
+                if "." in token or "e" in token or "E" in token:
+                    yield 'number', float(token)
+                else:
+                    yield 'number', int(token)
+            else:
+                yield _LITERALS[token]
+
+
+# The states of _iter_events(), i.e. what the next token must be.
+_EXPECT_VALUE = 'value'
+_EXPECT_KEY = 'map key'
+_EXPECT_COLON = "':'"
+_EXPECT_SEP = "',' or a closing bracket"
+_EXPECT_END = 'end of JSON'
+
+
+def _iter_events(tokens):
+    """Return an iterator over the parse events of an iterator of tokens."""
+    # A stack of the open containers, as [prefix, is_map, key] lists.
+    containers = []
+    expect = _EXPECT_VALUE
+    # Whether the last token opened a container, so it can be closed.
+    opened = False
+    for kind, value in tokens:
+        if kind == '}' or kind == ']':
+            if not containers or containers[-1][1] != (kind == '}'):
+                raise JsonStreamError("unbalanced %r" % kind)
+            if not (opened or expect == _EXPECT_SEP):
+                raise JsonStreamError("expected %s but got: %r" % (expect, kind))
+            prefix, is_map, key = containers.pop()
+            opened = False
+            expect = _EXPECT_SEP if containers else _EXPECT_END
+            yield prefix, ('end_map' if is_map else 'end_array'), None
+            continue
+        opened = False
+        if expect == _EXPECT_SEP:
+            if kind != ',':
+                raise JsonStreamError("expected %s but got: %r" % (expect, kind))
+            expect = _EXPECT_KEY if containers[-1][1] else _EXPECT_VALUE
+            continue
+        if expect == _EXPECT_COLON:
+            if kind != ':':
+                raise JsonStreamError("expected %s but got: %r" % (expect, kind))
+            expect = _EXPECT_VALUE
+            continue
+        if expect == _EXPECT_KEY:
+            if kind != 'string':
+                raise JsonStreamError("expected a map key but got: %r" % (kind, ))
+            container = containers[-1]
+            container[2] = value
+            expect = _EXPECT_COLON
+            yield container[0], 'map_key', value
+            continue
+        if expect == _EXPECT_END:
+            raise JsonStreamError("unexpected data after the top-level value")
+        # Then the token must start a value.
+        if kind == ',' or kind == ':':
+            raise JsonStreamError("expected %s but got: %r" % (expect, kind))
+        if containers:
+            parent_prefix, is_map, key = containers[-1]
+            part = key if is_map else "item"
+            prefix = part if not parent_prefix else parent_prefix + "." + part
+        else:
+            prefix = ""
+        if kind == '{':
+            containers.append([prefix, True, None])
+            expect = _EXPECT_KEY
+            opened = True
+            yield prefix, 'start_map', None
+        elif kind == '[':
+            containers.append([prefix, False, None])
+            opened = True
+            yield prefix, 'start_array', None
+        else:
+            expect = _EXPECT_SEP if containers else _EXPECT_END
+            yield prefix, kind, value
+    if containers:
+        raise JsonStreamError("unexpected end of JSON: %d unclosed container(s)" %
+                              len(containers))
+    if expect != _EXPECT_END:
+        raise JsonStreamError("JSON has no value")
+
+
+def iter_json_events(f, chunk_size=None):
+    """Return an iterator over the parse events of a JSON document.
+
+    The document is read incrementally, so memory use does not grow with
+    the size of the document.  Each event is a (prefix, event, value)
+    3-tuple, where prefix is the dotted path of the value (with "item"
+    for array elements, e.g. "Sessions.item.Cards"), and event is one of:
+    "start_map", "map_key", "end_map", "start_array", "end_array",
+    "string", "number", "boolean" or "null".  For "map_key" events, the
+    prefix is that of the map, and the value is the key.
+
+    The structure of the document is validated, including the commas
+    and colons, and errors raise JsonStreamError.
+
+    Arguments:
+      f: a text or binary (UTF-8) file-like object.
+      chunk_size: the number of characters (or bytes) to read at a time.
+    """
+    return _iter_events(_JsonTokenizer(f, chunk_size).tokens())
+
+
+def iter_json_items(f, prefix, chunk_size=None):
+    """Return an iterator over the items of an array in a JSON document.
+
+    Each item is decoded with the json module as a whole, which is much
+    faster than iter_json_events() when the array is made up of many
+    small items (like the records of an export).  Memory use is
+    proportional to the size of an item rather than to the size of the
+    document.  The rest of the document after the array is not read.
+
+    Arguments:
+      f: a text or binary (UTF-8) file-like object.
+      prefix: the prefix of the array, in the form of iter_json_events()
+        (e.g. "Sessions").
+      chunk_size: the number of characters (or bytes) to read at a time.
+    """
+    tokenizer = _JsonTokenizer(f, chunk_size)
+    for event_prefix, event, value in _iter_events(tokenizer.tokens()):
+        if event_prefix == prefix and event == 'start_array':
+            break
+    else:
+        raise JsonStreamError("JSON has no array at: %r" % prefix)
+    raw_decode = json.JSONDecoder().raw_decode
+    char = tokenizer.peek()
+    if char == ']':
+        return
+    while True:
+        yield tokenizer.decode_value(raw_decode)
+        char = tokenizer.peek()
+        tokenizer.pos += 1
+        if char == ']':
+            return
+        if char != ',':
+            tokenizer.pos -= 1
+            tokenizer.raise_error("expected ',' or ']'")
+
+
 class JsonPathInfo(PathInfo):
 
     def __init__(self, path):
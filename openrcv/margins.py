@@ -0,0 +1,572 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+"""Support for computing the margin of victory of an IRV contest.
+
+The margin is the smallest number of ballots whose rankings would need
+to change for a different candidate to win.  Ties are assumed to break
+in favor of the change, so the margin is the smallest number of changes
+after which some way of breaking ties elects someone else (see also
+the scenarios module).
+
+The computation follows the approach of Magrino et al. ("Computing the
+Margin of Victory in IRV Elections", 2011).  For a complete elimination
+order ending with a candidate other than the winner, the smallest number
+of changes realizing that order is the optimum of an integer program
+("DistanceTo").  Rather than solving one such program for each of the
+n! orders, the orders are searched by branch and bound on their suffixes
+(i.e. the last candidates eliminated).  The constraints for the rounds
+of a suffix depend only on the candidates in the suffix, so a lower
+bound for a suffix is also a lower bound for every order ending with it.
+
+Integer programs are solved by LP-based branch and bound, using an exact
+simplex method over Fractions, so no solver dependency is needed.
+
+Ballot changes are modeled as removing ballots and adding ballots.  Within
+the rounds of a suffix, a ballot only matters through its "chain": the
+sequence of candidates it counts for, round by round.  The ballots are
+read once into a BallotTrie, so chains are computed once per distinct
+ranking rather than once per ballot.
+"""
+
+from fractions import Fraction
+from functools import reduce
+from itertools import combinations
+import logging
+from math import ceil, gcd
+import timeit
+
+from openrcv import models
+from openrcv.scenarios import ScenarioExplorer
+from openrcv.utils import ReprMixin
+
+
+log = logging.getLogger(__name__)
+
+# How often to log progress, in seconds.
+PROGRESS_INTERVAL = 5
+
+
+class MarginTimeout(Exception):
+
+    """Raised internally when the time limit is reached."""
+
+
+def _check_deadline(deadline):
+    if deadline is not None and timeit.default_timer() > deadline:
+        raise MarginTimeout()
+
+
+# The linear programs are solved with an integer tableau.  Each row is
+# stored scaled by its own positive integer, so that the actual value of
+# an entry is the integer divided by the row's entry in the column of the
+# row's basic variable (or, for the objective row, by a separately stored
+# denominator).  A pivot only rewrites the rows with a nonzero entry in
+# the pivot column, and each rewritten row is divided by the gcd of its
+# entries.  This is exact, and much faster than doing the arithmetic with
+# Fractions.
+
+def _reduce_row(line):
+    """Divide a row by the gcd of its entries, in place, and return the gcd."""
+    divisor = reduce(gcd, line)
+    if divisor > 1:
+        line[:] = [value // divisor for value in line]
+    return divisor
+
+
+def _pivot(tableau, basis, row, col, objective_den):
+    """Pivot on the given entry, and return the new objective denominator.
+
+    The last row of the tableau is the objective row.
+    """
+    pivot_row = tableau[row]
+    pivot = pivot_row[col]
+    if pivot < 0:
+        # Negating the row keeps the equation, and keeps the scale positive.
+        pivot_row[:] = [-value for value in pivot_row]
+        pivot = -pivot
+    pivot_indices = [j for j, value in enumerate(pivot_row) if value]
+    last = len(tableau) - 1
+    for i, line in enumerate(tableau):
+        factor = line[col]
+        if i == row or not factor:
+            continue
+        line[:] = [value * pivot for value in line]
+        for j in pivot_indices:
+            line[j] -= factor * pivot_row[j]
+        if i == last:
+            objective_den *= pivot
+            divisor = gcd(_reduce_row(line + [objective_den]), objective_den)
+            objective_den //= divisor
+            if divisor > 1:
+                line[:] = [value // divisor for value in line]
+        else:
+            _reduce_row(line)
+    _reduce_row(pivot_row)
+    basis[row] = col
+    return objective_den
+
+
+def _run_simplex(tableau, basis, col_limit, objective_den):
+    """Run the simplex method on a tableau whose last row is the objective.
+
+    Uses Bland's rule, which prevents cycling.  Returns a (found,
+    objective_den) pair, where found is whether an optimum was found
+    (i.e. False if the program is unbounded).
+
+    Arguments:
+      col_limit: columns at this index or higher may not enter the basis.
+    """
+    row_count = len(tableau) - 1
+    while True:
+        objective = tableau[-1]
+        for col in range(col_limit):
+            if objective[col] < 0:
+                break
+        else:
+            return True, objective_den
+        best_row = None
+        for i in range(row_count):
+            line = tableau[i]
+            value = line[col]
+            if value > 0:
+                if best_row is None:
+                    best_row = i
+                    continue
+                best_line = tableau[best_row]
+                # Compare the ratios line[-1] / value by cross-multiplying.
+                # The row scales cancel out.
+                left = line[-1] * best_line[col]
+                right = best_line[-1] * value
+                if left < right or (left == right and basis[i] < basis[best_row]):
+                    best_row = i
+        if best_row is None:
+            return False, objective_den
+        objective_den = _pivot(tableau, basis, best_row, col, objective_den)
+
+
+def solve_lp(costs, rows, rhs):
+    """Solve a linear program exactly, using the two-phase simplex method.
+
+    Minimizes the dot product of costs and z subject to rows[i] . z <= rhs[i]
+    for each i, and z >= 0.  Returns a (value, z) pair, whose numbers are
+    Fractions, or None if the program is infeasible.  Raises a ValueError
+    if the program is unbounded.
+
+    Arguments:
+      costs: a list of integers, one per variable.
+      rows: a list of dicts mapping variable index to integer coefficient.
+      rhs: a list of integers, one per row.
+    """
+    var_count = len(costs)
+    row_count = len(rows)
+    artificial_rows = [i for i, b in enumerate(rhs) if b < 0]
+    artificial_start = var_count + row_count
+    width = artificial_start + len(artificial_rows) + 1
+
+    tableau = []
+    basis = []
+    for i, (row, b) in enumerate(zip(rows, rhs)):
+        # Negate rows with a negative right-hand side, so that every
+        # right-hand side is nonnegative.
+        sign = -1 if b < 0 else 1
+        line = [0] * width
+        for j, a in row.items():
+            line[j] = sign * a
+        line[var_count + i] = sign
+        line[-1] = sign * b
+        tableau.append(line)
+        basis.append(var_count + i)
+    for k, i in enumerate(artificial_rows):
+        col = artificial_start + k
+        tableau[i][col] = 1
+        basis[i] = col
+
+    # Phase 1: minimize the sum of the artificial variables.
+    objective = [0] * width
+    for i in artificial_rows:
+        line = tableau[i]
+        for j in range(artificial_start):
+            objective[j] -= line[j]
+        objective[-1] -= line[-1]
+    tableau.append(objective)
+    objective_den = 1
+    if artificial_rows:
+        found, objective_den = _run_simplex(tableau, basis, artificial_start, objective_den)
+        if tableau[-1][-1] != 0:
+            return None
+        # Drive any artificial variables (at zero) out of the basis.
+        for i in reversed(range(len(basis))):
+            if basis[i] < artificial_start:
+                continue
+            line = tableau[i]
+            col = next((j for j in range(artificial_start) if line[j]), None)
+            if col is None:
+                # Then the row is redundant.
+                del tableau[i]
+                del basis[i]
+            else:
+                objective_den = _pivot(tableau, basis, i, col, objective_den)
+
+    # Phase 2: minimize the actual objective.
+    objective = [0] * width
+    objective[:var_count] = costs
+    objective_den = 1
+    for i, col in enumerate(basis):
+        factor = costs[col] if col < var_count else 0
+        if factor:
+            line = tableau[i]
+            scale = line[col]
+            objective = [a * scale - factor * b for a, b in zip(objective, line)]
+            objective_den *= scale
+    tableau[-1] = objective
+    found, objective_den = _run_simplex(tableau, basis, artificial_start, objective_den)
+    if not found:
+        raise ValueError("the linear program is unbounded")
+    z = [Fraction(0)] * var_count
+    for i, col in enumerate(basis):
+        if col < var_count:
+            line = tableau[i]
+            z[col] = Fraction(line[-1], line[col])
+    return Fraction(-tableau[-1][-1], objective_den), z
+
+
+def solve_ilp(costs, rows, rhs, upper_bound=None, deadline=None):
+    """Solve an integer program exactly, using LP-based branch and bound.
+
+    The arguments are as for solve_lp(), and every variable is required to
+    be an integer.  The costs should be integers, so that the objective
+    is an integer at every solution.  Returns a (value, z) pair, or None
+    if there is no solution with value less than upper_bound.
+
+    Arguments:
+      upper_bound: only solutions with a smaller value are of interest.
+      deadline: a timeit.default_timer() value after which to raise
+        MarginTimeout.
+    """
+    best = None
+    stack = [([], [])]
+    while stack:
+        _check_deadline(deadline)
+        extra_rows, extra_rhs = stack.pop()
+        solution = solve_lp(costs, rows + extra_rows, rhs + extra_rhs)
+        if solution is None:
+            continue
+        value, z = solution
+        if upper_bound is not None and ceil(value) >= upper_bound:
+            continue
+        index = next((j for j, v in enumerate(z) if v != int(v)), None)
+        if index is None:
+            best = value, z
+            upper_bound = value
+            continue
+        floor = int(z[index] // 1)
+        # Explore the "rounded down" branch first.
+        stack.append((extra_rows + [{index: -1}], extra_rhs + [-(floor + 1)]))
+        stack.append((extra_rows + [{index: 1}], extra_rhs + [floor]))
+    return best
+
+
+def get_chain(choices, positions):
+    """Return the chain of a ranking relative to an elimination suffix.
+
+    The chain is the tuple of positions (in the suffix) of the candidates
+    the ballot counts for in successive rounds: the first candidate of
+    the suffix it ranks, then the first ranked candidate eliminated after
+    that one, and so on.
+
+    Arguments:
+      choices: a tuple of candidate numbers.
+      positions: a dict mapping each candidate of the suffix to its
+        position in the suffix.
+    """
+    chain = []
+    last = -1
+    for choice in choices:
+        position = positions.get(choice)
+        if position is not None and position > last:
+            chain.append(position)
+            last = position
+    return tuple(chain)
+
+
+def _get_top(chain, start):
+    """Return who a chain counts for once the positions before start are out."""
+    for position in chain:
+        if position >= start:
+            return position
+    return None
+
+
+class MarginResults(ReprMixin):
+
+    """The result of a margin computation.
+
+    Attributes:
+      elimination_order: a list of candidate numbers, in elimination
+        order, realizing upper_bound changes (the last is the new winner),
+        or None.
+      exact: whether lower_bound equals upper_bound.
+      lower_bound: a lower bound for the margin.
+      margin: the margin if exact, otherwise None.
+      node_count: the number of elimination suffixes examined.
+      seconds: the time taken.
+      upper_bound: an upper bound for the margin, or None if no other
+        candidate can win.
+      winner: the original winner.
+    """
+
+    def __init__(self, winner, lower_bound, upper_bound, elimination_order=None,
+                 node_count=0, seconds=0):
+        self.elimination_order = elimination_order
+        self.lower_bound = lower_bound
+        self.node_count = node_count
+        self.seconds = seconds
+        self.upper_bound = upper_bound
+        self.winner = winner
+
+    def repr_info(self):
+        return "winner=%r, bounds=%r" % (self.winner, (self.lower_bound, self.upper_bound))
+
+    @property
+    def exact(self):
+        return self.lower_bound == self.upper_bound
+
+    @property
+    def margin(self):
+        return self.upper_bound if self.exact else None
+
+
+class MarginCalculator(object):
+
+    """Computes the margin of victory of an IRV contest."""
+
+    def __init__(self, contest, time_limit=None):
+        """
+        Arguments:
+          contest: a ContestInput object.
+          time_limit: the number of seconds after which to stop searching
+            and report the best bounds found so far, or None for no limit.
+        """
+        ballots_resource = contest.ballots_resource
+        if not isinstance(ballots_resource, models.BallotTrie):
+            ballots_resource = models.BallotTrie.build(ballots_resource)
+        self.candidate_numbers = sorted(contest.get_candidate_numbers())
+        self.contest = contest
+        self.time_limit = time_limit
+        self.trie = ballots_resource
+        # The distinct rankings, as (weight, choices) pairs.
+        self.ballots = list(ballots_resource.iter_ballots())
+
+    def get_chain_weights(self, suffix):
+        """Return a dict mapping each chain of the suffix to its weight."""
+        positions = {candidate: position for position, candidate in enumerate(suffix)}
+        weights = {}
+        for weight, choices in self.ballots:
+            chain = get_chain(choices, positions)
+            if chain:
+                weights[chain] = weights.get(chain, 0) + weight
+        return weights
+
+    def get_round_totals(self, suffix, chain_weights, round_count=None):
+        """Return a list of the totals of each of the suffix's rounds.
+
+        The totals for round i are a list indexed by position.
+
+        Arguments:
+          round_count: the number of rounds to return.  Defaults to all.
+        """
+        size = len(suffix)
+        if round_count is None:
+            round_count = size
+        all_totals = []
+        for start in range(round_count):
+            totals = [0] * size
+            for chain, weight in chain_weights.items():
+                top = _get_top(chain, start)
+                if top is not None:
+                    totals[top] += weight
+            all_totals.append(totals)
+        return all_totals
+
+    def get_simple_bound(self, round_totals, start):
+        """Return a lower bound from the constraints of one round.
+
+        Each changed ballot can narrow the gap between two candidates
+        by at most two votes.
+        """
+        totals = round_totals[start]
+        eliminated = totals[start]
+        return max([0] + [ceil((eliminated - totals[other]) / 2)
+                          for other in range(start + 1, len(totals))])
+
+    def make_program(self, suffix, chain_weights, round_totals):
+        """Return the (costs, rows, rhs) of the DistanceTo program for a suffix.
+
+        Variable 0 is the number of changed ballots.  Then come variables
+        for the number of ballots added with each possible chain, and
+        for the number of ballots removed with each existing chain.
+        """
+        size = len(suffix)
+        # Only added chains ending with the (new) winner are needed, since
+        # more votes for the winner can only help.
+        added = [chain + (size - 1, ) for length in range(size)
+                 for chain in combinations(range(size - 1), length)]
+        removed = sorted(chain_weights)
+        var_count = 1 + len(added) + len(removed)
+        # Lists of (variable index, chain, sign) triples.
+        terms = ([(1 + j, chain, 1) for j, chain in enumerate(added)] +
+                 [(1 + len(added) + j, chain, -1) for j, chain in enumerate(removed)])
+
+        rows = []
+        rhs = []
+        # The number of changed ballots is at least the number added and
+        # the number removed.
+        rows.append(dict([(0, -1)] + [(1 + j, 1) for j in range(len(added))]))
+        rhs.append(0)
+        rows.append(dict([(0, -1)] + [(1 + len(added) + j, 1) for j in range(len(removed))]))
+        rhs.append(0)
+        for j, chain in enumerate(removed):
+            rows.append({1 + len(added) + j: 1})
+            rhs.append(chain_weights[chain])
+        # In each round, the eliminated candidate has no more votes than
+        # any other remaining candidate.
+        for start in range(size - 1):
+            totals = round_totals[start]
+            tops = [(index, _get_top(chain, start), sign) for index, chain, sign in terms]
+            for other in range(start + 1, size):
+                row = {}
+                for index, top, sign in tops:
+                    if top == start:
+                        row[index] = sign
+                    elif top == other:
+                        row[index] = -sign
+                rows.append(row)
+                rhs.append(totals[other] - totals[start])
+        costs = [1] + [0] * (var_count - 1)
+        return costs, rows, rhs
+
+    def compute(self):
+        """Compute the margin, and return a MarginResults object."""
+        start_time = timeit.default_timer()
+        deadline = None if self.time_limit is None else start_time + self.time_limit
+        winners = ScenarioExplorer(self.contest).explore().winners
+        if len(winners) > 1:
+            # Then the winner already depends on how a tie is broken.
+            return MarginResults(None, 0, 0)
+        winner = winners[0]
+        others = [c for c in self.candidate_numbers if c != winner]
+        if not others:
+            return MarginResults(winner, None, None)
+
+        total_weight = self.trie.count_ballots()
+        self.best = None
+        self.best_order = None
+        self.node_count = 0
+        self.deadline = deadline
+        self._next_progress = start_time + PROGRESS_INTERVAL
+        # A stack of (suffix, lower bound, chain weights) triples.
+        stack = [((candidate, ), 0, None) for candidate in reversed(others)]
+        lower_bound = None
+        try:
+            while stack:
+                suffix, bound, chain_weights = stack.pop()
+                self._visit(suffix, bound, chain_weights, stack)
+        except MarginTimeout:
+            # Every order not yet ruled out ends with a suffix still on the
+            # stack (or the suffix being visited).
+            lower_bound = min([bound] + [item[1] for item in stack])
+            log.warning("margin: time limit of %s seconds reached" % self.time_limit)
+        upper_bound = self.best
+        if lower_bound is None:
+            lower_bound = upper_bound
+        elif upper_bound is not None:
+            lower_bound = min(lower_bound, upper_bound)
+        seconds = timeit.default_timer() - start_time
+        results = MarginResults(winner, lower_bound, upper_bound,
+                                elimination_order=self.best_order,
+                                node_count=self.node_count, seconds=seconds)
+        log.info("margin: %r (of %d votes): %d suffixes in %.4f seconds" %
+                 (results, total_weight, self.node_count, seconds))
+        return results
+
+    def _log_progress(self):
+        now = timeit.default_timer()
+        if now < self._next_progress:
+            return
+        self._next_progress = now + PROGRESS_INTERVAL
+        log.info("margin: %d suffixes examined, best so far: %s" %
+                 (self.node_count, self.best))
+
+    def _visit(self, suffix, bound, chain_weights, stack):
+        """Examine one suffix, pushing its extensions onto the stack.
+
+        Arguments:
+          bound: a lower bound for the suffix.
+          chain_weights: the return value of get_chain_weights() for the
+            suffix, or None.
+        """
+        _check_deadline(self.deadline)
+        self.node_count += 1
+        self._log_progress()
+        best = self.best
+        if best is not None and bound >= best:
+            return
+        if chain_weights is None:
+            chain_weights = self.get_chain_weights(suffix)
+        round_totals = self.get_round_totals(suffix, chain_weights)
+        program = self.make_program(suffix, chain_weights, round_totals)
+        if len(suffix) == len(self.candidate_numbers):
+            solution = solve_ilp(*program, upper_bound=best, deadline=self.deadline)
+            if solution is not None:
+                self.best = int(solution[0])
+                self.best_order = list(suffix)
+                log.info("margin: found upper bound %d: %r" % (self.best, self.best_order))
+            return
+        if len(suffix) > 1:
+            value, z = solve_lp(*program)
+            bound = max(bound, ceil(value))
+            if best is not None and bound >= best:
+                return
+        # Push the extensions so that the most promising is examined first.
+        children = []
+        for candidate in self.candidate_numbers:
+            if candidate in suffix:
+                continue
+            child = (candidate, ) + suffix
+            child_weights = self.get_chain_weights(child)
+            totals = self.get_round_totals(child, child_weights, round_count=1)
+            child_bound = max(bound, self.get_simple_bound(totals, 0))
+            children.append((child_bound, child, child_weights))
+        children.sort(key=lambda item: item[0], reverse=True)
+        stack.extend((child, child_bound, child_weights)
+                     for child_bound, child, child_weights in children)
+
+
+def compute_irv_margin(contest, time_limit=None):
+    """Compute the margin of an IRV contest, and return a MarginResults object.
+
+    Arguments:
+      contest: a ContestInput object.
+      time_limit: see MarginCalculator.
+    """
+    return MarginCalculator(contest, time_limit=time_limit).compute()
@@ -30,8 +30,12 @@ simply a `(weight, choices)` 2-tuple, where `weight` is a number and
 choices is a tuple of integer choice ID's.
 """
 
-from contextlib import contextmanager
+from contextlib import closing, contextmanager
 import logging
+import os
+import pathlib
+import sqlite3
+import struct
 import tempfile
 
 # The current module should not depend on any modules in openrcv.formats.
@@ -66,23 +70,15 @@ def normalize_ballots_to(source, target):
     but both "compressed" (by using the weight component) and ordered
     lexicographically for readability by the list of choices on the ballot.
     """
-    # A dict mapping tuples of choices to the cumulative weight.
-    choices_dict = {}
-
-    with source.reading() as ballots:
-        for weight, choices in ballots:
-            try:
-                choices_dict[choices] += weight
-            except KeyError:
-                # Then we are adding the choices for the first time.
-                choices_dict[choices] = weight
-    sorted_choices = sorted(choices_dict.keys())
-
-    with target.writing() as gen:
-        for choices in sorted_choices:
-            weight = choices_dict[choices]
-            ballot = weight, choices
-            gen.send(ballot)
+    # An SQLite store aggregates and orders the ballots on disk, so the
+    # ballots need not fit in memory.
+    with SQLiteBallotsResource.temp() as store:
+        with source.reading() as ballots:
+            store.add_ballots(ballots)
+        with store.reading() as ballots:
+            with target.writing() as gen:
+                for ballot in ballots:
+                    gen.send(ballot)
 
 
 def normalize_ballots(ballots_resource):
@@ -109,6 +105,386 @@ class BallotsResource(streams.WrapperResource, BallotsResourceMixin):
     pass
 
 
+class _TrieNode(object):
+
+    __slots__ = ('weight', 'children')
+
+    def __init__(self):
+        # The total weight of the ballots whose rankings start with the
+        # prefix this node represents.
+        self.weight = 0
+        # A dict mapping choice to child node, or None for a leaf.
+        self.children = None
+
+    def child(self, choice):
+        """Return the child node for the given choice, or None."""
+        children = self.children
+        return None if children is None else children.get(choice)
+
+
+class BallotTrie(streams.StreamResourceMixin):
+
+    """A ranking prefix tree ("trie") aggregating a set of ballots.
+
+    Each node of the trie corresponds to a ranking prefix and carries the
+    accumulated weight of all ballots whose rankings start with that
+    prefix.  Since ballots tend to share long prefixes, memory grows with
+    the number of distinct prefixes rather than with the number of ballots.
+
+    A trie is also a read-write ballots resource.  Reading yields the
+    ballots in normalized form (i.e. compressed and ordered as by
+    normalize_ballots_to()).
+    """
+
+    def __init__(self):
+        self.root = _TrieNode()
+        # The number of nodes, not including the root.
+        self.node_count = 0
+
+    def repr_info(self):
+        return "weight=%d, nodes=%d" % (self.root.weight, self.node_count)
+
+    @classmethod
+    def build(cls, ballots_resource):
+        """Build a trie in one pass over the given ballots resource."""
+        trie = cls()
+        with ballots_resource.reading() as ballots:
+            trie.add_ballots(ballots)
+        return trie
+
+    def copy(self):
+        trie = self.create()
+        trie.merge(self)
+        return trie
+
+    def move(self, dest):
+        dest.root = self.root
+        dest.node_count = self.node_count
+
+    def add(self, weight, choices):
+        """Add a single ballot to the trie."""
+        node = self.root
+        node.weight += weight
+        for choice in choices:
+            children = node.children
+            if children is None:
+                children = node.children = {}
+            try:
+                node = children[choice]
+            except KeyError:
+                node = children[choice] = _TrieNode()
+                self.node_count += 1
+            node.weight += weight
+
+    def add_ballots(self, ballots):
+        """Add an iterable of ballots to the trie."""
+        add = self.add
+        for weight, choices in ballots:
+            add(weight, choices)
+
+    def merge(self, other):
+        """Add the ballots of another trie to this trie."""
+        stack = [(self.root, other.root)]
+        while stack:
+            node, other_node = stack.pop()
+            node.weight += other_node.weight
+            if other_node.children is None:
+                continue
+            if node.children is None:
+                node.children = {}
+            children = node.children
+            for choice, other_child in other_node.children.items():
+                try:
+                    child = children[choice]
+                except KeyError:
+                    child = children[choice] = _TrieNode()
+                    self.node_count += 1
+                stack.append((child, other_child))
+
+    def tabulate(self, candidate_numbers):
+        """Return a dict of the vote totals for a round.
+
+        Each branch of the trie is credited to the first choice along it
+        that is in candidate_numbers.  Branches with no such choice are
+        exhausted.
+
+        Arguments:
+          candidate_numbers: a set of candidates eligible to receive votes.
+        """
+        totals = {number: 0 for number in candidate_numbers}
+        stack = [self.root]
+        while stack:
+            children = stack.pop().children
+            if children is None:
+                continue
+            for choice, child in children.items():
+                if choice in candidate_numbers:
+                    totals[choice] += child.weight
+                else:
+                    stack.append(child)
+        return totals
+
+    def iter_ballots(self):
+        """Return an iterator over the ballots in normalized order."""
+        stack = [((), self.root)]
+        while stack:
+            choices, node = stack.pop()
+            weight = node.weight
+            children = node.children
+            if children is not None:
+                weight -= sum(child.weight for child in children.values())
+                for choice in sorted(children, reverse=True):
+                    stack.append((choices + (choice, ), children[choice]))
+            if weight:
+                yield weight, choices
+
+    def clear(self):
+        self.root = _TrieNode()
+        self.node_count = 0
+
+    def count_ballots(self):
+        return self.root.weight
+
+    def normalize(self):
+        # Ballots are always read in normalized form.
+        pass
+
+    @contextmanager
+    def reading(self):
+        yield self.iter_ballots()
+
+    @contextmanager
+    def writing(self):
+        self.clear()
+        gen = self._adder()
+        try:
+            yield gen
+        finally:
+            gen.close()
+
+    @contextmanager
+    def batch_writing(self):
+        self.clear()
+        yield self.add_ballots
+
+    @utils.coroutine
+    def _adder(self):
+        add = self.add
+        while True:
+            weight, choices = yield
+            add(weight, choices)
+
+
+# Choices from this value up are encoded as LARGE_CHOICE_MARKER followed
+# by a big-endian uint64 (see encode_ranking()).
+LARGE_CHOICE_START = 0xFF00
+LARGE_CHOICE_MARKER = 0xFF
+
+_LARGE_CHOICE = struct.Struct(">BQ")
+
+
+def _encode_choice(choice):
+    if choice < LARGE_CHOICE_START:
+        return struct.pack(">H", choice)
+    return _LARGE_CHOICE.pack(LARGE_CHOICE_MARKER, choice)
+
+
+def encode_ranking(choices):
+    """Return the choices of a ballot as an SQLite ranking BLOB.
+
+    Each choice below LARGE_CHOICE_START is a big-endian uint16, and
+    larger choices take 9 bytes starting with a 0xFF byte.  Since the
+    encoding of each choice preserves order and no encoding is a prefix
+    of another, comparing the BLOBs bytewise (as SQLite does) orders
+    them like the tuples of choices.
+    """
+    try:
+        if not choices or max(choices) < LARGE_CHOICE_START:
+            return struct.pack(">%dH" % len(choices), *choices)
+        return b"".join([_encode_choice(choice) for choice in choices])
+    except struct.error:
+        raise ValueError("choices must be integers from 0 to %d: %r" %
+                         ((1 << 64) - 1, choices))
+
+
+def decode_ranking(ranking):
+    """Return the tuple of choices of an SQLite ranking BLOB."""
+    choices = []
+    pos = 0
+    end = len(ranking)
+    while pos < end:
+        if ranking[pos] == LARGE_CHOICE_MARKER:
+            choices.append(_LARGE_CHOICE.unpack_from(ranking, pos)[1])
+            pos += _LARGE_CHOICE.size
+        else:
+            choices.append(ranking[pos] << 8 | ranking[pos + 1])
+            pos += 2
+    return tuple(choices)
+
+
+class SQLiteBallotsResource(streams.StreamResourceMixin):
+
+    """A ballots resource backed by an SQLite database file.
+
+    The ballots are stored in a table with one row per distinct ranking,
+    whose weight is the total weight of the ballots with that ranking.
+    Duplicate rankings are thus combined as they are added, and reading
+    yields the ballots in normalized form.  Many processes can read the
+    file at the same time.
+    """
+
+    # The number of rows per executemany() call when adding ballots.
+    write_batch_size = 50000
+    # The number of rows fetched at a time when reading.
+    read_batch_size = 10000
+
+    def __init__(self, path):
+        """
+        Arguments:
+          path: the path to the database file.  The file is created when
+            the ballots are first written.
+        """
+        self.path = path
+
+    def repr_info(self):
+        return "path=%r" % (self.path, )
+
+    @classmethod  # must be applied "last" (i.e. top-most).
+    @contextmanager
+    def temp(cls):
+        """Return a context manager that yields a temporary resource."""
+        with tempfile.TemporaryDirectory() as dir_path:
+            yield cls(os.path.join(dir_path, "ballots.sqlite"))
+
+    def _connect(self, read_only=False):
+        if read_only:
+            # The URI form lets the file be opened read-only.  as_uri()
+            # escapes characters like "?" and "#" in the path.
+            uri = pathlib.Path(self.path).resolve().as_uri() + "?mode=ro"
+            connection = sqlite3.connect(uri, uri=True)
+        else:
+            connection = sqlite3.connect(self.path)
+            # Write-ahead logging lets readers proceed during writes.
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS ballots "
+                               "(ranking BLOB PRIMARY KEY, weight INTEGER NOT NULL) "
+                               "WITHOUT ROWID")
+        return closing(connection)
+
+    def _query_value(self, sql):
+        if not os.path.exists(self.path):
+            return 0
+        with self._connect(read_only=True) as connection:
+            return connection.execute(sql).fetchone()[0]
+
+    def count(self):
+        """Return the number of distinct rankings."""
+        return self._query_value("SELECT COUNT(*) FROM ballots")
+
+    def count_ballots(self):
+        return self._query_value("SELECT COALESCE(SUM(weight), 0) FROM ballots")
+
+    def normalize(self):
+        # Ballots are always stored in normalized form.
+        pass
+
+    def clear(self):
+        with self._connect() as connection:
+            with connection:
+                connection.execute("DELETE FROM ballots")
+
+    def _add_batch(self, connection, batch):
+        """Add a dict mapping ranking to weight in one transaction."""
+        with connection:
+            connection.executemany(
+                "INSERT INTO ballots (ranking, weight) VALUES (?, ?) "
+                "ON CONFLICT(ranking) DO UPDATE SET weight = weight + excluded.weight",
+                batch.items())
+
+    def add_ballots(self, ballots):
+        """Add an iterable of ballots to the ballots already stored."""
+        batch_size = self.write_batch_size
+        with self._connect() as connection:
+            batch = {}
+            for weight, choices in ballots:
+                ranking = encode_ranking(choices)
+                # Combine duplicates within the batch before inserting.
+                batch[ranking] = batch.get(ranking, 0) + weight
+                if len(batch) >= batch_size:
+                    self._add_batch(connection, batch)
+                    batch = {}
+            if batch:
+                self._add_batch(connection, batch)
+
+    def _iter_ballots(self, cursor):
+        fetchmany = cursor.fetchmany
+        unpackers = {}
+        while True:
+            rows = fetchmany()
+            if not rows:
+                break
+            for ranking, weight in rows:
+                if b"\xff" in ranking:
+                    # Then the ranking may have a large choice.
+                    yield weight, decode_ranking(ranking)
+                    continue
+                length = len(ranking)
+                try:
+                    unpack = unpackers[length]
+                except KeyError:
+                    unpack = unpackers[length] = struct.Struct(">%dH" % (length // 2)).unpack
+                yield weight, unpack(ranking)
+
+    @contextmanager
+    def reading(self):
+        if not os.path.exists(self.path):
+            yield iter(())
+            return
+        with self._connect(read_only=True) as connection:
+            cursor = connection.cursor()
+            cursor.arraysize = self.read_batch_size
+            cursor.execute("SELECT ranking, weight FROM ballots ORDER BY ranking")
+            gen = self._iter_ballots(cursor)
+            try:
+                yield gen
+            finally:
+                gen.close()
+                cursor.close()
+
+    @contextmanager
+    def writing(self):
+        """Return a context manager that yields a generator to send ballots to.
+
+        If the with block raises, the ballots written so far are removed.
+        """
+        self.clear()
+        batch = []
+        gen = self._adder(batch)
+        try:
+            yield gen
+        except BaseException:
+            gen.close()
+            # Roll back the batches already added.
+            self.clear()
+            raise
+        gen.close()
+        self.add_ballots(batch)
+
+    @contextmanager
+    def batch_writing(self):
+        self.clear()
+        yield self.add_ballots
+
+    @utils.coroutine
+    def _adder(self, batch):
+        """Add the ballots sent in batches, leaving the last batch in batch."""
+        while True:
+            batch.append((yield))
+            if len(batch) >= self.write_batch_size:
+                self.add_ballots(batch)
+                del batch[:]
+
+
 class CandidatesInfo(object):
 
     """Represents the collection of candidates."""
@@ -136,25 +512,29 @@ class ContestInput(ReprMixin):
         order of their ballot ID.
       name: contest name.
       seat_count: integer number of winners.
+      withdrawn: a list of the numbers of the withdrawn candidates.
     """
 
     # We include an underscore at the end of id_ since id() is a built-in.
     # TODO: test defaults -- especially properties of default ballots resource.
     # TODO: instead make seat_count part of the "rules".
     def __init__(self, name=None, notes=None, candidates=None, seat_count=None,
-                 ballots_resource=None):
+                 ballots_resource=None, withdrawn=None):
         if ballots_resource is None:
             ballots_resource = streams.NullStreamResource()
         if candidates is None:
             candidates = []
         if seat_count is None:
             seat_count = 1
+        if withdrawn is None:
+            withdrawn = []
 
         self.ballots_resource = ballots_resource
         self.candidates = candidates
         self.name = name
         self.notes = notes
         self.seat_count = seat_count
+        self.withdrawn = withdrawn
 
     def repr_info(self):
         return "name=%r" % (self.name, )
@@ -168,6 +548,10 @@ class ContestInput(ReprMixin):
         """Return an iterable of the candidate numbers."""
         return make_candidate_numbers(len(self.candidates))
 
+    def get_running_numbers(self):
+        """Return a set of the numbers of the candidates who did not withdraw."""
+        return set(self.get_candidate_numbers()) - set(self.withdrawn)
+
     @property
     def should_normalize_ballots(self):
         # Default to normalizing.
@@ -200,10 +584,16 @@ class RoundResults(object):
 
 class ContestResults(ReprMixin):
 
-    """Represents contest results."""
+    """Represents contest results.
+
+    Attributes:
+      partial: whether the results are reduced (e.g. some rounds were not
+        counted to the end, so their totals are missing).
+    """
 
-    def __init__(self, outcome=None, rounds=None):
+    def __init__(self, outcome=None, rounds=None, partial=False):
         self.outcome = outcome
+        self.partial = partial
         self.rounds = rounds
 
     def repr_info(self):
@@ -20,9 +20,14 @@
 # DEALINGS IN THE SOFTWARE.
 #
 
+from collections import Counter
+from functools import partial
+from itertools import chain
 import logging
 import os
+import re
 
+from openrcv.formats.blt import is_withdrawn_line, BLT_ENCODING
 from openrcv.formats.internal import to_internal_ballot
 from openrcv.models import ContestInput
 from openrcv import utils
@@ -45,14 +50,18 @@ class Parser(object):
     # TODO: consider moving this into StreamInfo by creating a method
     # to return an iterator object over lines -- perhaps by implementing
     # the iterator protocol.
-    def iter_lines(self, f):
+    def iter_lines(self, f, start=1):
         """
         Return an iterator over the lines of an input file.
 
         Each iteration sets self.line and self.line_no.
 
+        Arguments:
+          start: the line number of the first line.
+
         """
-        for line_no, line in enumerate(iter(f), start=1):
+        line_no = start - 1
+        for line_no, line in enumerate(iter(f), start=start):
             self.line = line
             self.line_no = line_no
             yield line
@@ -64,6 +73,14 @@ class Parser(object):
     def parse_lines(self, lines):
         raise NotImplementedError()
 
+    def parse_stream(self, f):
+        """
+        Arguments:
+          f: a file-like object.
+
+        """
+        self.parse_lines(self.iter_lines(f))
+
     def parse_file(self, f):
         """
         Arguments:
@@ -71,9 +88,8 @@ class Parser(object):
 
         """
         with time_it("parser: %s" % (self.name, )):
-            lines = self.iter_lines(f)
             try:
-                self.parse_lines(lines)
+                self.parse_stream(f)
             except:
                 raise ParsingError("error while parsing line %d: %r" %
                                    (self.line_no, self.line))
@@ -135,24 +151,37 @@ class BLTParser(Parser):
             ballot_count = self._parse_ballot_lines(lines, f)
         return ballot_count
 
-    def parse_lines(self, lines):
-        info = ContestInput()
-        self.info = info
+    def parse_header(self, lines):
+        """Parse the header lines, and return (candidate_count, ballot_line).
+
+        The line of withdrawn candidates is optional (see
+        is_withdrawn_line()).  If it is left out, ballot_line is the line
+        read after the first line, which is the first ballot line, and
+        otherwise ballot_line is None.
+        """
+        info = self.info
 
         # First line.
         candidate_count, seat_count = self.parse_next_line_ints(lines)
         info.seat_count = seat_count
 
         # Withdrawn candidates.
-        withdraw_numbers = self.parse_next_line_ints(lines)
         withdrawn = []
-        for number in withdraw_numbers:
+        info.withdrawn = withdrawn
+        line = next(lines, None)
+        if line is None:
+            return candidate_count, None
+        if not is_withdrawn_line(line):
+            return candidate_count, line
+        for number in parse_integer_line(line):
             assert number < 0
             withdrawn.append(-1 * number)
-        info.withdrawn = withdrawn
 
-        ballot_count = self.parse_ballot_lines(lines)
-        info.ballot_count = ballot_count
+        return candidate_count, None
+
+    def parse_trailer(self, lines, candidate_count):
+        """Parse the lines after the ballots."""
+        info = self.info
 
         # Read candidate list.
         candidates = []
@@ -167,3 +196,188 @@ class BLTParser(Parser):
         for line in lines:
             if line.strip():
                 raise ValueError("the BLT has non-empty lines at the end")
+
+    def parse_lines(self, lines):
+        self.info = ContestInput()
+        candidate_count, ballot_line = self.parse_header(lines)
+        if ballot_line is not None:
+            lines = chain([ballot_line], lines)
+        self.info.ballot_count = self.parse_ballot_lines(lines)
+        self.parse_trailer(lines, candidate_count)
+
+
+class ChunkedBLTParser(BLTParser):
+
+    """A BLT parser that parses the ballot lines in large chunks.
+
+    Instead of handling one line at a time, this parser reads the input
+    in chunks of chunk_size characters (or bytes) and converts each chunk
+    of ballot lines to internal ballots in bulk, parsing each distinct
+    ballot line only once.  Errors still report the exact line number.
+
+    The input can be opened in text or binary mode.  Binary input is
+    decoded using BLT_ENCODING.
+
+    If a ballots resource is given, the ballots are written to it
+    instead of to an internal ballot file.  Identical ballot lines in a
+    chunk are then combined into a single ballot by adding their weights.
+    """
+
+    name = "BLT (ballot, chunked)"
+
+    chunk_size = 1 << 20
+
+    # Matches the line ending the ballots (i.e. a line with weight 0).
+    _end_pattern = r"^[ \t]*0+(?![0-9])"
+    _end_patterns = {
+        str: re.compile(_end_pattern, re.MULTILINE),
+        bytes: re.compile(_end_pattern.encode('ascii'), re.MULTILINE),
+    }
+
+    def __init__(self, output_info=None, chunk_size=None, ballots_resource=None):
+        """
+        Arguments:
+          output_info: see BLTParser.
+          chunk_size: the number of characters (or bytes) to read at a time.
+          ballots_resource: a ballots resource to which to write the
+            ballots (e.g. a BallotTrie).  If given, output_info is not used.
+
+        """
+        super().__init__(output_info)
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+        self.ballots_resource = ballots_resource
+
+    def iter_chunks(self, f):
+        read = f.read
+        chunk_size = self.chunk_size
+        while True:
+            chunk = read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def _to_text(self, data):
+        if isinstance(data, bytes):
+            return data.decode(BLT_ENCODING)
+        return data
+
+    def _parse_ballot_line(self, line):
+        ints = tuple(map(int, line.split()))
+        return ints[0], ints[1:-1]
+
+    def _to_internal_line(self, line):
+        return to_internal_ballot(self._parse_ballot_line(line)) + "\n"
+
+    def _raise_line_error(self, lines):
+        """Set the line attributes to the first bad ballot line, and raise."""
+        for line_no, line in enumerate(lines, start=self.line_no + 1):
+            self.line_no, self.line = line_no, self._to_text(line)
+            self._parse_ballot_line(line)
+        # This should not happen.
+        raise ValueError("no bad ballot line found")
+
+    def _write_ballot_lines(self, lines, f):
+        """Write a list of complete ballot lines as internal ballots."""
+        # Ballot lines repeat a lot, so parse each distinct line only once.
+        to_internal_line = self._to_internal_line
+        parsed = {}
+        try:
+            for line in set(lines):
+                parsed[line] = to_internal_line(line)
+        except (IndexError, ValueError):
+            self._raise_line_error(lines)
+        f.write("".join([parsed[line] for line in lines]))
+        self.line_no += len(lines)
+
+    def _send_ballot_lines(self, lines, gen):
+        """Send a list of complete ballot lines to a ballots generator."""
+        parse_ballot_line = self._parse_ballot_line
+        try:
+            ballots = [(parse_ballot_line(line), count) for line, count in
+                       Counter(lines).items()]
+        except (IndexError, ValueError):
+            self._raise_line_error(lines)
+        send = gen.send
+        for (weight, choices), count in ballots:
+            send((weight * count, choices))
+        self.line_no += len(lines)
+
+    def _parse_ballot_chunks(self, buf, chunks, handle_lines):
+        """Handle the ballots, and return the ballot count and remaining data.
+
+        Arguments:
+          buf: the data read after the header lines.
+          chunks: an iterator over the rest of the input.
+          handle_lines: a function that accepts a list of complete
+            ballot lines.
+
+        """
+        newline = "\n" if isinstance(buf, str) else b"\n"
+        end_pattern = self._end_patterns[type(buf)]
+        ballot_count = 0
+        while True:
+            chunk = next(chunks, None)
+            if chunk is None:
+                complete_end = len(buf)
+            else:
+                # Only search the complete lines, since a chunk can end
+                # in the middle of a line.
+                complete_end = buf.rfind(newline) + 1
+            match = end_pattern.search(buf, 0, complete_end)
+            block_end = complete_end if match is None else match.start()
+            lines = buf[:block_end].split(newline)
+            if not lines[-1]:
+                # Remove the empty string after the last newline.
+                lines.pop()
+            handle_lines(lines)
+            ballot_count += len(lines)
+            rest = buf[block_end:]
+            if chunk is None:
+                return ballot_count, rest
+            if match is not None:
+                return ballot_count, rest + chunk
+            buf = rest + chunk
+
+    def _iter_text_lines(self, data, chunks, start):
+        """Return an iterator over the remaining lines as text."""
+        # Join before decoding, since a chunk can end inside a character.
+        data = self._to_text(data + data[:0].join(chunks))
+        return self.iter_lines(data.splitlines(), start=start)
+
+    def parse_stream(self, f):
+        self.info = ContestInput()
+        self.line_no = 0
+        self.line = None
+        chunks = self.iter_chunks(f)
+        buf = next(chunks, "")
+        newline = "\n" if isinstance(buf, str) else b"\n"
+        # Read until the buffer contains the two header lines.
+        while buf.count(newline) < 2:
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            buf += chunk
+        parts = buf.split(newline, 2)
+        header_lines = self.iter_lines([self._to_text(part) for part in parts[:2]])
+        candidate_count, ballot_line = self.parse_header(header_lines)
+        rest = parts[2] if len(parts) > 2 else buf[:0]
+        if ballot_line is not None:
+            # Then the second line is the first ballot line.
+            rest = newline.join(parts[1:])
+            self.line_no = 1
+
+        if self.ballots_resource is None:
+            with self.output_info.open("w") as output:
+                handle_lines = partial(self._write_ballot_lines, f=output)
+                ballot_count, rest = self._parse_ballot_chunks(rest, chunks, handle_lines)
+        else:
+            with self.ballots_resource.writing() as gen:
+                handle_lines = partial(self._send_ballot_lines, gen=gen)
+                ballot_count, rest = self._parse_ballot_chunks(rest, chunks, handle_lines)
+        self.info.ballot_count = ballot_count
+
+        # Skip the line ending the ballots.
+        lines = self._iter_text_lines(rest, chunks, start=self.line_no + 1)
+        next(lines, None)
+        self.parse_trailer(lines, candidate_count)
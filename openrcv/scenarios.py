@@ -0,0 +1,218 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+"""Support for exploring every outcome of an IRV contest.
+
+Tabulator.count() stops when it meets a tie for last place.  The
+ScenarioExplorer class instead follows every way of breaking each such
+tie, as well as scenarios in which some candidates withdraw.
+
+An IRV count is fully determined by the set of eliminated candidates,
+so the reachable states form a directed acyclic graph whose nodes are
+frozensets of eliminated candidates.  The round totals and the outcomes
+reachable from each node are cached, so that branches sharing a history
+(e.g. "eliminate A then B" and "eliminate B then A") are counted only
+once.  Withdrawn candidates are treated the same as eliminated ones, so
+withdrawal scenarios share the same cache.
+"""
+
+import logging
+
+from openrcv import models
+from openrcv.counting import get_lowest, get_winner
+from openrcv.utils import ReprMixin
+
+
+log = logging.getLogger(__name__)
+
+
+class ScenarioOutcome(ReprMixin):
+
+    """A distinct outcome reachable by some sequence of tie breaks.
+
+    Attributes:
+      elimination_order: one list of candidates, in elimination order,
+        leading to the outcome.
+      path_count: the number of distinct sequences of tie breaks leading
+        to the outcome.
+      winner: the winning candidate number, or None if no candidates remain.
+    """
+
+    def __init__(self, winner, path_count, elimination_order):
+        self.elimination_order = elimination_order
+        self.path_count = path_count
+        self.winner = winner
+
+    def repr_info(self):
+        return "winner=%r, paths=%d" % (self.winner, self.path_count)
+
+
+class ScenarioResults(ReprMixin):
+
+    """The outcomes of exploring one scenario.
+
+    Attributes:
+      outcomes: a list of ScenarioOutcome objects, ordered by winner.
+      tie_states: a list of the states (frozensets of eliminated
+        candidates) reached from the scenario that have a tie for last place.
+      withdrawn: a frozenset of the withdrawn candidates.
+    """
+
+    def __init__(self, outcomes, tie_states, withdrawn):
+        self.outcomes = outcomes
+        self.tie_states = tie_states
+        self.withdrawn = withdrawn
+
+    def repr_info(self):
+        return "outcomes=%d, ties=%d" % (len(self.outcomes), len(self.tie_states))
+
+    @property
+    def winners(self):
+        return [outcome.winner for outcome in self.outcomes]
+
+
+class ScenarioExplorer(object):
+
+    """Explores the reachable elimination states of an IRV contest.
+
+    The ballots are read only once, into a BallotTrie.
+
+    Attributes:
+      tabulation_count: the number of times round totals were computed
+        (i.e. the number of distinct states visited).
+    """
+
+    def __init__(self, contest):
+        """
+        Arguments:
+          contest: a ContestInput object.
+        """
+        ballots_resource = contest.ballots_resource
+        if not isinstance(ballots_resource, models.BallotTrie):
+            ballots_resource = models.BallotTrie.build(ballots_resource)
+        self.candidate_numbers = frozenset(contest.get_candidate_numbers())
+        self.contest = contest
+        self.tabulation_count = 0
+        self.trie = ballots_resource
+        # Dicts keyed by the frozenset of eliminated candidates.
+        self._outcomes = {}
+        self._totals = {}
+
+    def get_totals(self, eliminated):
+        """Return the round totals after the given candidates are eliminated.
+
+        Arguments:
+          eliminated: a frozenset of candidate numbers.
+        """
+        try:
+            return self._totals[eliminated]
+        except KeyError:
+            pass
+        totals = self.trie.tabulate(self.candidate_numbers - eliminated)
+        self.tabulation_count += 1
+        self._totals[eliminated] = totals
+        return totals
+
+    def _get_state_outcomes(self, eliminated):
+        """Return the outcomes reachable from the given state.
+
+        Returns a dict mapping winner to a (path_count, elimination_order)
+        pair, where elimination_order is a tuple.
+        """
+        try:
+            return self._outcomes[eliminated]
+        except KeyError:
+            pass
+        remaining = self.candidate_numbers - eliminated
+        if len(remaining) <= 1:
+            # Then the last candidate (if any) wins, even without votes.
+            winner = next(iter(remaining)) if remaining else None
+            outcomes = {winner: (1, ())}
+        else:
+            totals = self.get_totals(eliminated)
+            winner = get_winner(totals)
+            if winner is not None:
+                outcomes = {winner: (1, ())}
+            else:
+                outcomes = {}
+                for candidate in sorted(get_lowest(totals)):
+                    state = eliminated | {candidate}
+                    for winner, (count, order) in self._get_state_outcomes(state).items():
+                        try:
+                            old_count, old_order = outcomes[winner]
+                        except KeyError:
+                            outcomes[winner] = count, (candidate, ) + order
+                        else:
+                            outcomes[winner] = old_count + count, old_order
+        self._outcomes[eliminated] = outcomes
+        return outcomes
+
+    def _find_tie_states(self, start):
+        """Return the states with a tie reachable from the given state."""
+        tie_states = []
+        seen = set()
+        stack = [start]
+        while stack:
+            eliminated = stack.pop()
+            if eliminated in seen:
+                continue
+            seen.add(eliminated)
+            if len(self.candidate_numbers - eliminated) <= 1:
+                continue
+            totals = self.get_totals(eliminated)
+            if get_winner(totals) is not None:
+                continue
+            lowest = get_lowest(totals)
+            if len(lowest) > 1:
+                tie_states.append(eliminated)
+            stack.extend(eliminated | {candidate} for candidate in lowest)
+        return sorted(tie_states, key=lambda state: (len(state), sorted(state)))
+
+    def explore(self, withdrawn=None):
+        """Explore every tie-break branch, and return a ScenarioResults object.
+
+        Arguments:
+          withdrawn: an iterable of the numbers of candidates who withdrew
+            before the count.
+        """
+        start = frozenset(() if withdrawn is None else withdrawn)
+        outcomes = [ScenarioOutcome(winner, count, list(order)) for winner, (count, order)
+                    in self._get_state_outcomes(start).items()]
+        # Sort None (no winner) first.
+        outcomes.sort(key=lambda outcome: (outcome.winner is not None, outcome.winner or 0))
+        results = ScenarioResults(outcomes, tie_states=self._find_tie_states(start),
+                                  withdrawn=start)
+        log.info("explored scenario: withdrawn=%r: %d outcome(s), %d states counted so far" %
+                 (sorted(start), len(outcomes), self.tabulation_count))
+        return results
+
+    def explore_withdrawals(self, candidates=None):
+        """Explore the scenario of each candidate withdrawing on their own.
+
+        Returns a dict mapping candidate number to ScenarioResults object.
+
+        Arguments:
+          candidates: an iterable of candidate numbers.  Defaults to all.
+        """
+        if candidates is None:
+            candidates = sorted(self.candidate_numbers)
+        return {candidate: self.explore(withdrawn=[candidate]) for candidate in candidates}
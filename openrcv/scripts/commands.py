@@ -22,16 +22,19 @@
 
 """Contains the functions for each rcv command-line command."""
 
+from concurrent.futures import as_completed, ProcessPoolExecutor
 from contextlib import contextmanager
 import logging
 import os
 from textwrap import dedent
 import sys
+import timeit
 
 import yaml
 
-from openrcv import (contestgen, counting, jcmanage, jcmodels, jsonlib, models, streams)
-from openrcv.formats import internal, jscase
+from openrcv import (contestgen, conversion, counting, jcmanage, jcmodels, jsonlib, margins,
+                     models, streams)
+from openrcv.formats import index, internal, jscase
 from openrcv.models import ContestInput
 from openrcv.utils import logged_open, PathInfo, StringInfo
 
@@ -47,22 +50,157 @@ def temp_ballots_resource():
         yield ballots_resource
 
 
+def _count_contest(blt_path, jobs=None, arithmetic=None):
+    """Count a contest, and return a (jsobj, seconds) pair.
+
+    This function is called in worker processes, so it returns the JSON
+    object rather than the (larger) ContestResults object.
+    """
+    start_time = timeit.default_timer()
+    results = counting.count_blt_path(blt_path, jobs=jobs, arithmetic=arithmetic)
+    jsobj = jcmodels.JsonCaseTestOutput.from_model(results).to_jsobj()
+    return jsobj, timeit.default_timer() - start_time
+
+
+def _iter_counted_contests(blt_paths, jobs, split=True, arithmetic=None):
+    """Count the given contests, and yield (index, jsobj, seconds) as
+    each finishes.
+
+    The contests are counted concurrently by a pool of worker processes,
+    largest file first, so that the total time approaches the time of
+    the largest contest rather than the sum.  A single contest is instead
+    counted with jobs worker processes of its own if split is true.
+
+    Multi-seat contests are counted using STV with the given arithmetic.
+    """
+    if jobs <= 1 or len(blt_paths) <= 1:
+        contest_jobs = jobs if split else None
+        for contest_index, blt_path in enumerate(blt_paths):
+            jsobj, seconds = _count_contest(blt_path, jobs=contest_jobs,
+                                            arithmetic=arithmetic)
+            yield contest_index, jsobj, seconds
+        return
+    indices = sorted(range(len(blt_paths)), key=lambda i: os.path.getsize(blt_paths[i]),
+                     reverse=True)
+    max_workers = min(jobs, len(blt_paths))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_count_contest, blt_paths[contest_index],
+                                   arithmetic=arithmetic): contest_index
+                   for contest_index in indices}
+        for future in as_completed(futures):
+            jsobj, seconds = future.result()
+            yield futures[future], jsobj, seconds
+
+
 # TODO: finish removing references to ns in this module.
 #  This will decouple the argparse definitions from these functions.
-# TODO: unit-test this.
-def count(ns, stdout=None):
+def count(ns, stdout=None, stderr=None):
+    """Count every contest in a contests configuration file.
+
+    The results of each contest are written to stdout as soon as the
+    contest finishes (so not necessarily in file order), as one compact
+    JSON object per line (i.e. JSON Lines).  A timing summary is written
+    to stderr at the end.
+
+    If ns.jobs is None, the contests are counted concurrently by one
+    worker process per CPU, but a single contest is not split across
+    processes.
+
+    Contests with more than one seat are counted using STV, with the
+    arithmetic named by ns.arithmetic (see stv.make_arithmetic()).
+    """
+    if stdout is None:
+        stdout = sys.stdout
+    if stderr is None:
+        stderr = sys.stderr
     input_path = ns.input_path
     with logged_open(input_path) as f:
-        config = yaml.load(f)
+        config = yaml.safe_load(f)
     # TODO: use a common pattern for accessing config values.
     base_dir = os.path.dirname(input_path)
     config = config['openrcv']
     contests = config['contests']
-    contest = contests[0]
-    blt_path = os.path.join(base_dir, contest['file'])
-    results = counting.count_irv(blt_path)
-    json_results = jcmodels.JsonTestCaseOutput.from_contest_results(results)
-    print(json_results.to_json())
+    blt_paths = [os.path.join(base_dir, contest['file']) for contest in contests]
+
+    jobs = ns.jobs
+    # Splitting a single contest only pays off for large contests, so it
+    # is done only if requested.
+    split = jobs is not None
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    start_time = timeit.default_timer()
+    timings = []
+    counted = _iter_counted_contests(blt_paths, jobs=jobs, split=split,
+                                     arithmetic=ns.arithmetic)
+    for contest_index, jsobj, seconds in counted:
+        contest_file = contests[contest_index]['file']
+        log.info("counted contest %d: %s (%.4f seconds)" %
+                 (contest_index + 1, contest_file, seconds))
+        jsobj['_meta'] = {'file': contest_file}
+        stdout.write("".join(jsonlib.iter_json(jsobj, compact=True)) + "\n")
+        stdout.flush()
+        timings.append((seconds, contest_file))
+    elapsed = timeit.default_timer() - start_time
+
+    stderr.write("timing summary (%d contests, %d jobs):\n" % (len(timings), jobs))
+    for seconds, contest_file in sorted(timings, reverse=True):
+        stderr.write("  %9.4f  %s\n" % (seconds, contest_file))
+    stderr.write("  %9.4f  (total: %.4f wall clock)\n" %
+                 (sum(seconds for seconds, contest_file in timings), elapsed))
+
+
+def compute_margin(blt_path, time_limit=None):
+    """Compute the margin of victory of the IRV contest in a BLT file.
+
+    Returns the results as a JSON string.
+    """
+    with counting.read_blt_contest(blt_path) as contest:
+        results = margins.compute_irv_margin(contest, time_limit=time_limit)
+        candidates = contest.make_candidates_info()
+    order = results.elimination_order
+    jsobj = {
+        'winner': None if results.winner is None else candidates.from_number(results.winner),
+        'margin': results.margin,
+        'lower_bound': results.lower_bound,
+        'upper_bound': results.upper_bound,
+        'elimination_order': None if order is None else candidates.from_numbers(order),
+        'seconds': round(results.seconds, 4),
+    }
+    return jsonlib.to_json(jsobj) + "\n"
+
+
+def build_index(ballots_path, interval=None):
+    """Build the sidecar offset index of an internal or BLT ballot file.
+
+    Returns a summary as a string.
+    """
+    ballot_index = index.build_ballot_index(ballots_path, interval=interval)
+    return ("indexed %d ballots (total weight %d): %s\n" %
+            (ballot_index.ballot_count, ballot_index.total_weight,
+             index.get_index_path(ballots_path)))
+
+
+def convert_ballots(input_path, format_cls, output_dir=None, input_format=None,
+                    normalize=False, stdout=None, stderr=None):
+    """Convert a ballot file to another format.
+
+    The throughput summary is returned along with the output paths if
+    writing to files.  Otherwise, it is written to stderr so as not to
+    mix with the converted data on stdout.
+    """
+    if stderr is None:
+        stderr = sys.stderr
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    stats = conversion.convert_contest(input_path, format_cls, output_dir=output_dir,
+                                       input_format=input_format, normalize=normalize,
+                                       stdout=stdout)
+    summary = stats.summary() + "\n"
+    if not output_dir:
+        stderr.write(summary)
+        return None
+    return summary + "".join(path + "\n" for path in stats.output_paths)
 
 
 def make_random_contest(ballot_count, candidate_count, format_cls,
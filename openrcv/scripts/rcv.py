@@ -29,10 +29,14 @@ import logging
 import os
 import textwrap
 
+from openrcv.formats.binary import BinaryFormat
 from openrcv.formats.blt import BLTFormat
+from openrcv.formats.csvranks import CSVRanksFormat
+from openrcv.formats.index import DEFAULT_INTERVAL as DEFAULT_INDEX_INTERVAL
 from openrcv.formats.internal import InternalFormat
-from openrcv import jcmanage
-from openrcv.formats.jscase import JsonCaseFormat
+from openrcv import conversion, jcmanage, stv
+from openrcv.formats.jscase import CompactJsonCaseFormat, JsonCaseFormat
+from openrcv.formats.npz import NpzFormat
 from openrcv.scripts.argparse import (parse_log_level, ArgParser, HelpAction,
                                       HelpRequested, Option, UsageException)
 from openrcv.scripts import commands
@@ -73,9 +77,13 @@ OPTION_JSON_LOCATION = Option(('-j', '--json-location'),
 OPTION_OUTPUT_DIR = Option(('-o', '--output-dir'), "OUTPUT_DIR")
 OPTION_OUTPUT_FORMAT = Option(('-f', '--output-format'), "OUTPUT_FORMAT")
 
+OUTPUT_FORMAT_BINARY = 'binary'
 OUTPUT_FORMAT_BLT = 'blt'
+OUTPUT_FORMAT_CSV = 'csv'
 OUTPUT_FORMAT_INTERNAL = 'internal'
+OUTPUT_FORMAT_NPZ = 'npz'
 OUTPUT_FORMAT_TEST = 'jscase'
+OUTPUT_FORMAT_TEST_COMPACT = 'jscase-compact'
 # TODO: default to OpenRCV format.
 OUTPUT_FORMAT_DEFAULT = OUTPUT_FORMAT_BLT
 
@@ -96,12 +104,20 @@ The tests directory defaults to the path "{path}" inside the submodule.
 
 def make_output_formats():
     formats = (
+        OutputFormat(OUTPUT_FORMAT_BINARY, cls=BinaryFormat,
+                     desc="binary OpenRCV ballot format"),
         OutputFormat(OUTPUT_FORMAT_BLT, cls=BLTFormat,
                      desc="BLT format"),
+        OutputFormat(OUTPUT_FORMAT_CSV, cls=CSVRanksFormat,
+                     desc="CSV with one column per rank"),
         OutputFormat(OUTPUT_FORMAT_INTERNAL, cls=InternalFormat,
                      desc="internal OpenRCV format"),
+        OutputFormat(OUTPUT_FORMAT_NPZ, cls=NpzFormat,
+                     desc="NumPy arrays, requires NumPy"),
         OutputFormat(OUTPUT_FORMAT_TEST, cls=JsonCaseFormat,
                      desc="JSON test case"),
+        OutputFormat(OUTPUT_FORMAT_TEST_COMPACT, cls=CompactJsonCaseFormat,
+                     desc="JSON test case without indentation"),
     )
     mapping = {format.label: format for format in formats}
     return mapping
@@ -146,6 +162,9 @@ def create_argparser(prog="rcv"):
     builder = ArgBuilder(formats)
 
     builder.add_command(subparsers, CountCommand)
+    builder.add_command(subparsers, MarginCommand)
+    builder.add_command(subparsers, IndexCommand)
+    builder.add_command(subparsers, ConvertCommand)
 
     group = subparsers.add_parser_group("Test-case management")
     classes = (
@@ -338,18 +357,135 @@ class CountCommand(CommandBase):
 
     help_details = """\
     Tally the contests specified by the contests file at INPUT_PATH.
+    The results of each contest are written to stdout as soon as the
+    contest finishes, as one JSON object per line, and a timing summary
+    is written to stderr.  A contest with more than one seat is counted
+    using STV, and any other contest using IRV.
     """
 
     def add_arguments(self, parser):
         parser.add_argument('input_path', metavar='INPUT_PATH',
             help=("path to a contests configuration file. Supported file "
                   "formats are JSON (*.json) and YAML (*.yaml or *.yml)."))
+        parser.add_argument('--jobs', dest='jobs', metavar='N', type=int,
+                            help=('number of worker processes.  Contests are counted '
+                                  'concurrently, largest first, and a single contest '
+                                  'is split across the workers.  Defaults to the '
+                                  'number of CPUs, in which case a single contest '
+                                  'is not split.'))
+        parser.add_argument('--arithmetic', metavar='NAME',
+                            choices=sorted(stv.ARITHMETIC_CLASSES),
+                            help=('the arithmetic for counting contests with more '
+                                  'than one seat using STV: "fixed" (integers scaled '
+                                  'to 9 decimal places) or "fraction" (exact).  '
+                                  'Defaults to "%s".' % stv.ARITHMETIC_DEFAULT))
 
     @property
     def func(self):
         return commands.count
 
 
+class MarginCommand(CommandBase):
+
+    name = "margin"
+
+    help = "Compute the margin of victory of an IRV contest."
+
+    help_details = """\
+    Compute the smallest number of ballots in the BLT file at INPUT_PATH
+    whose rankings would need to change for a different candidate to
+    win.  If the time limit is reached, lower and upper bounds are
+    reported instead.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('input_path', metavar='INPUT_PATH',
+            help="path to a BLT file.")
+        parser.add_argument('--time-limit', dest='time_limit', metavar='SECONDS',
+                            type=float,
+                            help=("number of seconds after which to stop searching "
+                                  "and report the best bounds found.  Defaults to "
+                                  "no limit."))
+
+    def func(self, ns, stdout):
+        return commands.compute_margin(ns.input_path, time_limit=ns.time_limit)
+
+
+class IndexCommand(CommandBase):
+
+    name = "index"
+
+    help = "Build the offset index of a ballot file."
+
+    help_details = """\
+    Write a sidecar index next to the internal or BLT ballot file at
+    INPUT_PATH (at INPUT_PATH plus ".idx").  The index records the byte
+    offset of every Nth ballot, the ballot count, and the total weight,
+    so that these can be found without reading the whole file.  Paths
+    ending in ".blt" are treated as BLT files.  With an index, "rcv count
+    --jobs" has each worker process read its own part of a BLT file.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('input_path', metavar='INPUT_PATH',
+            help="path to an uncompressed ballot file.")
+        parser.add_argument('--interval', metavar='N', type=int,
+                            help=("number of ballots between indexed ballots. "
+                                  "Defaults to %d." % DEFAULT_INDEX_INTERVAL))
+
+    def func(self, ns, stdout):
+        return commands.build_index(ns.input_path, interval=ns.interval)
+
+
+class ConvertCommand(CommandBase):
+
+    name = "convert"
+
+    help = "Convert a ballot file to another format."
+
+    @property
+    def help_details(self):
+        return """\
+            This command reads the ballots at INPUT_PATH and writes them in
+            the format specified by {output_format}.  The ballots are streamed
+            from the input to the output rather than loaded into memory.  The
+            input format is detected from the file extension unless provided.
+
+            The data is written to stdout unless {output_dir} is provided, in
+            which case the paths to the output files are written to stdout.
+            A summary of the ballot and byte throughput is also reported.
+            """.format(output_format=OPTION_OUTPUT_FORMAT.metavar,
+                       output_dir=OPTION_OUTPUT_DIR.metavar)
+
+    def add_arguments(self, parser):
+        formats = self.formats
+        parser.add_argument('input_path', metavar='INPUT_PATH',
+            help="path to a ballot file.")
+        parser.add_argument(*OPTION_OUTPUT_DIR.flags, metavar=OPTION_OUTPUT_DIR.metavar,
+            help=("directory to write output files to.  If the empty string, "
+                  "writes to stdout."))
+        labels = sorted(formats)
+        list_desc = ", ".join((str(formats[label]) for label in labels))
+        parser.add_argument(*OPTION_OUTPUT_FORMAT.flags, metavar=OPTION_OUTPUT_FORMAT.metavar,
+            type=self.writer_type, default=OUTPUT_FORMAT_DEFAULT,
+            help=('the output format.  Choose from: {!s}. Defaults to: "{!s}".'
+                  .format(list_desc, OUTPUT_FORMAT_DEFAULT)))
+        parser.add_argument('--input-format', metavar='FORMAT',
+            choices=conversion.INPUT_FORMATS,
+            help=('the input format.  Choose from: {!s}.  Defaults to detecting '
+                  'the format from the file extension.'
+                  .format(", ".join(conversion.INPUT_FORMATS))))
+        parser.add_argument('--normalize', action='store_true',
+            help=("whether to normalize the ballots while converting.  The ballots "
+                  "are normalized through a temporary SQLite database."))
+
+    def func(self, ns, stdout):
+        return commands.convert_ballots(ns.input_path, format_cls=ns.output_format,
+                                        output_dir=ns.output_dir,
+                                        input_format=ns.input_format,
+                                        normalize=ns.normalize, stdout=stdout)
+
+
 class RandContestCommand(CommandBase):
 
     name = "randcontest"
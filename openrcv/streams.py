@@ -103,8 +103,10 @@ TODO: decide whether we need to inherit from StreamResourceBase.
 
 import contextlib
 from contextlib import contextmanager
+from functools import partial
 from io import StringIO
 import logging
+import os
 import tempfile
 
 from openrcv import utils
@@ -113,6 +115,9 @@ from openrcv.utils import logged_open, NoImplementation, ReprMixin
 
 log = logging.getLogger(__name__)
 
+# The number of items per batch when writing with write_many().
+WRITE_BATCH_SIZE = 10000
+
 
 def tracked(source, iterable):
     """Return a "tracking" generator over the items in the given stream.
@@ -171,6 +176,36 @@ class StreamResourceMixin(ReprMixin):
         """
         raise NoImplementation(self)
 
+    @contextmanager
+    def batch_writing(self):
+        """Return a context manager that yields a batch-writing function.
+
+        The function accepts a sequence of items and writes them.  Like
+        writing(), this clears the contents of the backing store.  This
+        default implementation sends the items to writing()'s generator
+        one at a time, so subclasses should override it where the backing
+        store can write a batch more cheaply.
+        """
+        with self.writing() as gen:
+            send = gen.send
+
+            def write_batch(items):
+                for item in items:
+                    send(item)
+
+            yield write_batch
+
+    def write_many(self, items, batch_size=None):
+        """Replace the contents of the resource with the items of an iterable.
+
+        The items are written a batch at a time using batch_writing().
+        """
+        if batch_size is None:
+            batch_size = WRITE_BATCH_SIZE
+        with self.batch_writing() as write_batch:
+            for batch in utils.iter_batches(items, batch_size):
+                write_batch(batch)
+
     # TODO: test this.
     def count(self):
         """Return the number of elements in the stream."""
@@ -265,6 +300,12 @@ class StreamResourceBase(StreamResourceMixin):
     def write(self, f, item):
         raise NoImplementation(self)
 
+    def write_batch(self, f, items):
+        """Write a sequence of items to a stream returned by open_write()."""
+        write = self.write
+        for item in items:
+            write(f, item)
+
     @contextmanager
     def open_write(self):
         raise NoImplementation(self)
@@ -312,6 +353,13 @@ class StreamResourceBase(StreamResourceMixin):
             finally:
                 gen.close()
 
+    @contextmanager
+    def batch_writing(self):
+        """See StreamResourceMixin.batch_writing()."""
+        log.debug("opening for batch writing: %r" % self)
+        with self.open_write() as stream:
+            yield partial(self.write_batch, stream)
+
 
 # TODO: add more to the repr and test.
 class ListResource(StreamResourceBase):
@@ -369,6 +417,9 @@ class ListResource(StreamResourceBase):
     def write(self, target, item):
         target.append(item)
 
+    def write_batch(self, target, items):
+        target.extend(items)
+
     @contextmanager
     def open_write(self):
         # Delete the contents of the list (analogous to deleting a file).
@@ -379,11 +430,21 @@ class ListResource(StreamResourceBase):
 # TODO: add more to the repr and test.
 class FilePathResource(StreamResourceBase):
 
-    """A stream resource backed by a file."""
+    """A stream resource backed by a file.
+
+    The file can be compressed (see utils.logged_open()).
+    """
 
-    def __init__(self, path, encoding=None, **kwargs):
+    def __init__(self, path, encoding=None, compression=None, **kwargs):
+        """
+        Arguments:
+          compression: the compression argument to utils.logged_open()
+            (e.g. utils.COMPRESSION_EXTENSION).  Defaults to no
+            compression.
+        """
         if encoding is None:
             encoding = 'ascii'
+        self.compression = compression
         self.path = path
         self.encoding = encoding
         self.kwargs = kwargs
@@ -392,9 +453,14 @@ class FilePathResource(StreamResourceBase):
     def make_temp(cls):
         return tempfile.SpooledTemporaryFile(encoding=self.encoding)
 
+    def is_compressed(self):
+        """Return whether reading the file decompresses it."""
+        return utils.get_compression(self.path, compression=self.compression) is not None
+
     @contextmanager
     def _open(self, mode):
-        with logged_open(self.path, mode, encoding=self.encoding, **self.kwargs) as f:
+        with logged_open(self.path, mode, encoding=self.encoding,
+                         compression=self.compression, **self.kwargs) as f:
             yield f
 
     def open_read(self):
@@ -403,9 +469,40 @@ class FilePathResource(StreamResourceBase):
     def write(self, f, item):
         f.write(item)
 
+    def write_batch(self, f, items):
+        f.writelines(items)
+
     def open_write(self):
         return self._open("w")
 
+    def byte_ranges(self, count):
+        """Split the file into at most count line-aligned byte ranges.
+
+        Returns a list of (start, end) pairs of byte offsets.  Each range
+        starts at the beginning of a line and ends just after a newline
+        (or at the end of the file).  Ranges are not empty.
+
+        Arguments:
+          count: the desired number of ranges.
+        """
+        if self.is_compressed():
+            raise ValueError("cannot split a compressed file: %s" % self.path)
+        size = os.path.getsize(self.path)
+        offsets = [0]
+        with logged_open(self.path, "rb", compression=False) as f:
+            for i in range(1, count):
+                target = size * i // count
+                if target <= offsets[-1]:
+                    continue
+                # Advance to the start of the next line.
+                f.seek(target - 1)
+                f.readline()
+                offset = f.tell()
+                if offsets[-1] < offset < size:
+                    offsets.append(offset)
+        offsets.append(size)
+        return [(start, end) for start, end in zip(offsets, offsets[1:]) if start < end]
+
 
 class _ReadWriteFileBase(StreamResourceBase):
 
@@ -437,6 +534,9 @@ class _ReadWriteFileBase(StreamResourceBase):
     def write(self, f, item):
         f.write(item)
 
+    def write_batch(self, f, items):
+        f.writelines(items)
+
     @contextmanager
     def open_write(self):
         self._open()
@@ -545,6 +645,9 @@ class StandardResource(StreamResourceBase):
     def write(self, f, item):
         f.write(item)
 
+    def write_batch(self, f, items):
+        f.writelines(items)
+
     def open_write(self):
         return self._open()
 
@@ -588,6 +691,9 @@ class StringResource(StreamResourceBase):
     def write(self, f, item):
         f.write(item)
 
+    def write_batch(self, f, items):
+        f.writelines(items)
+
     @contextmanager
     def open_write(self):
         # TODO: confirm that the contents get deleted.
@@ -635,6 +741,9 @@ class WrapperResource(WrappedResourceMixin):
     def writing(self):
         return self.resource.writing()
 
+    def batch_writing(self):
+        return self.resource.batch_writing()
+
 
 class Converter(object):
 
@@ -644,6 +753,11 @@ class Converter(object):
     def to_resource(self, item):
         raise NoImplementation(self)
 
+    def to_resource_many(self, items):
+        """Convert a sequence of items, and return a list."""
+        to_resource = self.to_resource
+        return [to_resource(item) for item in items]
+
 
 class ConvertingResource(WrappedResourceMixin):
 
@@ -677,3 +791,14 @@ class ConvertingResource(WrappedResourceMixin):
                 yield new_gen
             finally:
                 new_gen.close()
+
+    @contextmanager
+    def batch_writing(self):
+        converter = self.converter
+        try:
+            convert_many = converter.to_resource_many
+        except AttributeError:
+            # Then the converter does not inherit from Converter.
+            convert_many = partial(Converter.to_resource_many, converter)
+        with self.resource.batch_writing() as write_batch:
+            yield lambda items: write_batch(convert_many(items))
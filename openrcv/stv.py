@@ -0,0 +1,275 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+"""Support for counting multi-seat contests using STV.
+
+This module implements the single transferable vote with a Droop quota
+and surplus transfers by the (weighted inclusive) Gregory method.  When
+a candidate is elected with a surplus, every ballot on the candidate's
+pile is transferred at a fraction of its current value, namely the
+surplus divided by the candidate's total.
+
+Like PileTabulator, the tabulator keeps each ballot on the pile of the
+candidate it currently counts for.  Surplus transfers and eliminations
+examine only the ballots on one candidate's pile.
+
+Ballot values are handled by an "arithmetic" object so that the number
+representation can be chosen.  The default represents values as integers
+scaled by a fixed power of ten (truncating transfer values to that many
+decimal places), which avoids doing Fraction arithmetic on every ballot.
+"""
+
+from fractions import Fraction
+import logging
+
+from openrcv import models
+from openrcv.counting import deal_to_piles, get_lowest
+from openrcv.models import ContestResults, RoundResults
+
+
+log = logging.getLogger(__name__)
+
+ARITHMETIC_FIXED = 'fixed'
+ARITHMETIC_FRACTION = 'fraction'
+ARITHMETIC_DEFAULT = ARITHMETIC_FIXED
+
+
+def get_droop_quota(total, seat_count):
+    """Return the Droop quota for the given total and number of seats."""
+    return total // (seat_count + 1) + 1
+
+
+class FixedPointArithmetic(object):
+
+    """Represents ballot values as integers scaled by a power of ten.
+
+    Transfer values are truncated to the given number of decimal places,
+    and transferred ballot values are truncated in the same way.
+    """
+
+    name = ARITHMETIC_FIXED
+
+    def __init__(self, places=9):
+        self.places = places
+        self.scale = 10 ** places
+
+    def from_weight(self, weight):
+        return weight * self.scale
+
+    def transfer_value(self, surplus, total):
+        return surplus * self.scale // total
+
+    def transfer(self, value, transfer_value):
+        return value * transfer_value // self.scale
+
+    def to_number(self, value):
+        """Convert a value to an int or Fraction for reporting."""
+        number = Fraction(value, self.scale)
+        return number.numerator if number.denominator == 1 else number
+
+
+class FractionArithmetic(object):
+
+    """Represents ballot values exactly using Fraction objects."""
+
+    name = ARITHMETIC_FRACTION
+
+    def from_weight(self, weight):
+        return Fraction(weight)
+
+    def transfer_value(self, surplus, total):
+        return Fraction(surplus, total)
+
+    def transfer(self, value, transfer_value):
+        return value * transfer_value
+
+    def to_number(self, value):
+        return value.numerator if value.denominator == 1 else value
+
+
+ARITHMETIC_CLASSES = {cls.name: cls for cls in (FixedPointArithmetic, FractionArithmetic)}
+
+
+def make_arithmetic(arithmetic=None):
+    """Return an arithmetic object.
+
+    Arguments:
+      arithmetic: an arithmetic object, the name of an arithmetic class,
+        or None for the default.
+    """
+    if arithmetic is None:
+        arithmetic = ARITHMETIC_DEFAULT
+    if isinstance(arithmetic, str):
+        try:
+            cls = ARITHMETIC_CLASSES[arithmetic]
+        except KeyError:
+            raise ValueError("unknown arithmetic: %r (choose from: %s)" %
+                             (arithmetic, ", ".join(sorted(ARITHMETIC_CLASSES))))
+        arithmetic = cls()
+    return arithmetic
+
+
+def count_stv_contest(contest, arithmetic=None):
+    """Tabulate a contest using STV, and return a ContestResults object.
+
+    Arguments:
+      contest: a ContestInput object.  The number of seats to fill is
+        contest.seat_count.
+      arithmetic: see make_arithmetic().
+    """
+    tabulator = STVTabulator(contest, arithmetic=arithmetic)
+    return tabulator.count()
+
+
+class STVTabulator(object):
+
+    def __init__(self, contest, arithmetic=None):
+        """
+        Arguments:
+          contest: a ContestInput object.
+          arithmetic: see make_arithmetic().
+        """
+        self.contest = contest
+        self.arithmetic = make_arithmetic(arithmetic)
+
+    def deal(self, ballots):
+        """Place ballots on the piles of their top continuing choice.
+
+        Arguments:
+          ballots: an iterable of (value, choices, start) 3-tuples, where
+            start is the index of the first choice to examine.
+        """
+        deal_to_piles(ballots, self.continuing, self.piles, self.totals)
+
+    def _start_piles(self):
+        from_weight = self.arithmetic.from_weight
+        with self.contest.ballots_resource.reading() as ballots:
+            self.deal((from_weight(weight), choices, 0) for weight, choices in ballots)
+
+    def transfer_surplus(self, candidate):
+        """Transfer the surplus of an elected candidate.
+
+        Returns whether there was a surplus to transfer.
+        """
+        arithmetic = self.arithmetic
+        total = self.totals[candidate]
+        surplus = total - self.quota
+        pile = self.piles.pop(candidate)
+        self.totals[candidate] = self.quota
+        if surplus <= 0:
+            return False
+        transfer_value = arithmetic.transfer_value(surplus, total)
+        transfer = arithmetic.transfer
+        # Ballots tend to share a small number of distinct values, so we
+        # compute each transferred value only once.
+        new_values = {}
+        def transferred(pile):
+            for value, choices, start in pile:
+                try:
+                    new_value = new_values[value]
+                except KeyError:
+                    new_value = new_values[value] = transfer(value, transfer_value)
+                yield new_value, choices, start
+        self.deal(transferred(pile))
+        return True
+
+    def eliminate(self, candidate):
+        """Eliminate a candidate, and transfer the ballots at their value."""
+        self.continuing.remove(candidate)
+        del self.totals[candidate]
+        self.deal(self.piles.pop(candidate))
+
+    def make_round(self, candidates_info):
+        to_number = self.arithmetic.to_number
+        totals = {number: to_number(total) for number, total in self.totals.items()}
+        return RoundResults(candidates_info=candidates_info, totals=totals)
+
+    def elect(self, candidates):
+        """Elect the given candidates in order of their totals."""
+        totals = self.totals
+        # Sort by decreasing total, breaking ties by candidate number.
+        candidates = sorted(candidates, key=lambda c: (-totals[c], c))
+        for candidate in candidates:
+            self.continuing.remove(candidate)
+            self.elected.append(candidate)
+        return candidates
+
+    def count(self):
+        contest = self.contest
+        seat_count = contest.seat_count
+        candidates_info = contest.make_candidates_info()
+        candidate_numbers = contest.get_running_numbers()
+
+        self.continuing = set(candidate_numbers)
+        self.elected = []
+        self.piles = {number: [] for number in candidate_numbers}
+        self.totals = {number: 0 for number in candidate_numbers}
+        self._start_piles()
+
+        # The initial values are whole weights, so this is an integer.
+        valid_total = self.arithmetic.to_number(sum(self.totals.values()))
+        self.quota = self.arithmetic.from_weight(get_droop_quota(valid_total, seat_count))
+        log.info("STV quota: %s (seats=%d)" %
+                 (self.arithmetic.to_number(self.quota), seat_count))
+
+        outcome = models.ContestOutcome()
+        # Elected candidates whose surplus has not yet been transferred.
+        pending = []
+        rounds = []
+        while True:
+            round_results = self.make_round(candidates_info)
+            rounds.append(round_results)
+            totals = self.totals
+            reached = [c for c in self.continuing if totals[c] >= self.quota]
+            newly_elected = self.elect(reached)
+            pending.extend(newly_elected)
+            seats_left = seat_count - len(self.elected)
+            if 0 < seats_left and len(self.continuing) <= seats_left:
+                # Then every continuing candidate can be elected.
+                newly_elected.extend(self.elect(self.continuing.copy()))
+            if newly_elected:
+                round_results.elected = newly_elected
+            if len(self.elected) >= seat_count or not self.continuing:
+                break
+
+            transferred = False
+            while pending and not transferred:
+                # Transfer the largest surplus first.
+                candidate = max(pending, key=lambda c: (totals[c], -c))
+                pending.remove(candidate)
+                transferred = self.transfer_surplus(candidate)
+            if transferred:
+                continue
+
+            last_place = get_lowest({c: totals[c] for c in self.continuing})
+            if len(last_place) > 1:
+                # Then there is a tie.
+                outcome.tied_last_place = last_place
+                break
+            candidate, = last_place
+            round_results.eliminated = [candidate]
+            self.eliminate(candidate)
+
+        outcome.elected = self.elected
+        outcome.last_round = len(rounds)
+        results = ContestResults(outcome=outcome, rounds=rounds)
+        return results
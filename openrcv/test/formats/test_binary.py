@@ -0,0 +1,211 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+from io import BytesIO, StringIO
+import os
+from tempfile import TemporaryDirectory
+
+from openrcv.formats.binary import (decode_varint, encode_ballot, encode_varint,
+                                    write_binary_ballots, BinaryBallotsResource,
+                                    BinaryFormat, BinaryFormatError, make_header, HEADER)
+from openrcv.models import ContestInput
+from openrcv.streams import ListResource
+from openrcv.utils import COMPRESSION_EXTENSION
+from openrcv.utiltest.helpers import UnitCase
+
+
+BALLOTS = [
+    (1, (2, )),
+    (300, (3, 1)),
+    (2, ()),
+    (1, (1, 2, 3)),
+]
+
+
+class ModuleTest(UnitCase):
+
+    def test_varint(self):
+        cases = [
+            (0, b"\x00"),
+            (1, b"\x01"),
+            (127, b"\x7f"),
+            (128, b"\x80\x01"),
+            (300, b"\xac\x02"),
+            (2 ** 40, b"\x80\x80\x80\x80\x80\x20"),
+        ]
+        for value, data in cases:
+            with self.subTest(value=value):
+                self.assertEqual(encode_varint(value), data)
+                self.assertEqual(decode_varint(b"x" + data, 1), (value, len(data) + 1))
+
+    def test_encode_varint__negative(self):
+        with self.assertRaises(BinaryFormatError):
+            encode_varint(-1)
+
+    def test_encode_ballot__too_large(self):
+        for choice_size, choice in ((1, 256), (2, 0x10000)):
+            with self.subTest(choice_size=choice_size):
+                with self.assertRaises(BinaryFormatError):
+                    encode_ballot((1, (2, choice)), choice_size)
+
+    def test_write_binary_ballots__too_many_candidates(self):
+        with self.assertRaises(BinaryFormatError):
+            write_binary_ballots(BytesIO(), ListResource([(1, (2, 0x10000))]))
+
+    def test_write_binary_ballots(self):
+        f = BytesIO()
+        write_binary_ballots(f, ListResource(BALLOTS), candidate_count=3)
+        data = f.getvalue()
+        self.assertEqual(data[:4], b"ORCB")
+        # Five bytes of weights (300 takes two), four of choice counts,
+        # and six choices.
+        self.assertEqual(len(data), HEADER.size + 5 + 4 + 6)
+
+    def test_write_binary_ballots__one_pass(self):
+        """Check that the ballots are read once, seekable output or not."""
+        class OnePassResource(ListResource):
+            read_count = 0
+
+            def open_read(self):
+                self.read_count += 1
+                return super().open_read()
+
+        class UnseekableBytesIO(BytesIO):
+            def seekable(self):
+                return False
+
+        outputs = []
+        for f in (BytesIO(), UnseekableBytesIO()):
+            with self.subTest(f=f):
+                resource = OnePassResource(BALLOTS)
+                write_binary_ballots(f, resource, candidate_count=3)
+                self.assertEqual(resource.read_count, 1)
+                outputs.append(f.getvalue())
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[0][:HEADER.size],
+                         make_header(3, len(BALLOTS), sum(w for w, choices in BALLOTS)))
+
+
+class BinaryBallotsResourceTest(UnitCase):
+
+    def check_round_trip(self, ballots, candidate_count=None, choice_size=1):
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "ballots.bin")
+            resource = BinaryBallotsResource(path, candidate_count=candidate_count)
+            with resource.writing() as gen:
+                for ballot in ballots:
+                    gen.send(ballot)
+            with resource.reading() as gen:
+                self.assertEqual(list(gen), ballots)
+            header = resource.read_header()
+            self.assertEqual(header.choice_size, choice_size)
+            self.assertEqual(resource.count(), len(ballots))
+            self.assertEqual(resource.count_ballots(), sum(w for w, choices in ballots))
+            return header
+
+    def test_round_trip(self):
+        header = self.check_round_trip(BALLOTS, candidate_count=3)
+        self.assertEqual(header.candidate_count, 3)
+
+    def test_write_many(self):
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "ballots.bin")
+            resource = BinaryBallotsResource(path)
+            resource.write_many(BALLOTS, batch_size=2)
+            with resource.reading() as gen:
+                self.assertEqual(list(gen), BALLOTS)
+            header = resource.read_header()
+        self.assertEqual(header.ballot_count, len(BALLOTS))
+        self.assertEqual(header.total_weight, sum(w for w, choices in BALLOTS))
+
+    def test_round_trip__uint16(self):
+        ballots = [(1, (300, 2)), (5, (1000, ))]
+        self.check_round_trip(ballots, candidate_count=1000, choice_size=2)
+
+    def test_round_trip__no_candidate_count(self):
+        header = self.check_round_trip(BALLOTS, choice_size=2)
+        self.assertEqual(header.candidate_count, 3)
+
+    def test_round_trip__compressed(self):
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "ballots.bin.gz")
+            resource = BinaryBallotsResource(path, candidate_count=3,
+                                             compression=COMPRESSION_EXTENSION)
+            with resource.writing() as gen:
+                for ballot in BALLOTS:
+                    gen.send(ballot)
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(2), b"\x1f\x8b")
+            self.assertEqual(resource.count(), 4)
+            with resource.reading() as gen:
+                self.assertEqual(list(gen), BALLOTS)
+
+    def test_round_trip__empty(self):
+        self.check_round_trip([], candidate_count=3)
+
+    def test_reading_raw(self):
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "ballots.bin")
+            with open(path, "wb") as f:
+                write_binary_ballots(f, ListResource(BALLOTS), candidate_count=3)
+            resource = BinaryBallotsResource(path)
+            with resource.reading_raw() as gen:
+                actual = [(weight, bytes(view)) for weight, view in gen]
+        self.assertEqual(actual, [(1, b"\x02"), (300, b"\x03\x01"), (2, b""),
+                                  (1, b"\x01\x02\x03")])
+
+    def test_reading__errors(self):
+        cases = [
+            (b"", "empty"),
+            (b"ORCB", "too short"),
+            (b"XXXX" + bytes(HEADER.size - 4), "magic"),
+            # A record claiming two choices, with only one present.
+            (HEADER.pack(b"ORCB", 1, 1, 3, 1, 1) + b"\x01\x02\x01", "truncated"),
+            (HEADER.pack(b"ORCB", 1, 1, 3, 1, 1) + b"\x81", "truncated"),
+        ]
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "ballots.bin")
+            for data, message in cases:
+                with self.subTest(data=data):
+                    with open(path, "wb") as f:
+                        f.write(data)
+                    with self.assertRaises(BinaryFormatError) as cm:
+                        with BinaryBallotsResource(path).reading() as gen:
+                            list(gen)
+                    self.assertIn(message, str(cm.exception))
+
+
+class BinaryFormatTest(UnitCase):
+
+    def test_write_contest(self):
+        contest = ContestInput(candidates=["A", "B", "C"],
+                               ballots_resource=ListResource(BALLOTS))
+        with TemporaryDirectory() as dir_path:
+            paths = BinaryFormat().write_contest(contest, output_dir=dir_path)
+            self.assertEqual(paths, [os.path.join(dir_path, "ballots.bin")])
+            with BinaryBallotsResource(paths[0]).reading() as gen:
+                self.assertEqual(list(gen), BALLOTS)
+
+    def test_write_contest__text_stdout(self):
+        contest = ContestInput(candidates=["A"], ballots_resource=ListResource(BALLOTS))
+        with self.assertRaises(BinaryFormatError):
+            BinaryFormat().write_contest(contest, stdout=StringIO())
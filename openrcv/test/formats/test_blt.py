@@ -20,9 +20,13 @@
 # DEALINGS IN THE SOFTWARE.
 #
 
+import os
+from tempfile import TemporaryDirectory
 from textwrap import dedent
 
-from openrcv.formats.blt import BLTFileWriter
+from openrcv.formats.blt import (read_blt_ballots_range, BLTFileWriter,
+                                 IndexedBLTBallotsResource)
+from openrcv.formats.index import build_ballot_index
 from openrcv.models import ContestInput
 from openrcv.streams import ListResource, StringResource
 from openrcv.utiltest.helpers import UnitCase
@@ -54,3 +58,54 @@ class BLTFileWriterTest(UnitCase):
         "Foo\"
         """)
         self.assertEqual(resource.contents, expected)
+
+    def test__withdrawn(self):
+        contest = ContestInput(name="Foo", candidates=['A', 'B', 'C'], withdrawn=[1, 3],
+                               ballots_resource=ListResource([(1, (2, ))]))
+        resource = StringResource()
+        BLTFileWriter(resource).write_contest(contest)
+        self.assertEqual(resource.contents.splitlines()[:3], ["3 1", "-1 -3", "1 2 0"])
+
+    def test__no_name(self):
+        contest = ContestInput(candidates=['A', 'B'], ballots_resource=ListResource([]))
+        resource = StringResource()
+        BLTFileWriter(resource).write_contest(contest)
+        self.assertEqual(resource.contents.splitlines()[-1], '""')
+
+
+class IndexedBLTBallotsResourceTest(UnitCase):
+
+    BALLOTS = [(i % 3 + 1, tuple(range(1, i % 4 + 1))) for i in range(7)]
+
+    def write_blt(self, dir_path):
+        path = os.path.join(dir_path, "contest.blt")
+        with open(path, "w") as f:
+            f.write("3 1\n-2\n")
+            for weight, choices in self.BALLOTS:
+                f.write(" ".join(map(str, (weight, ) + choices + (0, ))) + "\n")
+            f.write('0\n"A"\n"B"\n"C"\n"Foo"\n')
+        return path
+
+    def test_reading(self):
+        with TemporaryDirectory() as dir_path:
+            path = self.write_blt(dir_path)
+            index = build_ballot_index(path, interval=3)
+            resource = IndexedBLTBallotsResource(path, index)
+            with resource.reading() as gen:
+                self.assertEqual(list(gen), self.BALLOTS)
+            for number in range(len(self.BALLOTS) + 1):
+                with self.subTest(number=number):
+                    with resource.reading_from(number) as gen:
+                        self.assertEqual(list(gen), self.BALLOTS[number:])
+        self.assertEqual(resource.count(), 7)
+        self.assertEqual(resource.count_ballots(), sum(w for w, c in self.BALLOTS))
+
+    def test_byte_ranges(self):
+        with TemporaryDirectory() as dir_path:
+            path = self.write_blt(dir_path)
+            index = build_ballot_index(path, interval=2)
+            resource = IndexedBLTBallotsResource(path, index)
+            ballots = []
+            for start, end in resource.byte_ranges(3):
+                ballots.extend(read_blt_ballots_range(path, start, end))
+        self.assertEqual(ballots, self.BALLOTS)
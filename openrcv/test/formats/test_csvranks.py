@@ -0,0 +1,174 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+"""
+Tests of the CSV rank-column format.
+
+"""
+
+import csv
+import gzip
+from io import StringIO
+import os
+from tempfile import TemporaryDirectory
+
+from openrcv.formats.csvranks import (get_rank_columns, write_csv_ranks, CSVRanksFormat,
+                                      CSVRanksFormatError, CSVRanksReader)
+from openrcv.models import ContestInput
+from openrcv.streams import ListResource
+from openrcv.utiltest.helpers import UnitCase
+
+
+CSV_TEXT = """\
+BallotID,Precinct,Rank 1,Rank 2,Rank 3
+1,P1,Alice,Bob,
+2,P2,Bob,overvote,Alice
+3,P1,,Alice,undervote
+4,P2,Carol,Carol,Alice
+5,P1,Bob,Alice,
+"""
+
+
+def make_contest(ballots, candidates):
+    return ContestInput(candidates=candidates, ballots_resource=ListResource(ballots))
+
+
+class ModuleTest(UnitCase):
+
+    def test_get_rank_columns(self):
+        header = ["ID", "Rank 2", "choice 1", "Rank3", "Notes"]
+        self.assertEqual(get_rank_columns(header), [2, 1, 3])
+
+    def test_write_csv_ranks(self):
+        contest = make_contest([(2, (2, 1)), (1, ()), (1, (3, ))], ["A", "B, Jr.", "C"])
+        chunks = ListResource()
+        with chunks.writing() as gen:
+            write_csv_ranks(gen, contest, batch_size=2)
+        with chunks.reading() as gen:
+            chunks = list(gen)
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual("".join(chunks), (
+            'Weight,Rank 1,Rank 2,Rank 3\n'
+            '2,"B, Jr.",A,\n'
+            '1,,,\n'
+            '1,C,,\n'))
+
+    def test_write_csv_ranks__repeated_choices(self):
+        # The second ballot is also longer than the number of candidates.
+        cases = [[(1, (1, 1))], [(1, (1, )), (1, (1, 2, 1, 2))]]
+        for ballots in cases:
+            with self.subTest(ballots=ballots):
+                contest = make_contest(ballots, ["A", "B"])
+                chunks = ListResource()
+                with chunks.writing() as gen:
+                    with self.assertRaises(CSVRanksFormatError):
+                        write_csv_ranks(gen, contest)
+
+    def test_write_csv_ranks__unknown_choices(self):
+        # A choice of 0 would otherwise write the last candidate's name.
+        for choice in (0, 3, -1):
+            with self.subTest(choice=choice):
+                contest = make_contest([(1, (1, choice))], ["A", "B"])
+                chunks = ListResource()
+                with chunks.writing() as gen:
+                    with self.assertRaises(CSVRanksFormatError):
+                        write_csv_ranks(gen, contest)
+
+
+class CSVRanksReaderTest(UnitCase):
+
+    def test_iter_ballots(self):
+        reader = CSVRanksReader()
+        ballots = list(reader.iter_ballots(StringIO(CSV_TEXT)))
+        self.assertEqual(ballots, [
+            (1, (1, 2)),
+            (1, (2, )),
+            (1, (1, )),
+            (1, (3, 1)),
+            (1, (2, 1)),
+        ])
+        self.assertEqual(reader.candidates, ["Alice", "Bob", "Carol"])
+        self.assertEqual(reader.ballot_count, 5)
+
+    def test_iter_ballots__candidates(self):
+        reader = CSVRanksReader(candidates=["Carol", "Bob", "Alice"])
+        ballots = list(reader.iter_ballots(StringIO(CSV_TEXT)))
+        self.assertEqual(ballots[:2], [(1, (3, 2)), (1, (2, ))])
+
+    def test_iter_ballots__options(self):
+        text = "w,first,second\n3,A,X\n2,over,A\n1,B,\n"
+        reader = CSVRanksReader(rank_columns=["first", "second"], weight_column="w",
+                                overvote_markers=["OVER"], undervote_markers=["", "x"])
+        ballots = list(reader.iter_ballots(StringIO(text)))
+        self.assertEqual(ballots, [(3, (1, )), (2, ()), (1, (2, ))])
+
+    def test_iter_ballots__errors(self):
+        cases = [
+            ("", {}),
+            ("ID,Name\n1,A\n", {}),
+            ("Rank 1\nDave\n", {'candidates': ["Alice"]}),
+            ("Rank 1\nA\n", {'rank_columns': ["Rank 2"]}),
+            ("Weight,Rank 1\nx,A\n", {}),
+            ("Weight,Rank 1,Rank 2\n1,A,B\n1\n", {}),
+        ]
+        for text, kwargs in cases:
+            with self.subTest(text=text):
+                with self.assertRaises(CSVRanksFormatError):
+                    list(CSVRanksReader(**kwargs).iter_ballots(StringIO(text)))
+
+    def test_iter_ballots__error_in_first_row(self):
+        text = "Rank 1\n%s\n" % ("A" * (csv.field_size_limit() + 1))
+        with self.assertRaises(CSVRanksFormatError) as cm:
+            list(CSVRanksReader().iter_ballots(StringIO(text)))
+        self.assertIn("line 2", str(cm.exception))
+
+    def test_read_path__compressed(self):
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "ballots.csv.gz")
+            with gzip.open(path, "wt", encoding="utf-8", newline="") as f:
+                f.write(CSV_TEXT)
+            resource = ListResource()
+            self.assertEqual(CSVRanksReader().read_path(path, resource), 5)
+        with resource.reading() as ballots:
+            self.assertEqual(next(ballots), (1, (1, 2)))
+
+    def test_round_trip(self):
+        ballots = [(2, (2, 1)), (1, ()), (5, (3, 1, 2))]
+        candidates = ["Ann", "Béa, Jr.", "Cy \"C\""]
+        contest = make_contest(ballots, candidates)
+        with TemporaryDirectory() as dir_path:
+            paths = CSVRanksFormat().write_contest(contest, output_dir=dir_path)
+            self.assertEqual(paths, [os.path.join(dir_path, "ballots.csv")])
+            resource = ListResource()
+            reader = CSVRanksReader(candidates=candidates)
+            reader.read_path(paths[0], resource)
+        with resource.reading() as gen:
+            self.assertEqual(list(gen), ballots)
+
+    def test_round_trip__repeated_choices(self):
+        """Check that ballots that would not read back the same are rejected."""
+        candidates = ["A", "B"]
+        for choices in [(1, 2, 1, 2), (2, 2)]:
+            with self.subTest(choices=choices):
+                contest = make_contest([(1, (1, 2)), (1, choices)], candidates)
+                with TemporaryDirectory() as dir_path:
+                    with self.assertRaises(CSVRanksFormatError):
+                        CSVRanksFormat().write_contest(contest, output_dir=dir_path)
@@ -0,0 +1,155 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+"""
+Tests of the CVR JSON format.
+
+"""
+
+from io import BytesIO, StringIO
+import json
+import random
+
+from openrcv.formats.cvr import marks_to_choices, CVRFormatError, CVRReader
+from openrcv.streams import ListResource
+from openrcv.utiltest import cvrgen
+from openrcv.utiltest.helpers import UnitCase
+
+
+def make_cvr(sessions):
+    f = StringIO()
+    cvrgen.write_cvr(f, sessions)
+    return BytesIO(f.getvalue().encode('utf-8'))
+
+
+class ModuleTest(UnitCase):
+
+    def test_marks_to_choices(self):
+        cases = [
+            ([], ()),
+            ([(1, 3), (2, 1)], (3, 1)),
+            # Out of order.
+            ([(2, 1), (1, 3)], (3, 1)),
+            # Skipped rank.
+            ([(1, 3), (3, 1)], (3, 1)),
+            # Repeat ranking.
+            ([(1, 3), (2, 3), (3, 1)], (3, 1)),
+            # Overvote.
+            ([(1, 3), (2, 1), (2, 2), (3, 4)], (3, )),
+        ]
+        for marks, expected in cases:
+            with self.subTest(marks=marks):
+                self.assertEqual(marks_to_choices(marks), expected)
+
+
+class CVRReaderTest(UnitCase):
+
+    def test_iter_ballots(self):
+        sessions = [
+            cvrgen.make_session(1, {5: [30, 10]}),
+            cvrgen.make_session(2, {5: [20]}),
+            cvrgen.make_session(3, {5: []}),
+            cvrgen.make_session(4, {5: [10, (20, 30)]}),
+        ]
+        reader = CVRReader()
+        ballots = list(reader.iter_ballots(make_cvr(sessions)))
+        self.assertEqual(ballots, [(1, (1, 2)), (1, (3, )), (1, ()), (1, (2, ))])
+        self.assertEqual(reader.candidates, [30, 10, 20])
+        self.assertEqual(reader.contest_id, 5)
+        self.assertEqual(reader.ballot_count, 4)
+
+    def test_iter_ballots__modified(self):
+        sessions = [
+            cvrgen.make_session(1, {1: [30, 10]}, modified={1: [10]}),
+            cvrgen.make_session(2, {1: [20]}),
+        ]
+        ballots = list(CVRReader().iter_ballots(make_cvr(sessions)))
+        self.assertEqual(ballots, [(1, (1, )), (1, (2, ))])
+
+    def test_iter_ballots__ambiguous(self):
+        session = cvrgen.make_session(1, {1: [30, 10]})
+        session["Original"]["Cards"][0]["Contests"][0]["Marks"][0]["IsAmbiguous"] = True
+        reader = CVRReader()
+        self.assertEqual(list(reader.iter_ballots(make_cvr([session]))), [(1, (1, ))])
+        self.assertEqual(reader.candidates, [10])
+
+    def test_iter_ballots__no_cards(self):
+        """Check an export whose records have contests but no cards."""
+        session = cvrgen.make_session(1, {1: [30, 10]})
+        original = session["Original"]
+        original["Contests"] = original.pop("Cards")[0]["Contests"]
+        ballots = list(CVRReader().iter_ballots(make_cvr([session])))
+        self.assertEqual(ballots, [(1, (1, 2))])
+
+    def test_iter_ballots__contest_id(self):
+        sessions = [
+            cvrgen.make_session(1, {1: [30], 2: [40, 50]}),
+            cvrgen.make_session(2, {2: [50]}),
+        ]
+        ballots = list(CVRReader(contest_id=2).iter_ballots(make_cvr(sessions)))
+        self.assertEqual(ballots, [(1, (1, 2)), (1, (2, ))])
+
+    def test_iter_ballots__multiple_contests(self):
+        sessions = [cvrgen.make_session(1, {1: [30], 2: [40]})]
+        with self.assertRaises(CVRFormatError):
+            list(CVRReader().iter_ballots(make_cvr(sessions)))
+
+    def test_iter_ballots__errors(self):
+        cases = [
+            b'{"Version": "5.10"}',
+            b'{"Sessions": [{"Original": {"Contests": [{"Marks": []}]}}]}',
+            b'{"Sessions": [{"Original": {"Contests": [{"Id": 1, "Marks": [{"Rank": 1}]}]}}]}',
+            b'{"Sessions": [{"Original": {}}',
+        ]
+        for data in cases:
+            with self.subTest(data=data):
+                with self.assertRaises(CVRFormatError):
+                    list(CVRReader().iter_ballots(BytesIO(data)))
+
+    def test_iter_ballots__random(self):
+        """Check a generated export against json.load()."""
+        sessions = list(cvrgen.iter_random_sessions(200, [7, 8, 9, 10],
+                                                    modified_fraction=0.2,
+                                                    rng=random.Random(0)))
+        f = make_cvr(sessions)
+        expected = []
+        candidates = []
+        for session in json.loads(f.getvalue().decode('utf-8'))["Sessions"]:
+            record = session.get("Modified", session["Original"])
+            marks = record["Cards"][0]["Contests"][0]["Marks"]
+            choices = []
+            for mark in sorted(marks, key=lambda mark: mark["Rank"]):
+                candidate_id = mark["CandidateId"]
+                if candidate_id not in candidates:
+                    candidates.append(candidate_id)
+                choices.append(candidates.index(candidate_id) + 1)
+            expected.append((1, tuple(choices)))
+        reader = CVRReader(chunk_size=100, progress_interval=1000)
+        self.assertEqual(list(reader.iter_ballots(f)), expected)
+        self.assertEqual(reader.candidates, candidates)
+
+    def test_read(self):
+        sessions = [cvrgen.make_session(1, {1: [30, 10]}),
+                    cvrgen.make_session(2, {1: [10]})]
+        resource = ListResource()
+        self.assertEqual(CVRReader().read(make_cvr(sessions), resource), 2)
+        with resource.reading() as ballots:
+            self.assertEqual(list(ballots), [(1, (1, 2)), (1, (2, ))])
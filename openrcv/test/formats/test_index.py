@@ -0,0 +1,178 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+import os
+from tempfile import TemporaryDirectory
+
+from openrcv.formats.index import (build_ballot_index, get_index_path, BallotIndex,
+                                   BallotIndexError, FORMAT_BLT, FORMAT_INTERNAL)
+from openrcv.formats.internal import internal_ballots_resource, to_internal_ballot
+from openrcv.streams import FilePathResource
+from openrcv.utils import COMPRESSION_EXTENSION
+from openrcv.utiltest.helpers import UnitCase
+
+
+# Ballots whose lines have varying lengths.
+BALLOTS = [(i % 3 + 1, tuple(range(1, i % 5 + 1))) for i in range(25)]
+
+
+def write_internal(path, ballots):
+    with open(path, "w") as f:
+        for ballot in ballots:
+            f.write(to_internal_ballot(ballot) + "\n")
+
+
+def get_line_offsets(path):
+    offsets = []
+    offset = 0
+    with open(path, "rb") as f:
+        for line in f:
+            offsets.append(offset)
+            offset += len(line)
+    return offsets
+
+
+class BuildBallotIndexTest(UnitCase):
+
+    def test_internal(self):
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "ballots.txt")
+            write_internal(path, BALLOTS)
+            index = build_ballot_index(path, interval=10)
+            self.assertTrue(os.path.exists(get_index_path(path)))
+            line_offsets = get_line_offsets(path)
+            size = os.path.getsize(path)
+        self.assertEqual(index.file_format, FORMAT_INTERNAL)
+        self.assertEqual(index.ballot_count, 25)
+        self.assertEqual(index.total_weight, sum(w for w, c in BALLOTS))
+        self.assertEqual(index.offsets, [line_offsets[i] for i in (0, 10, 20)])
+        self.assertEqual(index.weights, [sum(w for w, c in BALLOTS[:i]) for i in (0, 10, 20)])
+        self.assertEqual(index.end, size)
+
+    def test_blt(self):
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "contest.blt")
+            with open(path, "w") as f:
+                f.write("2 1\n-2\n3 1 0\n1 2 1 0\n2 0\n0\n\"A\"\n\"B\"\n\"C\"\n")
+            index = build_ballot_index(path, interval=2)
+        self.assertEqual(index.file_format, FORMAT_BLT)
+        self.assertEqual(index.ballot_count, 3)
+        self.assertEqual(index.total_weight, 6)
+        self.assertEqual(index.offsets, [7, 21])
+        self.assertEqual(index.end, 25)
+
+    def test_blt__no_withdrawn_line(self):
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "contest.blt")
+            with open(path, "w") as f:
+                f.write("2 1\n3 1 0\n1 2 1 0\n2 0\n0\n\"A\"\n\"B\"\n\"C\"\n")
+            index = build_ballot_index(path, interval=2)
+        self.assertEqual(index.ballot_count, 3)
+        self.assertEqual(index.offsets, [4, 18])
+        self.assertEqual(index.end, 22)
+
+    def test_errors(self):
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "ballots.txt")
+            with open(path, "w") as f:
+                f.write("1 2\n\n")
+            with self.assertRaises(BallotIndexError) as cm:
+                build_ballot_index(path)
+            self.assertIn("byte 4 ", str(cm.exception))
+            path = os.path.join(dir_path, "ballots.txt.gz")
+            write_internal(path, BALLOTS)
+            resource = FilePathResource(path, compression=COMPRESSION_EXTENSION)
+            with resource.writing() as gen:
+                gen.send("1 2\n")
+            with self.assertRaises(BallotIndexError):
+                build_ballot_index(path)
+
+
+class BallotIndexTest(UnitCase):
+
+    def test_load(self):
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "ballots.txt")
+            self.assertIsNone(BallotIndex.load(path))
+            write_internal(path, BALLOTS)
+            index = build_ballot_index(path, interval=10)
+            loaded = BallotIndex.load(path)
+            self.assertEqual(loaded.to_jsobj(), index.to_jsobj())
+            self.assertIsNone(BallotIndex.load(path, file_format=FORMAT_BLT))
+            # Changing the ballot file makes the index stale.
+            with open(path, "a") as f:
+                f.write("1 2\n")
+            self.assertIsNone(BallotIndex.load(path))
+
+    def test_locate(self):
+        index = BallotIndex(FORMAT_INTERNAL, size=0, mtime_ns=0, interval=10,
+                            ballot_count=25, total_weight=25, offsets=[0, 40, 90],
+                            weights=[0, 10, 20], end=120)
+        cases = [
+            (0, (0, 0)),
+            (9, (0, 9)),
+            (10, (40, 0)),
+            (24, (90, 4)),
+        ]
+        for number, expected in cases:
+            with self.subTest(number=number):
+                self.assertEqual(index.locate(number), expected)
+        with self.assertRaises(BallotIndexError):
+            index.locate(25)
+
+    def test_byte_ranges(self):
+        index = BallotIndex(FORMAT_INTERNAL, size=0, mtime_ns=0, interval=10,
+                            ballot_count=25, total_weight=25, offsets=[0, 40, 90],
+                            weights=[0, 10, 20], end=120)
+        cases = [
+            (1, [(0, 120)]),
+            (2, [(0, 40), (40, 120)]),
+            (3, [(0, 40), (40, 90), (90, 120)]),
+            (10, [(0, 40), (40, 90), (90, 120)]),
+        ]
+        for count, expected in cases:
+            with self.subTest(count=count):
+                self.assertEqual(index.byte_ranges(count), expected)
+
+
+class IndexedInternalBallotsResourceTest(UnitCase):
+
+    def test_indexed(self):
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "ballots.txt")
+            write_internal(path, BALLOTS)
+            resource = internal_ballots_resource(FilePathResource(path))
+            self.assertIsNone(resource.load_index())
+            unindexed = (resource.count(), resource.count_ballots(), resource.byte_ranges(3))
+            build_ballot_index(path, interval=4)
+            self.assertIsNotNone(resource.load_index())
+            self.assertEqual(resource.count(), 25)
+            self.assertEqual(resource.count_ballots(), sum(w for w, c in BALLOTS))
+            self.assertEqual(unindexed[:2], (resource.count(), resource.count_ballots()))
+            byte_ranges = resource.byte_ranges(3)
+            self.assertEqual(len(byte_ranges), 3)
+            self.assertEqual(byte_ranges[0][0], 0)
+            self.assertEqual(byte_ranges[-1][1], os.path.getsize(path))
+            for number in (0, 3, 4, 13, 24, 25):
+                with self.subTest(number=number):
+                    with resource.reading_from(number) as gen:
+                        self.assertEqual(list(gen), BALLOTS[number:])
@@ -20,8 +20,16 @@
 # DEALINGS IN THE SOFTWARE.
 #
 
-from openrcv.formats.internal import internal_ballots_resource, parse_internal_ballot, to_internal_ballot
-from openrcv.streams import StringResource
+import os
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from openrcv.formats.internal import (get_internal_ballots_path, internal_ballots_resource, iter_internal_ballots_bytes,
+                                      parse_internal_ballot, read_internal_ballots_range,
+                                      to_internal_ballot, to_internal_lines,
+                                      InternalFormatError)
+from openrcv.streams import FilePathResource, StringResource
+from openrcv.utils import COMPRESSION_EXTENSION
 from openrcv.utiltest.helpers import UnitCase
 
 
@@ -81,6 +89,86 @@ class InternalBallotsResourceTest(UnitCase):
                 gen.send(ballot)
         self.assertEqual(resource.contents, "1 2\n2 3 1\n")
 
+    def test_write_many(self):
+        resource = StringResource()
+        ballots_resource = internal_ballots_resource(resource)
+        ballots_resource.write_many([(1, (2, )), (2, ()), (3, (3, 1))], batch_size=2)
+        self.assertEqual(resource.contents, "1 2\n2\n3 3 1\n")
+
+    def test_iter_internal_ballots_bytes(self):
+        cases = [
+            (b"", []),
+            (b"1 2\n", [(1, (2, ))]),
+            # A missing final newline and extra spaces are okay.
+            (b"1 2\n 2  3 1 \r\n3", [(1, (2, )), (2, (3, 1)), (3, ())]),
+        ]
+        for data, expected in cases:
+            with self.subTest(data=data):
+                self.assertEqual(list(iter_internal_ballots_bytes(data)), expected)
+
+    def test_iter_internal_ballots_bytes__blocks(self):
+        data = "".join("%d 1 2\n" % i for i in range(1, 100)).encode()
+        expected = [(i, (1, 2)) for i in range(1, 100)]
+        with patch('openrcv.formats.internal.PARSE_BLOCK_SIZE', 7):
+            actual = list(iter_internal_ballots_bytes(data))
+        self.assertEqual(actual, expected)
+
+    def test_iter_internal_ballots_bytes__error(self):
+        data = b"".join(b"1 2\n" for i in range(20)) + b"2 b 1\n1 2\n"
+        cases = [
+            (1, "line 21 (byte offset 80)"),
+            (None, "byte offset 80"),
+        ]
+        for first_line, location in cases:
+            with self.subTest(first_line=first_line):
+                with patch('openrcv.formats.internal.PARSE_BLOCK_SIZE', 10):
+                    with self.assertRaises(InternalFormatError) as cm:
+                        list(iter_internal_ballots_bytes(data, source="src",
+                                                         first_line=first_line))
+                self.assertEqual(str(cm.exception),
+                                 "invalid internal ballot at %s of src: b'2 b 1'" % location)
+
+    def test_iter_internal_ballots_bytes__blank_line(self):
+        with self.assertRaises(InternalFormatError) as cm:
+            list(iter_internal_ballots_bytes(b"1 2\n\n"))
+        self.assertIn("line 2 ", str(cm.exception))
+
+    def test_reading__file(self):
+        ballots = [(1, (2, )), (2, (3, 1)), (1, ())]
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "ballots.txt")
+            ballots_resource = internal_ballots_resource(FilePathResource(path))
+            with ballots_resource.writing() as gen:
+                for ballot in ballots:
+                    gen.send(ballot)
+            with ballots_resource.reading() as gen:
+                self.assertEqual(list(gen), ballots)
+            self.assertEqual(ballots_resource.count_ballots(), 4)
+            # Check reading a range (the last two lines).
+            self.assertEqual(read_internal_ballots_range(path, 4, 12), ballots[1:])
+
+    def test_reading__file_compressed(self):
+        ballots = [(1, (2, )), (2, (3, 1))]
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "ballots.txt.gz")
+            resource = FilePathResource(path, compression=COMPRESSION_EXTENSION)
+            ballots_resource = internal_ballots_resource(resource)
+            with ballots_resource.writing() as gen:
+                for ballot in ballots:
+                    gen.send(ballot)
+            self.assertIsNone(get_internal_ballots_path(ballots_resource))
+            with ballots_resource.reading() as gen:
+                self.assertEqual(list(gen), ballots)
+
+    def test_reading__file_empty(self):
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "ballots.txt")
+            open(path, "w").close()
+            ballots_resource = internal_ballots_resource(FilePathResource(path))
+            with ballots_resource.reading() as gen:
+                self.assertEqual(list(gen), [])
+
+
 class InternalModuleTest(UnitCase):
 
     def test_to_internal_ballot(self):
@@ -92,3 +180,4 @@ class InternalModuleTest(UnitCase):
         for ballot, expected in cases:
             with self.subTest(ballot=ballot, expected=expected):
                 self.assertEqual(to_internal_ballot(ballot), expected)
+                self.assertEqual(to_internal_lines([ballot]), [expected + "\n"])
@@ -0,0 +1,206 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+from io import BytesIO, StringIO, TextIOWrapper
+import os
+from tempfile import TemporaryDirectory
+import unittest
+from unittest.mock import patch
+import zipfile
+
+from openrcv.counting import NumpyTabulator, Tabulator
+from openrcv.formats import npz
+from openrcv.formats.npz import (ballots_to_arrays, iter_npz_ballots, load_npz_arrays,
+                                 NpzBallotsResource, NpzFormat, NpzFormatError)
+from openrcv.models import ContestInput
+from openrcv.streams import ListResource
+from openrcv.utiltest.helpers import UnitCase
+
+
+BALLOTS = [
+    (1, (2, )),
+    (300, (3, 1)),
+    (2, ()),
+    (1, (1, 2, 3)),
+]
+
+
+@unittest.skipIf(npz.numpy is None, "NumPy is not installed")
+class ModuleTest(UnitCase):
+
+    def test_ballots_to_arrays(self):
+        arrays = ballots_to_arrays(BALLOTS)
+        self.assertEqual(arrays['weights'].tolist(), [1, 300, 2, 1])
+        self.assertEqual(arrays['choices'].tolist(), [2, 3, 1, 1, 2, 3])
+        self.assertEqual(arrays['offsets'].tolist(), [0, 1, 3, 3, 6])
+        self.assertEqual(arrays['choices'].dtype, npz.numpy.uint8)
+
+    def test_ballots_to_arrays__candidate_count(self):
+        arrays = ballots_to_arrays(BALLOTS, candidate_count=1000)
+        self.assertEqual(arrays['choices'].dtype, npz.numpy.uint16)
+
+    def test_iter_npz_ballots(self):
+        arrays = ballots_to_arrays(BALLOTS)
+        for block_size in (1, 3, 100):
+            with self.subTest(block_size=block_size):
+                with patch('openrcv.formats.npz.READ_BLOCK_SIZE', block_size):
+                    actual = list(iter_npz_ballots(arrays['weights'], arrays['choices'],
+                                                   arrays['offsets']))
+                self.assertEqual(actual, BALLOTS)
+
+    def test_load_npz_arrays__compressed(self):
+        arrays = ballots_to_arrays(BALLOTS)
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "ballots.npz")
+            npz.numpy.savez_compressed(path, **arrays)
+            loaded = load_npz_arrays(path)
+        self.assertEqual(loaded['offsets'].tolist(), [0, 1, 3, 3, 6])
+
+    def test_load_npz_arrays__errors(self):
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "ballots.npz")
+            cases = [
+                (b"not a zip file", "not an npz file"),
+                (None, "missing"),
+            ]
+            for data, message in cases:
+                with self.subTest(message=message):
+                    if data is None:
+                        npz.numpy.savez(path, weights=npz.numpy.zeros(1))
+                    else:
+                        with open(path, "wb") as f:
+                            f.write(data)
+                    with self.assertRaises(NpzFormatError) as cm:
+                        load_npz_arrays(path)
+                    self.assertIn(message, str(cm.exception))
+
+    def test_no_numpy(self):
+        with patch('openrcv.formats.npz.numpy', None):
+            with self.assertRaises(NpzFormatError):
+                ballots_to_arrays(BALLOTS)
+
+
+@unittest.skipIf(npz.numpy is None, "NumPy is not installed")
+class NpzBallotsResourceTest(UnitCase):
+
+    def test_round_trip(self):
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "ballots.npz")
+            resource = NpzBallotsResource(path, candidate_count=3)
+            with resource.writing() as gen:
+                for ballot in BALLOTS:
+                    gen.send(ballot)
+            with resource.reading() as gen:
+                self.assertEqual(list(gen), BALLOTS)
+            self.assertEqual(resource.count(), 4)
+            self.assertEqual(resource.count_ballots(), 304)
+            with resource.reading_arrays() as arrays:
+                # Check that the arrays are memory-mapped.
+                self.assertIsInstance(arrays['choices'], npz.numpy.memmap)
+                self.assertEqual(arrays['choices'].tolist(), [2, 3, 1, 1, 2, 3])
+
+    def test_round_trip__blocks(self):
+        """Check writing in several blocks, with choices above the candidate count."""
+        ballots = BALLOTS + [(1, (300, ))]
+        for block_size in (1, 2, 100):
+            with self.subTest(block_size=block_size):
+                with TemporaryDirectory() as dir_path:
+                    path = os.path.join(dir_path, "ballots.npz")
+                    resource = NpzBallotsResource(path, candidate_count=3)
+                    with patch('openrcv.formats.npz.WRITE_BLOCK_SIZE', block_size):
+                        resource.write_many(ballots, batch_size=2)
+                    with resource.reading_arrays() as arrays:
+                        self.assertEqual(arrays['choices'].dtype, npz.numpy.uint16)
+                        self.assertEqual(arrays['offsets'].tolist(), [0, 1, 3, 3, 6, 7])
+                    with resource.reading() as gen:
+                        self.assertEqual(list(gen), ballots)
+
+    def test_round_trip__empty(self):
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "ballots.npz")
+            resource = NpzBallotsResource(path)
+            with resource.writing() as gen:
+                pass
+            with resource.reading() as gen:
+                self.assertEqual(list(gen), [])
+
+    def test_numpy_tabulator(self):
+        ballots = [(3, (1, 2)), (3, (2, )), (2, (3, 3, 1)), (1, (4, 2)), (1, ())]
+        candidates = ["A", "B", "C", "D"]
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "ballots.npz")
+            resource = NpzBallotsResource(path)
+            with resource.writing() as gen:
+                for ballot in ballots:
+                    gen.send(ballot)
+            contest = ContestInput(candidates=candidates, ballots_resource=resource)
+            actual = NumpyTabulator(contest).count()
+        contest = ContestInput(candidates=candidates, ballots_resource=ListResource(ballots))
+        expected = Tabulator(contest).count()
+        self.assertEqual([r.totals for r in actual.rounds],
+                         [r.totals for r in expected.rounds])
+
+
+@unittest.skipIf(npz.numpy is None, "NumPy is not installed")
+class NpzFormatTest(UnitCase):
+
+    def make_contest(self):
+        return ContestInput(candidates=["A", "B", "C"], ballots_resource=ListResource(BALLOTS))
+
+    def test_write_contest(self):
+        with TemporaryDirectory() as dir_path:
+            paths = NpzFormat().write_contest(self.make_contest(), output_dir=dir_path)
+            self.assertEqual(paths, [os.path.join(dir_path, "ballots.npz")])
+            with zipfile.ZipFile(paths[0]) as zip_file:
+                self.assertEqual(sorted(zip_file.namelist()),
+                                 ["choices.npy", "offsets.npy", "weights.npy"])
+            with NpzBallotsResource(paths[0]).reading() as gen:
+                self.assertEqual(list(gen), BALLOTS)
+
+    def test_write_contest__stdout(self):
+        buffer = BytesIO()
+        stdout = TextIOWrapper(buffer)
+        NpzFormat().write_contest(self.make_contest(), stdout=stdout)
+        with zipfile.ZipFile(BytesIO(buffer.getvalue())) as zip_file:
+            self.assertIn("weights.npy", zip_file.namelist())
+
+    def test_write_contest__unseekable_stdout(self):
+        class UnseekableBytesIO(BytesIO):
+            def seekable(self):
+                return False
+
+            def tell(self):
+                raise OSError("unseekable")
+
+        buffer = UnseekableBytesIO()
+        stdout = TextIOWrapper(buffer)
+        NpzFormat().write_contest(self.make_contest(), stdout=stdout)
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "ballots.npz")
+            with open(path, "wb") as f:
+                f.write(buffer.getvalue())
+            with NpzBallotsResource(path).reading() as gen:
+                self.assertEqual(list(gen), BALLOTS)
+
+    def test_write_contest__text_stdout(self):
+        with self.assertRaises(NpzFormatError):
+            NpzFormat().write_contest(self.make_contest(), stdout=StringIO())
@@ -0,0 +1,177 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+"""
+Tests of the WinEDS format.
+
+"""
+
+from io import BytesIO, StringIO
+import os
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from openrcv.formats import wineds
+from openrcv.formats.wineds import (MasterLookup, read_wineds_contest, WinEDSFormatError,
+                                    WinEDSReader)
+from openrcv.models import BallotTrie
+from openrcv.streams import ListResource
+from openrcv.utiltest import winedsgen
+from openrcv.utiltest.helpers import UnitCase
+
+
+BALLOTS = [
+    (43, 41),
+    (41, None, 42),
+    (None, None, None),
+    (42, (41, 43), 43),
+    (43, 43, 41),
+]
+
+EXPECTED_BALLOTS = [
+    (1, (1, 2)),
+    (1, (2, 3)),
+    (1, ()),
+    (1, (3, )),
+    (1, (1, 2)),
+]
+
+CONTESTS = {
+    2: ("Mayor", [(41, "Alice"), (42, "Bob"), (43, "Carol")]),
+    3: ("Sheriff", [(51, "Dave")]),
+}
+
+
+def make_ballot_image(ballots=None, contest_id=2, **kwargs):
+    if ballots is None:
+        ballots = BALLOTS
+    f = BytesIO()
+    winedsgen.write_ballot_image(f, ballots, contest_id=contest_id, **kwargs)
+    return BytesIO(f.getvalue())
+
+
+class MasterLookupTest(UnitCase):
+
+    def test_parse(self):
+        f = StringIO()
+        winedsgen.write_master_lookup(f, CONTESTS)
+        f.seek(0)
+        lookup = MasterLookup.parse(f)
+        self.assertEqual(lookup.contests, {2: "Mayor", 3: "Sheriff"})
+        self.assertEqual(lookup.candidates[42].name, "Bob")
+        self.assertEqual(lookup.candidates[42].contest_id, 2)
+        self.assertEqual(lookup.get_candidate_ids(2), [41, 42, 43])
+
+    def test_parse__error(self):
+        with self.assertRaises(WinEDSFormatError):
+            MasterLookup.parse(StringIO("Candidate 00000xxBob\n"))
+
+
+class WinEDSReaderTest(UnitCase):
+
+    def test_iter_ballots(self):
+        for line_ending in ("\r\n", "\n"):
+            with self.subTest(line_ending=line_ending):
+                reader = WinEDSReader()
+                f = make_ballot_image(line_ending=line_ending)
+                self.assertEqual(list(reader.iter_ballots(f)), EXPECTED_BALLOTS)
+                self.assertEqual(reader.candidates, [43, 41, 42])
+                self.assertEqual(reader.contest_id, 2)
+
+    def test_iter_ballots__candidate_ids(self):
+        reader = WinEDSReader(candidate_ids=[41, 42, 43])
+        ballots = list(reader.iter_ballots(make_ballot_image()))
+        self.assertEqual(ballots[:2], [(1, (3, 1)), (1, (1, 2))])
+
+    def test_iter_ballots__unknown_candidate(self):
+        reader = WinEDSReader(candidate_ids=[41, 42])
+        with self.assertRaises(WinEDSFormatError):
+            list(reader.iter_ballots(make_ballot_image()))
+
+    def test_iter_ballots__invalid_candidate_id(self):
+        lines = make_ballot_image().getvalue().splitlines(True)
+        # Corrupt the candidate ID of the second ballot's first record.
+        lines[3] = lines[3][:36] + b"00x0041" + lines[3][43:]
+        with self.assertRaisesRegex(WinEDSFormatError, "line 4: invalid candidate ID"):
+            list(WinEDSReader().iter_ballots(BytesIO(b"".join(lines))))
+
+    def test_iter_ballots__blocks(self):
+        """Check ballots that span blocks."""
+        with patch.object(wineds, 'READ_BLOCK_RECORDS', 2):
+            ballots = list(WinEDSReader().iter_ballots(make_ballot_image()))
+        self.assertEqual(ballots, EXPECTED_BALLOTS)
+
+    def test_iter_ballots__no_final_line_ending(self):
+        data = make_ballot_image().getvalue()
+        ballots = list(WinEDSReader().iter_ballots(BytesIO(data.rstrip())))
+        self.assertEqual(ballots, EXPECTED_BALLOTS)
+
+    def test_iter_ballots__contest_id(self):
+        f = BytesIO()
+        winedsgen.write_ballot_image(f, [(51, )], contest_id=3)
+        winedsgen.write_ballot_image(f, BALLOTS, contest_id=2, first_voter_id=2)
+        winedsgen.write_ballot_image(f, [(51, )], contest_id=3, first_voter_id=10)
+        data = f.getvalue()
+        reader = WinEDSReader(contest_id=2)
+        self.assertEqual(list(reader.iter_ballots(BytesIO(data))), EXPECTED_BALLOTS)
+        with self.assertRaises(WinEDSFormatError):
+            list(WinEDSReader().iter_ballots(BytesIO(data)))
+
+    def test_iter_ballots__errors(self):
+        record = winedsgen.format_ballot_records(2, 1, [41])[0].encode('ascii')
+        cases = [
+            record[:-1] + b"\n",
+            record + b"0\n",
+            record + b"\n" + record[:-1] + b"\n",
+            record + b"\n" + record[:20],
+        ]
+        for data in cases:
+            with self.subTest(data=data):
+                with self.assertRaises(WinEDSFormatError):
+                    list(WinEDSReader().iter_ballots(BytesIO(data)))
+
+    def test_iter_ballots__empty(self):
+        self.assertEqual(list(WinEDSReader().iter_ballots(BytesIO())), [])
+
+    def test_read(self):
+        resource = ListResource()
+        self.assertEqual(WinEDSReader().read(make_ballot_image(), resource), 5)
+        with resource.reading() as ballots:
+            self.assertEqual(list(ballots), [(2, (1, 2)), (1, (2, 3)), (1, ()), (1, (3, ))])
+
+
+class ModuleTest(UnitCase):
+
+    def test_read_wineds_contest(self):
+        with TemporaryDirectory() as dir_path:
+            ballots_path = os.path.join(dir_path, "ballots.txt")
+            lookup_path = os.path.join(dir_path, "lookup.txt")
+            with open(ballots_path, "wb") as f:
+                f.write(make_ballot_image().getvalue())
+            with open(lookup_path, "w", encoding="latin-1") as f:
+                winedsgen.write_master_lookup(f, CONTESTS)
+            trie = BallotTrie()
+            contest = read_wineds_contest(ballots_path, lookup_path, trie, contest_id=2)
+        self.assertEqual(contest.name, "Mayor")
+        self.assertEqual(contest.candidates, ["Alice", "Bob", "Carol"])
+        self.assertIs(contest.ballots_resource, trie)
+        with trie.reading() as ballots:
+            self.assertEqual(sorted(ballots), [(1, ()), (1, (1, 2)), (1, (2, )), (2, (3, 1))])
@@ -0,0 +1,182 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+from argparse import Namespace
+from io import StringIO
+import json
+import os
+from tempfile import TemporaryDirectory
+
+from openrcv.formats.internal import InternalFormat
+from openrcv.scripts import commands
+from openrcv.utiltest.helpers import UnitCase
+
+
+BLT_FORMAT = """\
+4 1
+
+{ballots}0
+"Ann"
+"Bob"
+"Carl"
+"Dee"
+"Contest"
+"""
+
+CONFIG_FORMAT = """\
+openrcv:
+  contests:
+{contests}"""
+
+
+class CountTest(UnitCase):
+
+    # The ballot lines of each contest, in config file order.
+    CONTESTS = [
+        "2 1 2 0\n3 2 0\n1 3 1 0\n2 3 2 0\n",
+        "5 1 0\n",
+        "1 1 0\n2 2 0\n3 3 0\n4 4 0\n1 4 3 0\n",
+    ]
+
+    def count(self, dir_path, jobs):
+        files = []
+        for i, ballots in enumerate(self.CONTESTS, start=1):
+            file_name = "contest%d.blt" % i
+            with open(os.path.join(dir_path, file_name), "w") as f:
+                f.write(BLT_FORMAT.format(ballots=ballots))
+            files.append(file_name)
+        contests = "".join("    - file: %s\n" % name for name in files)
+        config_path = os.path.join(dir_path, "election.yaml")
+        with open(config_path, "w") as f:
+            f.write(CONFIG_FORMAT.format(contests=contests))
+        ns = Namespace(input_path=config_path, jobs=jobs, arithmetic=None)
+        stdout, stderr = StringIO(), StringIO()
+        commands.count(ns, stdout=stdout, stderr=stderr)
+        # Each contest is written as one JSON object per line.
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(len(lines), len(self.CONTESTS))
+        return [json.loads(line) for line in lines], stderr.getvalue()
+
+    def check_count(self, jobs):
+        with TemporaryDirectory() as dir_path:
+            jsobjs, summary = self.count(dir_path, jobs=jobs)
+        by_file = {jsobj['_meta']['file']: jsobj for jsobj in jsobjs}
+        self.assertEqual(sorted(by_file), ["contest1.blt", "contest2.blt", "contest3.blt"])
+        self.assertEqual(by_file["contest2.blt"]['rounds'][0]['totals'],
+                         {'"Ann"': 5, '"Bob"': 0, '"Carl"': 0, '"Dee"': 0})
+        self.assertEqual(len(by_file["contest3.blt"]['rounds']), 3)
+        for name in by_file:
+            self.assertIn(name, summary)
+        return by_file
+
+    def test_count(self):
+        self.check_count(jobs=1)
+
+    def test_count__jobs(self):
+        self.assertEqual(self.check_count(jobs=2), self.check_count(jobs=1))
+
+    def test_count__default_jobs(self):
+        self.assertEqual(self.check_count(jobs=None), self.check_count(jobs=1))
+
+    def test_count__multi_seat(self):
+        """Check that a contest with more than one seat is counted using STV."""
+        # The quota is 4.  Ann is elected with a surplus of 2, which is
+        # exactly enough to elect Carl when counting with fractions.
+        blt = BLT_FORMAT.replace("4 1\n", "4 2\n").format(ballots="6 1 3 0\n3 2 0\n2 3 0\n")
+        with TemporaryDirectory() as dir_path:
+            with open(os.path.join(dir_path, "council.blt"), "w") as f:
+                f.write(blt)
+            config_path = os.path.join(dir_path, "election.yaml")
+            with open(config_path, "w") as f:
+                f.write(CONFIG_FORMAT.format(contests="    - file: council.blt\n"))
+            rounds = {}
+            for arithmetic in (None, 'fraction'):
+                ns = Namespace(input_path=config_path, jobs=1, arithmetic=arithmetic)
+                stdout = StringIO()
+                commands.count(ns, stdout=stdout, stderr=StringIO())
+                rounds[arithmetic] = json.loads(stdout.getvalue())['rounds']
+        for arithmetic, jsobjs in rounds.items():
+            with self.subTest(arithmetic=arithmetic):
+                elected = [name for jsobj in jsobjs for name in jsobj.get('elected', [])]
+                self.assertEqual(elected, ['"Ann"', '"Carl"'])
+        self.assertEqual([jsobj['totals'] for jsobj in rounds['fraction']],
+                         [{'"Ann"': 6, '"Bob"': 3, '"Carl"': 2, '"Dee"': 0},
+                          {'"Ann"': 4, '"Bob"': 3, '"Carl"': 4, '"Dee"': 0}])
+        # With the default fixed-point arithmetic, the transfer value 2/6
+        # is truncated, so Carl falls just short of the quota.
+        self.assertEqual(rounds[None][1]['totals']['"Carl"'], 3.999999998)
+
+
+class ComputeMarginTest(UnitCase):
+
+    def test_compute_margin(self):
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "contest.blt")
+            with open(path, "w") as f:
+                f.write(BLT_FORMAT.format(ballots="4 1 0\n2 2 0\n1 3 2 0\n"))
+            jsobj = json.loads(commands.compute_margin(path))
+        self.assertEqual(jsobj['winner'], '"Ann"')
+        self.assertEqual(jsobj['margin'], 1)
+        self.assertEqual(jsobj['lower_bound'], 1)
+        self.assertEqual(jsobj['elimination_order'][-1], '"Bob"')
+
+
+class BuildIndexTest(UnitCase):
+
+    def test_build_index(self):
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "contest.blt")
+            with open(path, "w") as f:
+                f.write(BLT_FORMAT.format(ballots="4 1 0\n2 2 0\n1 3 2 0\n"))
+            output = commands.build_index(path)
+            self.assertTrue(os.path.exists(path + ".idx"))
+        self.assertEqual(output, "indexed 3 ballots (total weight 7): %s.idx\n" % path)
+
+
+class ConvertBallotsTest(UnitCase):
+
+    def test_convert_ballots(self):
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "contest.blt")
+            with open(path, "w") as f:
+                f.write(BLT_FORMAT.format(ballots="4 1 0\n2 2 0\n1 3 2 0\n"))
+            output_dir = os.path.join(dir_path, "output")
+            output = commands.convert_ballots(path, InternalFormat, output_dir=output_dir)
+            output_path = os.path.join(output_dir, "ballots.txt")
+            with open(output_path) as f:
+                ballots = f.read()
+        summary, paths = output.split("\n", 1)
+        self.assertTrue(summary.startswith("converted 3 ballots"), msg=summary)
+        self.assertEqual(paths, output_path + "\n")
+        self.assertEqual(ballots, "4 1\n2 2\n1 3 2\n")
+
+    def test_convert_ballots__stdout(self):
+        stdout, stderr = StringIO(), StringIO()
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "contest.blt")
+            with open(path, "w") as f:
+                f.write(BLT_FORMAT.format(ballots="4 1 0\n2 2 0\n"))
+            output = commands.convert_ballots(path, InternalFormat, stdout=stdout,
+                                              stderr=stderr)
+        self.assertIsNone(output)
+        self.assertEqual(stdout.getvalue(), "4 1\n2 2\n")
+        self.assertTrue(stderr.getvalue().startswith("converted 2 ballots"))
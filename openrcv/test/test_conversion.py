@@ -0,0 +1,179 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+"""
+Tests of converting ballots between formats.
+
+"""
+
+from io import StringIO
+import os
+from tempfile import TemporaryDirectory
+import unittest
+
+from openrcv.conversion import convert_contest, detect_input_format, open_contest
+from openrcv.formats import npz
+from openrcv.formats.binary import BinaryFormat
+from openrcv.formats.blt import BLTFormat
+from openrcv.formats.csvranks import CSVRanksFormat
+from openrcv.formats.internal import InternalFormat
+from openrcv.formats.jscase import CompactJsonCaseFormat, JsonCaseFormat
+from openrcv.formats.npz import NpzFormat
+from openrcv.utiltest.helpers import UnitCase
+
+
+BLT_TEXT = """\
+3 1
+-3
+2 2 1 0
+1 3 0
+3 0
+1 2 1 0
+0
+"Ann"
+"Bob"
+"Cam"
+"Contest"
+"""
+
+BALLOTS = [(2, (2, 1)), (1, (3, )), (3, ()), (1, (2, 1))]
+
+NORMALIZED_BALLOTS = [(3, ()), (3, (2, 1)), (1, (3, ))]
+
+
+def read_ballots(path, **kwargs):
+    with open_contest(path, **kwargs) as contest:
+        with contest.ballots_resource.reading() as ballots:
+            return contest, list(ballots)
+
+
+class ModuleTest(UnitCase):
+
+    def test_detect_input_format(self):
+        cases = [
+            ("a/b.blt", "blt"),
+            ("b.BLT", "blt"),
+            ("b.blt.gz", "blt"),
+            ("b.json", "jscase"),
+            ("b.bin.xz", "binary"),
+            ("b.npz", "npz"),
+            ("b.csv", "csv"),
+            ("b.txt", "internal"),
+            ("b.gz", "internal"),
+        ]
+        for path, expected in cases:
+            with self.subTest(path=path):
+                self.assertEqual(detect_input_format(path), expected)
+
+    def test_open_contest__unknown_format(self):
+        with self.assertRaises(ValueError):
+            with open_contest("ballots.txt", input_format="foo"):
+                pass
+
+
+class ConvertContestTest(UnitCase):
+
+    def write_blt(self, dir_path):
+        path = os.path.join(dir_path, "input.blt")
+        with open(path, "w") as f:
+            f.write(BLT_TEXT)
+        return path
+
+    def check_round_trip(self, format_cls, normalize=False, expected=BALLOTS):
+        with TemporaryDirectory() as dir_path:
+            blt_path = self.write_blt(dir_path)
+            output_dir = os.path.join(dir_path, "output")
+            os.mkdir(output_dir)
+            stats = convert_contest(blt_path, format_cls, output_dir=output_dir,
+                                    normalize=normalize)
+            self.assertEqual(stats.ballot_count, len(expected))
+            self.assertEqual(stats.input_bytes, os.path.getsize(blt_path))
+            output_path, = stats.output_paths
+            contest, ballots = read_ballots(output_path)
+        self.assertEqual(contest.candidates, ["Ann", "Bob", "Carol"])
+        self.assertEqual(ballots, expected)
+        return contest
+
+    def test_internal(self):
+        with self.assertLogs("openrcv.conversion", level="WARNING") as logs:
+            contest = self.check_round_trip(InternalFormat)
+        # The withdrawn candidates do not survive the round trip.
+        self.assertIn("withdrawn candidates [3]", logs.output[0])
+        self.assertEqual(contest.withdrawn, [])
+
+    def test_jscase(self):
+        contest = self.check_round_trip(JsonCaseFormat)
+        self.assertEqual(contest.name, 'Contest')
+
+    def test_jscase__compact(self):
+        self.check_round_trip(CompactJsonCaseFormat)
+
+    def test_binary(self):
+        self.check_round_trip(BinaryFormat)
+
+    @unittest.skipIf(npz.numpy is None, "NumPy is not installed")
+    def test_npz(self):
+        self.check_round_trip(NpzFormat)
+
+    def test_normalize(self):
+        self.check_round_trip(InternalFormat, normalize=True, expected=NORMALIZED_BALLOTS)
+
+    def test_csv(self):
+        with TemporaryDirectory() as dir_path:
+            blt_path = self.write_blt(dir_path)
+            stats = convert_contest(blt_path, CSVRanksFormat, output_dir=dir_path)
+            csv_path, = stats.output_paths
+            contest, ballots = read_ballots(csv_path)
+        # The candidates are numbered in order of appearance.
+        self.assertEqual(contest.candidates, ['Bob', 'Ann', 'Cam'])
+        self.assertEqual(ballots, [(2, (1, 2)), (1, (3, )), (3, ()), (1, (1, 2))])
+
+    def check_blt_contest(self, contest, ballots):
+        self.assertEqual(contest.candidates, ["Ann", "Bob", "Cam"])
+        self.assertEqual(contest.name, "Contest")
+        self.assertEqual(contest.seat_count, 1)
+        self.assertEqual(contest.withdrawn, [3])
+        self.assertEqual(ballots, BALLOTS)
+
+    def test_blt(self):
+        with TemporaryDirectory() as dir_path:
+            blt_path = self.write_blt(dir_path)
+            output_dir = os.path.join(dir_path, "output")
+            os.mkdir(output_dir)
+            stats = convert_contest(blt_path, BLTFormat, output_dir=output_dir)
+            output_path, = stats.output_paths
+            with open(output_path) as f:
+                self.assertEqual(f.read(), BLT_TEXT)
+            contest, ballots = read_ballots(output_path)
+        self.check_blt_contest(contest, ballots)
+
+    def test_blt__stdout(self):
+        with TemporaryDirectory() as dir_path:
+            blt_path = self.write_blt(dir_path)
+            stdout = StringIO()
+            stats = convert_contest(blt_path, BLTFormat, stdout=stdout)
+            self.assertEqual(stats.ballot_count, 4)
+            # Convert the output back.
+            output_path = os.path.join(dir_path, "output.blt")
+            with open(output_path, "w") as f:
+                f.write(stdout.getvalue())
+            contest, ballots = read_ballots(output_path)
+        self.check_blt_contest(contest, ballots)
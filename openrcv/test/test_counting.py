@@ -20,15 +20,121 @@
 # DEALINGS IN THE SOFTWARE.
 #
 
+import os
+from random import Random
+from tempfile import TemporaryDirectory
 from textwrap import dedent
 import unittest
+from unittest.mock import patch
 
-from openrcv.counting import get_lowest, get_majority, get_winner
-from openrcv.models import RoundResults
+from openrcv import counting
+from openrcv.counting import (get_batch_lowest, get_lowest, get_majority, get_winner,
+                              NumpyTabulator, ParallelTabulator, PileTabulator, Tabulator,
+                              WinnerTabulator)
+from openrcv.formats.blt import (read_blt_ballots_range, BLTFileWriter,
+                                 IndexedBLTBallotsResource)
+from openrcv.formats.index import build_ballot_index
+from openrcv.formats.internal import internal_ballots_resource, to_internal_ballot
+from openrcv.jcmodels import JsonCaseContestInput, JsonCaseTestOutput
+from openrcv.models import BallotsResource, BallotTrie, ContestInput, RoundResults
+from openrcv.streams import FilePathResource, ListResource
+from openrcv.stv import count_stv_contest
 from openrcv.utils import StringInfo
 from openrcv.utiltest.helpers import UnitCase
 
 
+SAMPLE_BLT_PATH = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "data",
+                               "sample.blt")
+
+
+def make_contest(ballots, candidate_count):
+    """Return a ContestInput object backed by a list of ballots."""
+    candidates = ["Candidate %d" % n for n in range(1, candidate_count + 1)]
+    ballots_resource = BallotsResource(ListResource(ballots))
+    return ContestInput(candidates=candidates, ballots_resource=ballots_resource)
+
+
+def make_random_ballots(seed, ballot_count, candidate_count):
+    """Return a reproducible list of random ballots."""
+    rand = Random(seed)
+    numbers = list(range(1, candidate_count + 1))
+    ballots = []
+    for i in range(ballot_count):
+        length = rand.randint(0, candidate_count)
+        choices = tuple(rand.sample(numbers, length))
+        ballots.append((rand.randint(1, 3), choices))
+    return ballots
+
+
+# Contests with (ballots, candidate_count) that exercise exhausted
+# ballots, repeated choices, multiple eliminations, and a tie.
+SAMPLE_CONTESTS = [
+    ([(2, (1, )), (1, (2, 1)), (1, (3, 2))], 3),
+    ([(3, (1, 2)), (3, (2, )), (2, (3, 3, 1)), (1, (4, 2)), (1, ())], 4),
+    ([(1, (1, )), (1, (2, ))], 2),
+    ([(5, (4, 1)), (4, (3, 2)), (3, (2, 3)), (2, (1, 4, 3))], 4),
+]
+
+
+class TabulatorTestMixin(object):
+
+    """Checks that a tabulator class agrees with the reference Tabulator."""
+
+    def make_tabulator(self, contest, **kwargs):
+        raise NotImplementedError()
+
+    def assertResultsEqual(self, actual, expected):
+        self.assertEqual(len(actual.rounds), len(expected.rounds))
+        for i, (round1, round2) in enumerate(zip(actual.rounds, expected.rounds), start=1):
+            with self.subTest(round=i):
+                self.assertEqual(round1.totals, round2.totals)
+                self.assertEqual(round1.elected, round2.elected)
+                self.assertEqual(round1.eliminated, round2.eliminated)
+        outcome1, outcome2 = actual.outcome, expected.outcome
+        self.assertEqual(outcome1.last_round, outcome2.last_round)
+        self.assertEqual(getattr(outcome1, 'tied_last_place', None),
+                         getattr(outcome2, 'tied_last_place', None))
+
+    def check_contest(self, contest, **kwargs):
+        expected = Tabulator(contest, **kwargs).count()
+        actual = self.make_tabulator(contest, **kwargs).count()
+        self.assertResultsEqual(actual, expected)
+
+    def test_count__samples(self):
+        for ballots, candidate_count in SAMPLE_CONTESTS:
+            with self.subTest(ballots=ballots):
+                self.check_contest(make_contest(ballots, candidate_count))
+
+    def test_count__random(self):
+        for seed in range(10):
+            with self.subTest(seed=seed):
+                ballots = make_random_ballots(seed, ballot_count=200, candidate_count=8)
+                self.check_contest(make_contest(ballots, 8))
+
+    def test_count__batch_elimination(self):
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                ballots = make_random_ballots(seed, ballot_count=200, candidate_count=8)
+                self.check_contest(make_contest(ballots, 8), batch_elimination=True)
+
+    def test_count__withdrawn(self):
+        """Check that withdrawn candidates never receive votes."""
+        contest = make_contest(*SAMPLE_CONTESTS[1])
+        contest.withdrawn = [2]
+        results = self.make_tabulator(contest).count()
+        self.assertEqual([r.totals for r in results.rounds],
+                         [{1: 3, 3: 2, 4: 1}, {1: 3, 3: 2}])
+        self.assertEqual(results.rounds[-1].elected, [1])
+
+    def test_count__twice(self):
+        """Check that counting again starts from scratch."""
+        contest = make_contest(*SAMPLE_CONTESTS[1])
+        tabulator = self.make_tabulator(contest)
+        first = tabulator.count()
+        second = tabulator.count()
+        self.assertResultsEqual(second, first)
+
+
 class ModuleTest(UnitCase):
 
     @unittest.skip("TODO")
@@ -70,6 +176,23 @@ class ModuleTest(UnitCase):
             with self.subTest(totals=totals, winner=winner):
                 self.assertEqual(get_winner(totals), winner)
 
+    def test_get_batch_lowest(self):
+        cases = [
+            ({1: 6, 2: 5}, {2}),
+            # The combined total 1 + 2 + 4 is less than 8.
+            ({1: 1, 2: 2, 3: 4, 4: 8, 5: 9}, {1, 2, 3}),
+            ({1: 1, 2: 2, 3: 4, 4: 7, 5: 9}, {1, 2}),
+            # Tied candidates can be eliminated together.
+            ({1: 1, 2: 1, 3: 5, 4: 6}, {1, 2}),
+            ({1: 0, 2: 0, 3: 5}, {1, 2}),
+            # No batch exists when the two lowest are tied.
+            ({1: 3, 2: 3, 3: 5}, set()),
+            ({1: 5, 2: 5}, set()),
+        ]
+        for totals, lowest in cases:
+            with self.subTest(totals=totals, lowest=lowest):
+                self.assertEqual(get_batch_lowest(totals), lowest)
+
     def test_get_lowest__no_totals(self):
         """Test passing an empty totals dict."""
         with self.assertRaises(ValueError):
@@ -89,6 +212,353 @@ class ModuleTest(UnitCase):
                 self.assertEqual(get_lowest(totals), lowest)
 
 
+class PileTabulatorTest(TabulatorTestMixin, UnitCase):
+
+    def make_tabulator(self, contest, **kwargs):
+        return PileTabulator(contest, **kwargs)
+
+    def test_count_ballots__reads_once(self):
+        """Check that later rounds do not reread the ballots."""
+        contest = make_contest(*SAMPLE_CONTESTS[1])
+        tabulator = PileTabulator(contest)
+        totals = tabulator.count_ballots({1, 2, 3, 4})
+        self.assertEqual(totals, {1: 3, 2: 3, 3: 2, 4: 1})
+        # Remove the ballots so that a reread would change the totals.
+        contest.ballots_resource = ListResource()
+        totals = tabulator.count_ballots({1, 2, 3})
+        self.assertEqual(totals, {1: 3, 2: 4, 3: 2})
+        totals = tabulator.count_ballots({1, 2})
+        self.assertEqual(totals, {1: 5, 2: 4})
+
+
+class ParallelTabulatorTest(TabulatorTestMixin, UnitCase):
+
+    def make_tabulator(self, contest, **kwargs):
+        return ParallelTabulator(contest, jobs=2, **kwargs)
+
+    def test_count__file(self):
+        """Check counting shards that are byte ranges of a ballot file."""
+        ballots = make_random_ballots(0, ballot_count=200, candidate_count=8)
+        with TemporaryDirectory() as dirname:
+            path = os.path.join(dirname, 'ballots.txt')
+            with open(path, 'w') as f:
+                for ballot in ballots:
+                    f.write(to_internal_ballot(ballot) + "\n")
+            contest = make_contest([], 8)
+            contest.ballots_resource = internal_ballots_resource(FilePathResource(path))
+            tabulator = ParallelTabulator(contest, jobs=3)
+            self.assertEqual(len(tabulator.make_shards()), 3)
+            actual = tabulator.count()
+        expected = Tabulator(make_contest(ballots, 8)).count()
+        self.assertResultsEqual(actual, expected)
+
+    def test_count__more_jobs_than_ballots(self):
+        contest = make_contest(*SAMPLE_CONTESTS[2])
+        results = ParallelTabulator(contest, jobs=3).count()
+        self.assertEqual(results.rounds[0].totals, {1: 1, 2: 1})
+
+
+class CountBLTPathTest(UnitCase):
+
+    assertResultsEqual = TabulatorTestMixin.assertResultsEqual
+
+    def write_blt(self, dir_path, ballots, candidate_count, seat_count=1):
+        path = os.path.join(dir_path, "contest.blt")
+        with open(path, "w") as f:
+            f.write("%d %d\n\n" % (candidate_count, seat_count))
+            for ballot in ballots:
+                f.write(to_internal_ballot(ballot) + " 0\n")
+            f.write("0\n")
+            for n in range(1, candidate_count + 1):
+                f.write('"Candidate %d"\n' % n)
+            f.write('"Contest"\n')
+        return path
+
+    def check_ballots(self, ballots, candidate_count, jobs=None):
+        expected = Tabulator(make_contest(ballots, candidate_count)).count()
+        with TemporaryDirectory() as dir_path:
+            path = self.write_blt(dir_path, ballots, candidate_count)
+            actual = counting.count_blt_path(path, jobs=jobs)
+        self.assertResultsEqual(actual, expected)
+
+    def test_read_blt_trie_contest(self):
+        ballots = [(1, (2, )), (2, (3, 1)), (1, (2, )), (1, ())]
+        with TemporaryDirectory() as dir_path:
+            path = self.write_blt(dir_path, ballots, 3)
+            contest = counting.read_blt_trie_contest(path)
+        self.assertEqual(type(contest.ballots_resource), BallotTrie)
+        with contest.ballots_resource.reading() as gen:
+            self.assertEqual(list(gen), [(1, ()), (2, (2, )), (2, (3, 1))])
+        self.assertEqual(contest.candidates, ['"Candidate %d"' % n for n in range(1, 4)])
+        self.assertEqual(contest.ballot_count, 4)
+
+    def test_read_indexed_blt_contest(self):
+        ballots = [(1, (2, )), (2, (3, 1)), (1, ())]
+        with TemporaryDirectory() as dir_path:
+            path = self.write_blt(dir_path, ballots, 3)
+            self.assertIsNone(counting.read_indexed_blt_contest(path))
+            build_ballot_index(path)
+            contest = counting.read_indexed_blt_contest(path)
+            ballots_resource = contest.ballots_resource
+            self.assertEqual(type(ballots_resource), IndexedBLTBallotsResource)
+            with ballots_resource.reading() as gen:
+                self.assertEqual(list(gen), ballots)
+        self.assertEqual(contest.candidates, ['"Candidate %d"' % n for n in range(1, 4)])
+        self.assertEqual(contest.name, '"Contest"')
+        self.assertEqual(contest.seat_count, 1)
+        self.assertEqual(contest.ballot_count, 3)
+
+    def test_count__withdrawn(self):
+        """Check counting data/sample.blt using IRV, which withdraws Steve."""
+        # The candidates are Jen, Alice, Steve, and Bill.
+        expected = [{1: 5, 2: 3, 4: 6}, {1: 5, 4: 7}]
+        contest = counting.read_blt_trie_contest(SAMPLE_BLT_PATH)
+        self.assertEqual(contest.withdrawn, [3])
+        for tabulator in (Tabulator(contest), ParallelTabulator(contest, jobs=2)):
+            with self.subTest(tabulator=tabulator):
+                results = tabulator.count()
+                self.assertEqual([r.totals for r in results.rounds], expected)
+                self.assertEqual(results.rounds[-1].elected, [4])
+        with counting.read_blt_contest(SAMPLE_BLT_PATH) as contest:
+            results = Tabulator(contest).count()
+        self.assertEqual([r.totals for r in results.rounds], expected)
+
+    def test_count_blt_path__withdrawn(self):
+        """Check that data/sample.blt, which has two seats, is counted using STV."""
+        results = counting.count_blt_path(SAMPLE_BLT_PATH)
+        # Steve (3) is withdrawn, so Jen (1) and Bill (4) reach the quota of 5.
+        self.assertEqual(results.rounds[0].totals, {1: 5, 2: 3, 4: 6})
+        self.assertEqual(results.outcome.elected, [4, 1])
+
+    def test_read_indexed_blt_contest__withdrawn(self):
+        ballots = [(1, (2, )), (2, (3, 1))]
+        for withdrawn in ([], [2]):
+            with self.subTest(withdrawn=withdrawn):
+                with TemporaryDirectory() as dir_path:
+                    path = os.path.join(dir_path, "contest.blt")
+                    contest = make_contest(ballots, 3)
+                    contest.withdrawn = withdrawn
+                    BLTFileWriter(FilePathResource(path)).write_contest(contest)
+                    build_ballot_index(path)
+                    contest = counting.read_indexed_blt_contest(path)
+                    with contest.ballots_resource.reading() as gen:
+                        self.assertEqual(list(gen), ballots)
+                self.assertEqual(contest.withdrawn, withdrawn)
+                self.assertEqual(contest.candidates[-1], '"Candidate 3"')
+
+    def test_count_blt_path__samples(self):
+        for ballots, candidate_count in SAMPLE_CONTESTS:
+            with self.subTest(ballots=ballots):
+                self.check_ballots(ballots, candidate_count)
+
+    def test_count_blt_path__random(self):
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                ballots = make_random_ballots(seed, ballot_count=200, candidate_count=8)
+                self.check_ballots(ballots, 8)
+
+    def test_count_blt_path__jobs(self):
+        ballots = make_random_ballots(0, ballot_count=200, candidate_count=8)
+        self.check_ballots(ballots, 8, jobs=2)
+
+    def test_count_blt_path__jobs_index(self):
+        """Check that the workers read byte ranges of an indexed BLT file."""
+        ballots = make_random_ballots(0, ballot_count=200, candidate_count=8)
+        expected = Tabulator(make_contest(ballots, 8)).count()
+        with TemporaryDirectory() as dir_path:
+            path = self.write_blt(dir_path, ballots, 8)
+            index = build_ballot_index(path, interval=10)
+            contest = counting.read_indexed_blt_contest(path)
+            shards = ParallelTabulator(contest, jobs=3).make_shards()
+            self.assertEqual([shard.byte_range for shard in shards], index.byte_ranges(3))
+            for shard in shards:
+                self.assertEqual(shard.path, path)
+                self.assertIs(shard.read_range, read_blt_ballots_range)
+            with patch("openrcv.counting.read_blt_trie_contest") as mock_read:
+                actual = counting.count_blt_path(path, jobs=3)
+            self.assertFalse(mock_read.called)
+        self.assertResultsEqual(actual, expected)
+
+    def test_count_blt_path__multi_seat(self):
+        """Check that a contest with more than one seat is counted using STV."""
+        ballots = make_random_ballots(0, ballot_count=200, candidate_count=8)
+        contest = make_contest(ballots, 8)
+        contest.seat_count = 3
+        expected = count_stv_contest(contest, arithmetic='fraction')
+        self.assertEqual(len(expected.outcome.elected), 3)
+        self.assertResultsEqual(counting.count_irv_contest(contest, arithmetic='fraction'),
+                                expected)
+        with TemporaryDirectory() as dir_path:
+            path = self.write_blt(dir_path, ballots, 8, seat_count=3)
+            for jobs in (None, 2):
+                with self.subTest(jobs=jobs):
+                    actual = counting.count_blt_path(path, jobs=jobs, arithmetic='fraction')
+                    self.assertResultsEqual(actual, expected)
+
+
+class WinnerTabulatorTest(UnitCase):
+
+    def check_winner(self, contest, **kwargs):
+        expected = Tabulator(contest).count()
+        results = WinnerTabulator(contest, **kwargs).count()
+        self.assertTrue(results.partial)
+        expected_tie = getattr(expected.outcome, 'tied_last_place', None)
+        if expected_tie is not None:
+            self.assertEqual(results.outcome.tied_last_place, expected_tie)
+        else:
+            self.assertEqual(results.outcome.elected, expected.rounds[-1].elected)
+        return results
+
+    def test_count__samples(self):
+        for ballots, candidate_count in SAMPLE_CONTESTS:
+            for check_interval in (1, 2, 1000):
+                with self.subTest(ballots=ballots, check_interval=check_interval):
+                    self.check_winner(make_contest(ballots, candidate_count),
+                                      check_interval=check_interval)
+
+    def test_count__random(self):
+        for seed in range(20):
+            for check_interval in (1, 7):
+                with self.subTest(seed=seed, check_interval=check_interval):
+                    ballots = make_random_ballots(seed, ballot_count=200, candidate_count=6)
+                    self.check_winner(make_contest(ballots, 6), check_interval=check_interval)
+
+    def test_count__majority_stops_early(self):
+        ballots = [(1, (1, ))] * 6 + [(1, (2, )), (1, (3, ))]
+        results = self.check_winner(make_contest(ballots, 3), check_interval=1)
+        self.assertEqual(len(results.rounds), 1)
+        round_results = results.rounds[0]
+        self.assertEqual(round_results.elected, [1])
+        # The round stopped before the end, so it has no totals.
+        self.assertIsNone(round_results.totals)
+
+    def test_count__trailing_stops_early(self):
+        ballots = [(3, (1, )), (3, (2, 1)), (2, (1, )), (2, (2, )), (1, (3, 2))]
+        results = self.check_winner(make_contest(ballots, 3), check_interval=1)
+        first = results.rounds[0]
+        self.assertEqual(first.eliminated, [3])
+        self.assertIsNone(first.totals)
+
+    def test_count__partial_in_json(self):
+        """Check that the results are marked as partial when serialized."""
+        ballots = [(1, (1, ))] * 6 + [(1, (2, )), (1, (3, ))]
+        results = self.check_winner(make_contest(ballots, 3), check_interval=1)
+        jsobj = JsonCaseTestOutput.from_model(results).to_jsobj()
+        self.assertIs(jsobj['partial'], True)
+
+    def test_get_decision__no_totals(self):
+        tabulator = WinnerTabulator(make_contest(*SAMPLE_CONTESTS[1]))
+        self.assertIsNone(tabulator.get_decision({}, remaining=5))
+
+    def test_count__total_weight(self):
+        contest = make_contest(*SAMPLE_CONTESTS[1])
+        tabulator = WinnerTabulator(contest)
+        self.assertEqual(tabulator.get_total_weight(), 10)
+        contest.ballots_resource = ListResource(SAMPLE_CONTESTS[1][0])
+        self.assertEqual(tabulator.get_total_weight(), 10)
+
+
+class TrieTabulatorTest(TabulatorTestMixin, UnitCase):
+
+    """Tests of counting a contest whose ballots are a BallotTrie."""
+
+    def make_tabulator(self, contest, **kwargs):
+        trie = BallotTrie.build(contest.ballots_resource)
+        trie_contest = ContestInput(candidates=contest.candidates,
+                                    ballots_resource=trie, withdrawn=contest.withdrawn)
+        return Tabulator(trie_contest, **kwargs)
+
+
+@unittest.skipIf(counting.numpy is None, "NumPy is not installed")
+class NumpyTabulatorTest(TabulatorTestMixin, UnitCase):
+
+    def make_tabulator(self, contest, **kwargs):
+        return NumpyTabulator(contest, **kwargs)
+
+    def test_count__no_ballots(self):
+        contest = make_contest([], 3)
+        self.check_contest(contest)
+
+    def test_count__large_weights(self):
+        """Check the exact integer path for very large weights."""
+        ballots = [(2 ** 60, (1, 2)), (2 ** 60 + 1, (2, )), (3, (3, 1))]
+        self.check_contest(make_contest(ballots, 3))
+
+
+class NumpyTabulatorFallbackTest(TabulatorTestMixin, UnitCase):
+
+    """Tests of NumpyTabulator when NumPy is not installed."""
+
+    def make_tabulator(self, contest, **kwargs):
+        return NumpyTabulator(contest, **kwargs)
+
+    def check_contest(self, contest, **kwargs):
+        with patch('openrcv.counting.numpy', None):
+            super().check_contest(contest, **kwargs)
+
+
+class BatchEliminationTest(UnitCase):
+
+    """Checks that batch elimination never changes the winner."""
+
+    # Contest inputs in the style of the open-rcv-tests JSON test cases.
+    # Each case also lists the expected batch eliminations by round.
+    CASES = [
+        ({"_meta": {"name": "Three trailing candidates eliminated at once"},
+          "candidate_count": 5,
+          "ballots": ["20 5", "16 4", "1 1 2", "2 2 3", "4 3 4", "3 4 5"]},
+         [[1, 2, 3]]),
+        ({"_meta": {"name": "Batch of one each round"},
+          "candidate_count": 4,
+          "ballots": ["5 1", "4 2 1", "3 3 2", "2 4 3"]},
+         [[4], [2]]),
+        ({"_meta": {"name": "Winner in the first round"},
+          "candidate_count": 3,
+          "ballots": ["5 1", "2 2", "2 3"]},
+         []),
+    ]
+
+    def count(self, contest, batch_elimination):
+        return Tabulator(contest, batch_elimination=batch_elimination).count()
+
+    def get_winner(self, results):
+        return results.rounds[-1].elected
+
+    def test_cases(self):
+        for jsobj, expected_eliminated in self.CASES:
+            name = jsobj["_meta"]["name"]
+            with self.subTest(name=name):
+                contest = JsonCaseContestInput.from_jsobj(jsobj).to_model()
+                results = self.count(contest, batch_elimination=False)
+                batch_results = self.count(contest, batch_elimination=True)
+                self.assertEqual(self.get_winner(batch_results), self.get_winner(results))
+                eliminated = [r.eliminated for r in batch_results.rounds[:-1]]
+                self.assertEqual(eliminated, expected_eliminated)
+
+    def test_tied_trailing_candidates(self):
+        """Check that tied candidates that cannot win are eliminated together."""
+        jsobj = {"candidate_count": 4, "ballots": ["1 1 3", "1 2 3", "5 3", "6 4"]}
+        contest = JsonCaseContestInput.from_jsobj(jsobj).to_model()
+        results = self.count(contest, batch_elimination=False)
+        self.assertEqual(results.outcome.tied_last_place, {1, 2})
+        batch_results = self.count(contest, batch_elimination=True)
+        self.assertEqual(batch_results.rounds[0].eliminated, [1, 2])
+        self.assertEqual(self.get_winner(batch_results), [3])
+
+    def test_random(self):
+        for seed in range(30):
+            ballots = make_random_ballots(seed, ballot_count=300, candidate_count=10)
+            contest = make_contest(ballots, 10)
+            results = self.count(contest, batch_elimination=False)
+            if results.rounds[-1].elected is None:
+                # Then the contest ended in a tie.
+                continue
+            with self.subTest(seed=seed):
+                batch_results = self.count(contest, batch_elimination=True)
+                self.assertEqual(self.get_winner(batch_results), self.get_winner(results))
+                self.assertLessEqual(len(batch_results.rounds), len(results.rounds))
+
+
 # TODO: remove this after incorporating the test.
 class InternalBallotsNormalizerTest(UnitCase):
 
@@ -0,0 +1,114 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+from contextlib import contextmanager
+import json
+import os
+from tempfile import TemporaryDirectory
+
+from openrcv.counting import Tabulator
+from openrcv.incremental import IncrementalTally
+from openrcv.streams import ListResource
+from openrcv.test.test_counting import make_contest, make_random_ballots
+from openrcv.utiltest.helpers import UnitCase
+
+
+class _FailingResource(ListResource):
+
+    """A ListResource whose reading fails after the first ballot."""
+
+    @contextmanager
+    def open_read(self):
+        def iter_ballots():
+            yield self._seq[0]
+            raise ValueError("bad ballot")
+        yield iter_ballots()
+
+
+class IncrementalTallyTest(UnitCase):
+
+    def make_tally(self, batches):
+        tally = IncrementalTally(["A", "B", "C", "D", "E", "F"], name="Mayor")
+        for batch in batches:
+            tally.add_batch(ListResource(batch))
+        return tally
+
+    def make_batches(self):
+        ballots = make_random_ballots(0, ballot_count=300, candidate_count=6)
+        return [ballots[:100], ballots[100:250], ballots[250:]]
+
+    def assertCountsEqual(self, tally, ballots):
+        expected = Tabulator(make_contest(ballots, 6)).count()
+        actual = tally.count()
+        self.assertEqual([r.totals for r in actual.rounds],
+                         [r.totals for r in expected.rounds])
+        self.assertEqual(tally.first_round_totals, expected.rounds[0].totals)
+
+    def test_add_batch(self):
+        batches = self.make_batches()
+        tally = self.make_tally([])
+        ballots = []
+        for batch in batches:
+            with self.subTest(batch=len(ballots)):
+                weight = tally.add_batch(ListResource(batch))
+                self.assertEqual(weight, sum(w for w, choices in batch))
+                ballots.extend(batch)
+                self.assertCountsEqual(tally, ballots)
+        self.assertEqual(tally.batch_count, 3)
+
+    def test_count__does_not_reread(self):
+        batch = [(1, (1, )), (2, (2, 1))]
+        tally = self.make_tally([batch])
+        # Change the batch after it was absorbed.
+        batch[:] = [(5, (3, ))]
+        self.assertEqual(tally.count().rounds[0].totals[2], 2)
+
+    def test_add_batch__error(self):
+        tally = self.make_tally([[(1, (1, ))]])
+        with self.assertRaises(ValueError):
+            tally.add_batch(_FailingResource([(3, (2, )), (4, (3, ))]))
+        self.assertEqual(tally.batch_count, 1)
+        self.assertEqual(tally.total_weight, 1)
+        self.assertEqual(tally.first_round_totals[2], 0)
+
+    def test_save_and_load(self):
+        batches = self.make_batches()
+        tally = self.make_tally(batches[:2])
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "tally.json")
+            tally.save(path)
+            self.assertEqual(os.listdir(dir_path), ["tally.json"])
+            loaded = IncrementalTally.load(path)
+        self.assertEqual(loaded.name, "Mayor")
+        self.assertEqual(loaded.candidates, tally.candidates)
+        self.assertEqual(loaded.batch_count, 2)
+        self.assertEqual(loaded.first_round_totals, tally.first_round_totals)
+        loaded.add_batch(ListResource(batches[2]))
+        self.assertCountsEqual(loaded, batches[0] + batches[1] + batches[2])
+
+    def test_load__bad_version(self):
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "tally.json")
+            with open(path, "w") as f:
+                json.dump({'_meta': {'version': 99}}, f)
+            with self.assertRaises(ValueError):
+                IncrementalTally.load(path)
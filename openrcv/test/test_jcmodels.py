@@ -23,7 +23,7 @@
 from textwrap import dedent
 
 from openrcv import models
-from openrcv.jsonlib import JsonableError, JsonDeserializeError, JS_NULL
+from openrcv.jsonlib import to_json, JsonableError, JsonDeserializeError, JS_NULL
 from openrcv.jcmodels import (from_jsobj, JsonCaseBallot, JsonCaseContestInput,
                               JsonCaseRoundResult, JsonCaseTestOutput)
 from openrcv.models import ContestInput
@@ -187,6 +187,18 @@ class JsonCaseContestInputTest(UnitCase):
         expected.ballots = [JsonCaseBallot(weight=2, choices=(3, 1))]
         jc_contest.assert_equal(expected)
 
+    def test_from_model_ballots(self):
+        contest = ContestInput(name="Name", candidates=['Ann', 'Bob'])
+        ballots = iter([(2, (2, 1)), (1, ())])
+        jc_contest = JsonCaseContestInput.from_model_ballots(contest, ballots)
+        self.assertEqual(jc_contest.candidate_count, 2)
+        self.assertEqual(jc_contest.name, "Name")
+        self.assertEqual(to_json(jc_contest.to_jsobj()), to_json({
+            "_meta": {"name": "Name"},
+            "ballots": ["2 2 1", "1"],
+            "candidate_count": 2,
+        }))
+
     def test_to_model(self):
         cls = self.cls
         ballots = make_jc_ballots([(3, (2, 1))])
@@ -308,3 +320,13 @@ class JsonCaseTestOutputTest(UnitCase):
         results = JsonCaseTestOutput(rounds=rounds)
         self.assertEqual(results.to_jsobj(),
                          {'rounds': [{'totals': {'Ann': 2}}, {'totals': {'Carl': 4}}]})
+
+    def test_from_model__partial(self):
+        for partial in (False, True):
+            with self.subTest(partial=partial):
+                results = models.ContestResults(rounds=[], partial=partial)
+                jsobj = JsonCaseTestOutput.from_model(results).to_jsobj()
+                expected = {'rounds': []}
+                if partial:
+                    expected['partial'] = True
+                self.assertEqual(jsobj, expected)
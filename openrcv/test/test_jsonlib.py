@@ -25,7 +25,13 @@ Tests of jsonlib.
 
 """
 
-from openrcv.jsonlib import from_jsobj, Attribute, JsonableMixin, JS_NULL
+from io import BytesIO, StringIO
+import json
+
+from openrcv.jsonlib import (from_jsobj, iter_json, iter_json_events, iter_json_items,
+                             to_json, write_json, Attribute, JsonableMixin, JsonStream,
+                             JsonStreamError, JS_NULL)
+from openrcv.streams import StringResource
 from openrcv.utiltest.helpers import UnitCase
 
 
@@ -72,6 +78,144 @@ class ModuleTest(UnitCase):
         self.assertEqual(from_jsobj({'simple': {'bar': 'bar_value'}}, cls=_SampleParentJsonable), expected_sample)
 
 
+class IterJsonEventsTest(UnitCase):
+
+    doc = '{"a": [1, -2.5e+3, {"b": "x\\"y"}], "c": {}, "d": [], "e": true, "f": null, "g": "\u00e9"}'
+
+    expected = [
+        ('', 'start_map', None),
+        ('', 'map_key', 'a'),
+        ('a', 'start_array', None),
+        ('a.item', 'number', 1),
+        ('a.item', 'number', -2500.0),
+        ('a.item', 'start_map', None),
+        ('a.item', 'map_key', 'b'),
+        ('a.item.b', 'string', 'x"y'),
+        ('a.item', 'end_map', None),
+        ('a', 'end_array', None),
+        ('', 'map_key', 'c'),
+        ('c', 'start_map', None),
+        ('c', 'end_map', None),
+        ('', 'map_key', 'd'),
+        ('d', 'start_array', None),
+        ('d', 'end_array', None),
+        ('', 'map_key', 'e'),
+        ('e', 'boolean', True),
+        ('', 'map_key', 'f'),
+        ('f', 'null', None),
+        ('', 'map_key', 'g'),
+        ('g', 'string', '\u00e9'),
+        ('', 'end_map', None),
+    ]
+
+    def test_iter_json_events(self):
+        self.assertEqual(list(iter_json_events(StringIO(self.doc))), self.expected)
+
+    def test_iter_json_events__chunk_sizes(self):
+        """Check tokens split across chunks (including UTF-8 bytes)."""
+        for chunk_size in range(1, len(self.doc) + 1):
+            with self.subTest(chunk_size=chunk_size):
+                for f in (StringIO(self.doc), BytesIO(self.doc.encode('utf-8'))):
+                    self.assertEqual(list(iter_json_events(f, chunk_size=chunk_size)),
+                                     self.expected)
+
+    def test_iter_json_events__errors(self):
+        cases = [
+            '[1',
+            '[1}',
+            '{"a": 1]',
+            '{1: 2}',
+            '[tru]',
+            '[1, @]',
+            '1 2',
+            '[1 2]',
+            '[1,]',
+            '[,1]',
+            '[]]',
+            '{"a" 1}',
+            '{"a": 1,}',
+            '{"a": 1 "b": 2}',
+            '{"a":: 1}',
+            '{, "a": 1}',
+            '[01]',
+            '[1:2]',
+            '',
+        ]
+        for doc in cases:
+            with self.subTest(doc=doc):
+                with self.assertRaises(JsonStreamError):
+                    list(iter_json_events(StringIO(doc), chunk_size=2))
+
+    def test_iter_json_items(self):
+        for chunk_size in range(1, len(self.doc) + 1):
+            with self.subTest(chunk_size=chunk_size):
+                items = iter_json_items(BytesIO(self.doc.encode('utf-8')), "a",
+                                        chunk_size=chunk_size)
+                self.assertEqual(list(items), [1, -2500.0, {"b": 'x"y'}])
+
+    def test_iter_json_items__empty(self):
+        self.assertEqual(list(iter_json_items(StringIO(self.doc), "d")), [])
+
+    def test_iter_json_items__errors(self):
+        cases = [
+            '{"b": 1}',
+            '{"a": 1}',
+            '{"a": [1 2]}',
+            '{"a": [1,]}',
+            '{"a": [01]}',
+            '{"a": [1, @]}',
+            '{"a": [1, ',
+            '{"a": [{"x": ]}',
+        ]
+        for doc in cases:
+            with self.subTest(doc=doc):
+                with self.assertRaises(JsonStreamError):
+                    list(iter_json_items(StringIO(doc), "a", chunk_size=2))
+
+
+class IterJsonTest(UnitCase):
+
+    cases = [
+        {},
+        [],
+        "abc",
+        1.5,
+        {"a": [], "b": {}},
+        {"b": [1, None, True, 'x\u00e9"'], "a": {"y": [[2], {"z": 3}], "x": False}},
+        [{"a": 1}, [[]]],
+    ]
+
+    def test_iter_json(self):
+        for jsobj in self.cases:
+            with self.subTest(jsobj=jsobj):
+                self.assertEqual("".join(iter_json(jsobj)), to_json(jsobj))
+
+    def test_iter_json__compact(self):
+        for jsobj in self.cases:
+            with self.subTest(jsobj=jsobj):
+                expected = json.dumps(jsobj, separators=(',', ':'), sort_keys=True)
+                self.assertEqual("".join(iter_json(jsobj, compact=True)), expected)
+
+    def test_iter_json__stream(self):
+        items = (str(i) for i in range(2500))
+        chunks = list(iter_json({"a": JsonStream(items)}, compact=True))
+        # The items are encoded in batches.
+        self.assertTrue(len(chunks) > 3)
+        self.assertEqual(json.loads("".join(chunks)), {"a": [str(i) for i in range(2500)]})
+
+    def test_iter_json__jsonable(self):
+        obj = _SampleJsonable(bar=1, fizz="a")
+        self.assertEqual("".join(iter_json([obj], compact=True)), '[{"bar":1,"foo":"a"}]')
+
+    def test_to_json__stream(self):
+        self.assertEqual(to_json({"a": JsonStream([1])}), to_json({"a": [1]}))
+
+    def test_write_json(self):
+        resource = StringResource()
+        write_json({"b": JsonStream(["1 2"]), "a": 1}, resource=resource, compact=True)
+        self.assertEqual(resource.contents, '{"a":1,"b":["1 2"]}')
+
+
 class JsonableMixinTest(UnitCase):
 
     def test_init(self):
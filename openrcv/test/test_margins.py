@@ -0,0 +1,155 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+from collections import Counter
+from fractions import Fraction
+from itertools import combinations_with_replacement, permutations
+from random import Random
+
+from openrcv.margins import compute_irv_margin, get_chain, solve_ilp, solve_lp
+from openrcv.scenarios import ScenarioExplorer
+from openrcv.test.test_counting import make_contest, make_random_ballots
+from openrcv.utiltest.helpers import UnitCase
+
+
+def get_winners(ballots, candidate_count):
+    return ScenarioExplorer(make_contest(ballots, candidate_count)).explore().winners
+
+
+def brute_force_margin(ballots, candidate_count, max_changes):
+    """Return the margin by trying every set of changes, or None if it
+    is more than max_changes."""
+    winners = get_winners(ballots, candidate_count)
+    if len(winners) > 1:
+        return 0
+    winner = winners[0]
+    numbers = range(1, candidate_count + 1)
+    rankings = [choices for length in range(candidate_count + 1)
+                for choices in permutations(numbers, length)]
+    weights = Counter()
+    for weight, choices in ballots:
+        weights[choices] += weight
+    for change_count in range(1, max_changes + 1):
+        for removed in combinations_with_replacement(sorted(weights), change_count):
+            removed = Counter(removed)
+            if any(removed[choices] > weights[choices] for choices in removed):
+                continue
+            for added in combinations_with_replacement(rankings, change_count):
+                new_weights = weights - removed
+                new_weights.update(added)
+                new_ballots = list((weight, choices) for choices, weight in new_weights.items())
+                if any(w != winner for w in get_winners(new_ballots, candidate_count)):
+                    return change_count
+    return None
+
+
+class SolveLpTest(UnitCase):
+
+    def test_solve_lp(self):
+        # Maximize x + y subject to x + 2y <= 4 and 3x + y <= 6.
+        value, z = solve_lp([-1, -1], [{0: 1, 1: 2}, {0: 3, 1: 1}], [4, 6])
+        self.assertEqual(value, Fraction(-14, 5))
+        self.assertEqual(z, [Fraction(8, 5), Fraction(6, 5)])
+
+    def test_solve_lp__negative_rhs(self):
+        # Minimize x subject to x >= 3 and x <= 4.
+        self.assertEqual(solve_lp([1], [{0: -1}, {0: 1}], [-3, 4]), (3, [3]))
+
+    def test_solve_lp__infeasible(self):
+        self.assertIsNone(solve_lp([1], [{0: -1}, {0: 1}], [-3, 2]))
+
+    def test_solve_lp__unbounded(self):
+        with self.assertRaises(ValueError):
+            solve_lp([-1], [{0: -1}], [0])
+
+    def test_solve_ilp(self):
+        value, z = solve_ilp([-1, -1], [{0: 1, 1: 2}, {0: 3, 1: 1}], [4, 6])
+        self.assertEqual(value, -2)
+        self.assertTrue(all(v == int(v) for v in z))
+
+    def test_solve_ilp__upper_bound(self):
+        self.assertIsNone(solve_ilp([-1, -1], [{0: 1, 1: 2}, {0: 3, 1: 1}], [4, 6],
+                                    upper_bound=-2))
+
+
+class ModuleTest(UnitCase):
+
+    def test_get_chain(self):
+        positions = {5: 0, 6: 1, 7: 2}
+        cases = [
+            ((), ()),
+            ((1, 2), ()),
+            ((6, ), (1, )),
+            ((5, 7, 6), (0, 2)),
+            ((6, 5, 7), (1, 2)),
+            ((1, 7, 5, 6), (2, )),
+        ]
+        for choices, expected in cases:
+            with self.subTest(choices=choices):
+                self.assertEqual(get_chain(choices, positions), expected)
+
+
+class ComputeIrvMarginTest(UnitCase):
+
+    def test_brute_force(self):
+        rand = Random(0)
+        for trial in range(60):
+            candidate_count = rand.choice((2, 3))
+            numbers = range(1, candidate_count + 1)
+            ballots = []
+            for i in range(rand.randint(1, 5)):
+                choices = tuple(rand.sample(numbers, rand.randint(0, candidate_count)))
+                ballots.append((rand.randint(1, 3), choices))
+            with self.subTest(ballots=ballots):
+                results = compute_irv_margin(make_contest(ballots, candidate_count))
+                expected = brute_force_margin(ballots, candidate_count, max_changes=2)
+                if expected is None:
+                    self.assertTrue(results.margin is None or results.margin > 2)
+                else:
+                    self.assertEqual(results.margin, expected)
+
+    def test_elimination_order(self):
+        ballots = make_random_ballots(1, ballot_count=200, candidate_count=5)
+        results = compute_irv_margin(make_contest(ballots, 5))
+        self.assertTrue(results.exact)
+        self.assertEqual(results.margin, 2)
+        self.assertEqual(results.winner, 5)
+        order = results.elimination_order
+        self.assertEqual(sorted(order), [1, 2, 3, 4, 5])
+        self.assertNotEqual(order[-1], results.winner)
+
+    def test_tie(self):
+        results = compute_irv_margin(make_contest([(1, (1, )), (1, (2, ))], 2))
+        self.assertIsNone(results.winner)
+        self.assertEqual(results.margin, 0)
+
+    def test_one_candidate(self):
+        results = compute_irv_margin(make_contest([(3, (1, ))], 1))
+        self.assertEqual(results.winner, 1)
+        self.assertIsNone(results.margin)
+
+    def test_time_limit(self):
+        ballots = make_random_ballots(1, ballot_count=200, candidate_count=5)
+        results = compute_irv_margin(make_contest(ballots, 5), time_limit=0)
+        self.assertFalse(results.exact)
+        self.assertIsNone(results.margin)
+        self.assertEqual(results.lower_bound, 0)
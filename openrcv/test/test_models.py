@@ -20,10 +20,13 @@
 # DEALINGS IN THE SOFTWARE.
 #
 
+import os
+from tempfile import TemporaryDirectory
 from textwrap import dedent
 
 from openrcv import models
-from openrcv.models import normalize_ballots, normalize_ballots_to, BallotsResource, ContestInput
+from openrcv.models import (decode_ranking, encode_ranking, normalize_ballots,
+                            normalize_ballots_to, BallotsResource, BallotTrie, ContestInput, SQLiteBallotsResource)
 from openrcv import streams
 from openrcv.streams import ListResource
 from openrcv.utils import StringInfo
@@ -56,6 +59,13 @@ class NormalizeBallotsToTest(UnitCase):
             normalized = list(gen)
         self.assertEqual(normalized, [(3, ()), (4, (1,)), (2, (2,)), (1, (3,))])
 
+    def test_large_choices(self):
+        ballots = [(1, (70000, 2)), (1, (3, )), (2, (70000, 2))]
+        target = ListResource()
+        normalize_ballots_to(ListResource(ballots), target)
+        with target.reading() as gen:
+            self.assertEqual(list(gen), [(1, (3, )), (3, (70000, 2))])
+
 
 class NormalizeBallotTest(UnitCase):
 
@@ -133,6 +143,176 @@ class BallotsResourceTest(UnitCase):
         self.assertEqual(ballots, [(1, (2, 3))])
 
 
+class BallotTrieTest(UnitCase):
+
+    BALLOTS = [
+        (1, (2, 1)),
+        (1, ()),
+        (1, (2, 3, 1)),
+        (2, (2, )),
+        (4, (1, )),
+        (1, (2, 1)),
+    ]
+
+    def make_trie(self, ballots=None):
+        if ballots is None:
+            ballots = self.BALLOTS
+        return BallotTrie.build(ListResource(ballots))
+
+    def test_build(self):
+        trie = self.make_trie()
+        self.assertEqual(trie.count_ballots(), 10)
+        # The prefixes are: 1, 2, 2 1, 2 3, 2 3 1.
+        self.assertEqual(trie.node_count, 5)
+
+    def test_reading(self):
+        """Check that reading yields normalized ballots."""
+        trie = self.make_trie()
+        target = ListResource()
+        normalize_ballots_to(ListResource(self.BALLOTS), target)
+        with target.reading() as gen:
+            expected = list(gen)
+        self.assertResourceContents(trie, expected)
+
+    def test_writing(self):
+        trie = self.make_trie()
+        with trie.writing() as gen:
+            gen.send((2, (3, )))
+            gen.send((1, (3, )))
+        self.assertResourceContents(trie, [(3, (3, ))])
+        self.assertEqual(trie.node_count, 1)
+
+    def test_write_many(self):
+        trie = self.make_trie()
+        trie.write_many(self.BALLOTS, batch_size=2)
+        self.assertResourceContents(trie, list(self.make_trie().iter_ballots()))
+
+    def test_merge(self):
+        trie = self.make_trie(self.BALLOTS[:3])
+        other = self.make_trie(self.BALLOTS[3:])
+        trie.merge(other)
+        self.assertResourceContents(trie, list(self.make_trie().iter_ballots()))
+        self.assertEqual(trie.node_count, 5)
+        # Check that the other trie is unchanged.
+        self.assertEqual(other.count_ballots(), 7)
+
+    def test_copy(self):
+        trie = self.make_trie()
+        copy = trie.copy()
+        copy.add(1, (4, ))
+        self.assertEqual(trie.count_ballots(), 10)
+        self.assertEqual(copy.count_ballots(), 11)
+
+    def test_tabulate(self):
+        trie = self.make_trie()
+        cases = [
+            ({1, 2, 3}, {1: 4, 2: 5, 3: 0}),
+            ({1, 3}, {1: 6, 3: 1}),
+            ({3}, {3: 1}),
+        ]
+        for candidate_numbers, expected in cases:
+            with self.subTest(candidate_numbers=candidate_numbers):
+                self.assertEqual(trie.tabulate(candidate_numbers), expected)
+
+
+class SQLiteBallotsResourceTest(UnitCase):
+
+    BALLOTS = BallotTrieTest.BALLOTS
+
+    def test_encode_ranking(self):
+        self.assertEqual(encode_ranking(()), b"")
+        self.assertEqual(encode_ranking((1, 258)), b"\x00\x01\x01\x02")
+        self.assertEqual(encode_ranking((1, 65280)),
+                         b"\x00\x01\xff\x00\x00\x00\x00\x00\x00\xff\x00")
+        for choices in [(-1, ), (1 << 64, ), (1, -1)]:
+            with self.subTest(choices=choices):
+                with self.assertRaises(ValueError):
+                    encode_ranking(choices)
+
+    def test_decode_ranking(self):
+        cases = [(), (1, 255), (65279, ), (65280, ), (1, 1 << 40, 255, 70000)]
+        for choices in cases:
+            with self.subTest(choices=choices):
+                self.assertEqual(decode_ranking(encode_ranking(choices)), choices)
+
+    def test_reading__large_choices(self):
+        """Check that large choices round-trip and sort like tuples."""
+        ballots = [(1, (1, )), (1, (1, 2)), (1, (1, 255)), (1, (1, 70000)),
+                   (1, (1, 70000, 2)), (1, (2, )), (1, (65279, )), (1, (65280, )),
+                   (1, (1 << 40, ))]
+        with SQLiteBallotsResource.temp() as resource:
+            resource.add_ballots(reversed(ballots))
+            self.assertResourceContents(resource, ballots)
+
+    def test_reading__special_path(self):
+        """Check a path with characters that are special in URIs."""
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "a?b#c%20d.sqlite")
+            resource = SQLiteBallotsResource(path)
+            resource.add_ballots([(2, (1, ))])
+            self.assertResourceContents(resource, [(2, (1, ))])
+            self.assertEqual(resource.count_ballots(), 2)
+
+    def test_writing(self):
+        with SQLiteBallotsResource.temp() as resource:
+            self.assertResourceContents(resource, [])
+            self.assertEqual(resource.count_ballots(), 0)
+            with resource.writing() as gen:
+                for ballot in self.BALLOTS:
+                    gen.send(ballot)
+            expected = list(BallotTrie.build(ListResource(self.BALLOTS)).iter_ballots())
+            self.assertResourceContents(resource, expected)
+            self.assertEqual(resource.count(), 5)
+            self.assertEqual(resource.count_ballots(), 10)
+            # Check that writing again replaces the ballots.
+            with resource.writing() as gen:
+                gen.send((1, (3, )))
+            self.assertResourceContents(resource, [(1, (3, ))])
+
+    def test_writing__error(self):
+        """Check that an error in the with block leaves no ballots."""
+        with SQLiteBallotsResource.temp() as resource:
+            resource.write_batch_size = 2
+            with self.assertRaises(RuntimeError):
+                with resource.writing() as gen:
+                    for ballot in self.BALLOTS:
+                        gen.send(ballot)
+                    raise RuntimeError
+            self.assertResourceContents(resource, [])
+
+    def test_write_many(self):
+        with SQLiteBallotsResource.temp() as resource:
+            resource.add_ballots([(1, (3, ))])
+            resource.write_many(self.BALLOTS, batch_size=2)
+            expected = list(BallotTrie.build(ListResource(self.BALLOTS)).iter_ballots())
+            self.assertResourceContents(resource, expected)
+
+    def test_add_ballots(self):
+        """Check adding in several batches, with duplicates across batches."""
+        with SQLiteBallotsResource.temp() as resource:
+            resource.write_batch_size = 2
+            resource.add_ballots(self.BALLOTS)
+            resource.add_ballots([(3, (2, 1)), (1, (300, ))])
+            self.assertResourceContents(resource, [
+                (1, ()), (4, (1, )), (2, (2, )), (5, (2, 1)), (1, (2, 3, 1)), (1, (300, ))])
+
+    def test_reading__batches(self):
+        ballots = [(1, (n, )) for n in range(1, 30)]
+        with SQLiteBallotsResource.temp() as resource:
+            resource.add_ballots(reversed(ballots))
+            resource.read_batch_size = 4
+            self.assertResourceContents(resource, ballots)
+
+    def test_reading__concurrent(self):
+        """Check that two readers can read the file at the same time."""
+        with SQLiteBallotsResource.temp() as resource:
+            resource.add_ballots(self.BALLOTS)
+            other = SQLiteBallotsResource(resource.path)
+            with resource.reading() as gen1:
+                with other.reading() as gen2:
+                    self.assertEqual(list(gen1), list(gen2))
+
+
 class ContestInputTest(UnitCase):
 
     def test_init__defaults(self):
@@ -20,19 +20,21 @@
 # DEALINGS IN THE SOFTWARE.
 #
 
-from io import StringIO
+from io import BytesIO, StringIO
 import os
 from textwrap import dedent
 import unittest
 
-from openrcv.models import ContestInput
-from openrcv.parsing import BLTParser, ParsingError
+from openrcv.models import BallotTrie, ContestInput
+from openrcv.parsing import BLTParser, ChunkedBLTParser, ParsingError
 from openrcv.utils import PathInfo, StringInfo
 from openrcv.utiltest.helpers import UnitCase
 
 
 class BLTParserTest(UnitCase):
 
+    parser_cls = BLTParser
+
     BLT_STRING = """\
     4 2
     -3
@@ -47,7 +49,7 @@ class BLTParserTest(UnitCase):
     """
 
     def make_parser(self, blt_string, output_info=None):
-        parser = BLTParser(output_info)
+        parser = self.parser_cls(output_info)
         blt_stream = StringInfo(blt_string)
         return parser, blt_stream
 
@@ -64,11 +66,11 @@ class BLTParserTest(UnitCase):
 
     def test_init(self):
         output_info = StringInfo()
-        parser = BLTParser(output_info)
+        parser = self.parser_cls(output_info)
         self.assertIs(parser.output_info, output_info)
 
     def test_init__no_args(self):
-        parser = BLTParser()
+        parser = self.parser_cls()
         output_info = parser.output_info
         self.assertIs(type(output_info), PathInfo)
         self.assertEqual(output_info.path, os.devnull)
@@ -105,9 +107,81 @@ class BLTParserTest(UnitCase):
                 with self.assertRaises(ParsingError):
                     info = self.parse_blt(self.BLT_STRING + suffix)
 
+    def test_parse__no_withdrawn_line(self):
+        """Test a BLT string whose second line is the first ballot line."""
+        output_info = StringInfo()
+        blt_string = dedent(self.BLT_STRING).replace("-3\n", "")
+        info = self.parse_blt(blt_string, output_info=output_info)
+        self.assertEqual(info.withdrawn, [])
+        self.assertEqual(info.ballot_count, 2)
+        self.assertEqual(output_info.value, "2 2\n1 2 4 3 1\n")
+
     def test_parse__no_output_info(self):
         """Test passing no output StreamInfo object."""
         info = self.parse_blt(self.BLT_STRING)
         # TODO: test the other attributes.
         self.assertEqual(type(info), ContestInput)
         self.assertEqual(info.ballot_count, 2)
+
+    def test_parse__error_line_number(self):
+        blt_string = dedent(self.BLT_STRING).replace("1 2 4 3 1 0", "1 2 x 0")
+        parser = self.parser_cls()
+        with self.assertRaises(ParsingError) as cm:
+            parser.parse_file(StringIO(blt_string))
+        self.assertStartsWith(str(cm.exception), "error while parsing line 4: '1 2 x 0")
+
+
+class ChunkedBLTParserTest(BLTParserTest):
+
+    parser_cls = ChunkedBLTParser
+
+    def test_parse__chunk_sizes(self):
+        blt_string = dedent("""\
+        3 1
+        -2
+        2 2 0
+        1 2 3 1 0
+        2 2 0
+        3 0
+        0
+        "Ann"
+        "Bob"
+        "Carl \u00e9"
+        "Election"
+        """)
+        for chunk_size in range(1, len(blt_string) + 2):
+            for data in (blt_string, blt_string.encode('utf-8')):
+                with self.subTest(chunk_size=chunk_size, data=data):
+                    output_info = StringInfo()
+                    parser = ChunkedBLTParser(output_info, chunk_size=chunk_size)
+                    f = StringIO(data) if isinstance(data, str) else BytesIO(data)
+                    info = parser.parse_file(f)
+                    self.assertEqual(output_info.value, "2 2\n1 2 3 1\n2 2\n3\n")
+                    self.assertEqual(info.ballot_count, 4)
+                    self.assertEqual(info.withdrawn, [2])
+                    self.assertEqual(info.candidates, ['"Ann"', '"Bob"', '"Carl \u00e9"'])
+                    self.assertEqual(info.name, '"Election"')
+
+    def test_parse__error_line_number__chunks(self):
+        lines = ["3 1", "-2"] + ["1 2 0"] * 20 + ["1 x 0"] + ["1 2 0", "0", "A", "B", "C", "E"]
+        blt_string = "\n".join(lines) + "\n"
+        for chunk_size in (1, 7, 1000):
+            with self.subTest(chunk_size=chunk_size):
+                parser = ChunkedBLTParser(chunk_size=chunk_size)
+                with self.assertRaises(ParsingError) as cm:
+                    parser.parse_file(BytesIO(blt_string.encode('ascii')))
+                self.assertEqual(str(cm.exception), "error while parsing line 23: '1 x 0'")
+
+    def test_parse__ballots_resource(self):
+        blt_string = "3 1\n\n1 2 0\n2 3 1 0\n1 2 0\n0\nA\nB\nC\nE\n"
+        for chunk_size in (3, 1000):
+            with self.subTest(chunk_size=chunk_size):
+                trie = BallotTrie()
+                parser = ChunkedBLTParser(chunk_size=chunk_size, ballots_resource=trie)
+                info = parser.parse_file(BytesIO(blt_string.encode('ascii')))
+                self.assertEqual(info.ballot_count, 3)
+                self.assertEqual(list(trie.iter_ballots()), [(2, (2, )), (2, (3, 1))])
+
+    def test_parse__no_ballots_end(self):
+        with self.assertRaises(ParsingError):
+            self.parse_blt("2 1\n-2\n1 2 0\n")
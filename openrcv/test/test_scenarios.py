@@ -0,0 +1,95 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+from openrcv.counting import Tabulator
+from openrcv.scenarios import ScenarioExplorer
+from openrcv.test.test_counting import make_contest, make_random_ballots, SAMPLE_CONTESTS
+from openrcv.utiltest.helpers import UnitCase
+
+
+class ScenarioExplorerTest(UnitCase):
+
+    def explore(self, ballots, candidate_count, **kwargs):
+        explorer = ScenarioExplorer(make_contest(ballots, candidate_count))
+        return explorer, explorer.explore(**kwargs)
+
+    def test_explore__no_tie(self):
+        """Check agreement with Tabulator when there are no ties."""
+        for seed in range(10):
+            with self.subTest(seed=seed):
+                ballots = make_random_ballots(seed, ballot_count=100, candidate_count=5)
+                contest = make_contest(ballots, 5)
+                expected = Tabulator(contest).count()
+                if getattr(expected.outcome, 'tied_last_place', None):
+                    continue
+                results = ScenarioExplorer(contest).explore()
+                self.assertEqual(results.winners, expected.rounds[-1].elected)
+                self.assertEqual(results.tie_states, [])
+                outcome = results.outcomes[0]
+                self.assertEqual(outcome.path_count, 1)
+                self.assertEqual(len(outcome.elimination_order), len(expected.rounds) - 1)
+
+    def test_explore__tie(self):
+        # Candidates 3 and 4 tie for last.  Either way, 1 and 2 then tie
+        # once 3 and 4 are both eliminated.
+        ballots = [(4, (1, )), (4, (2, )), (1, (3, 1)), (1, (4, 2))]
+        explorer, results = self.explore(ballots, 4)
+        self.assertEqual(results.tie_states, [frozenset(), frozenset({3, 4})])
+        outcomes = {outcome.winner: outcome for outcome in results.outcomes}
+        self.assertEqual(sorted(outcomes), [1, 2])
+        self.assertEqual(outcomes[1].elimination_order, [3, 4, 2])
+        self.assertEqual(outcomes[2].elimination_order, [3, 4, 1])
+        self.assertEqual(outcomes[1].path_count, 2)
+        self.assertEqual(outcomes[2].path_count, 2)
+        # The state {3, 4} is reached two ways but counted once.
+        self.assertEqual(explorer.tabulation_count, 4)
+
+    def test_explore__all_tied(self):
+        ballots, candidate_count = SAMPLE_CONTESTS[2]
+        explorer, results = self.explore(ballots, candidate_count)
+        self.assertEqual(results.winners, [1, 2])
+
+    def test_explore__withdrawn(self):
+        ballots = [(3, (1, )), (2, (2, 3)), (2, (3, 2))]
+        explorer, results = self.explore(ballots, 3)
+        self.assertEqual(results.winners, [2, 3])
+        results = explorer.explore(withdrawn=[1])
+        self.assertEqual(results.withdrawn, frozenset({1}))
+        self.assertEqual(results.winners, [2, 3])
+        results = explorer.explore(withdrawn=[2])
+        self.assertEqual(results.winners, [3])
+
+    def test_explore_withdrawals(self):
+        ballots = [(3, (1, )), (2, (2, 3)), (2, (3, 2))]
+        explorer = ScenarioExplorer(make_contest(ballots, 3))
+        explorer.explore()
+        count = explorer.tabulation_count
+        all_results = explorer.explore_withdrawals()
+        self.assertEqual({candidate: results.winners for candidate, results
+                          in all_results.items()}, {1: [2, 3], 2: [3], 3: [2]})
+        # Withdrawing 2 or 3 reaches states already counted.
+        self.assertEqual(explorer.tabulation_count, count + 1)
+
+    def test_explore__no_candidates(self):
+        ballots = [(1, (1, ))]
+        explorer, results = self.explore(ballots, 1, withdrawn=[1])
+        self.assertEqual(results.winners, [None])
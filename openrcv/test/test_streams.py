@@ -28,6 +28,7 @@ from tempfile import TemporaryDirectory
 from openrcv import streams
 from openrcv.streams import (tracked, FilePathResource,
                              ReadWriteFileResource, StringResource)
+from openrcv.utils import COMPRESSION_EXTENSION
 from openrcv.utiltest.helpers import UnitCase
 
 
@@ -140,6 +141,27 @@ class StreamResourceTestMixin(object):
                 pass
             self.assertResourceContents(resource, [])
 
+    def test_write_many(self):
+        with self.resource() as resource:
+            resource.write_many(iter(['c\n', 'd\n', 'e\n']), batch_size=2)
+            self.assertResourceContents(resource, ['c\n', 'd\n', 'e\n'])
+
+    def test_batch_writing(self):
+        with self.resource() as resource:
+            with resource.batch_writing() as write_batch:
+                write_batch(['c\n', 'd\n'])
+                write_batch([])
+                write_batch(['e\n'])
+            self.assertResourceContents(resource, ['c\n', 'd\n', 'e\n'])
+
+    def test_batch_writing__deletes(self):
+        """Check that batch_writing() deletes the current data."""
+        with self.resource() as resource:
+            self.assertResourceContents(resource, ['a\n', 'b\n'])
+            with resource.batch_writing():
+                pass
+            self.assertResourceContents(resource, [])
+
 
 class ListResourceTest(StreamResourceTestMixin, UnitCase):
 
@@ -184,6 +206,65 @@ class FilePathResourceTest(StreamResourceTestMixin, UnitCase):
                 f.write('a\nb\n')
             yield FilePathResource(path)
 
+    def test_byte_ranges(self):
+        lines = ['%d\n' % (10 ** (i % 4)) for i in range(20)]
+        with TemporaryDirectory() as dirname:
+            path = os.path.join(dirname, 'temp.txt')
+            with open(path, 'w') as f:
+                f.write(''.join(lines))
+            resource = FilePathResource(path)
+            for count in (1, 3, 7, 30):
+                with self.subTest(count=count):
+                    byte_ranges = resource.byte_ranges(count)
+                    self.assertTrue(len(byte_ranges) <= count)
+                    chunks = []
+                    with open(path) as f:
+                        for start, end in byte_ranges:
+                            f.seek(start)
+                            chunks.append(f.read(end - start))
+                    # Each range should consist of whole lines.
+                    for chunk in chunks:
+                        self.assertTrue(chunk.endswith('\n'))
+                    self.assertEqual(''.join(chunks), ''.join(lines))
+
+    def test_byte_ranges__empty(self):
+        with TemporaryDirectory() as dirname:
+            path = os.path.join(dirname, 'temp.txt')
+            open(path, 'w').close()
+            self.assertEqual(FilePathResource(path).byte_ranges(3), [])
+
+
+    def test_byte_ranges__compressed(self):
+        with TemporaryDirectory() as dirname:
+            path = os.path.join(dirname, 'temp.txt.gz')
+            resource = FilePathResource(path, compression=COMPRESSION_EXTENSION)
+            with resource.writing() as gen:
+                gen.send('a\n')
+            with self.assertRaises(ValueError):
+                resource.byte_ranges(2)
+
+
+class CompressedFilePathResourceTest(StreamResourceTestMixin, UnitCase):
+
+    """FilePathResource tests with a compressed file."""
+
+    cls = streams.FilePathResource
+
+    @contextmanager
+    def resource(self):
+        with TemporaryDirectory() as dirname:
+            path = os.path.join(dirname, 'temp.txt.bz2')
+            resource = FilePathResource(path, compression=COMPRESSION_EXTENSION)
+            with resource.writing() as gen:
+                gen.send('a\nb\n')
+            yield resource
+
+    def test_is_compressed(self):
+        with self.resource() as resource:
+            self.assertTrue(resource.is_compressed())
+            resource.compression = False
+            self.assertFalse(resource.is_compressed())
+
 
 class ReadWriteFileResourceTest(StreamResourceTestMixin, UnitCase):
 
@@ -255,3 +336,24 @@ class ConvertingResourceTest(UnitCase):
                 gen.send(i)
         self.assertGeneratorClosed(gen)
         self.assertResourceContents(backing, [0, 3, 6, 9])
+
+    def test_write_many(self):
+        backing = streams.ListResource()
+        resource = streams.ConvertingResource(backing, converter=_Converter())
+        resource.write_many(range(4), batch_size=3)
+        self.assertResourceContents(backing, [0, 3, 6, 9])
+
+    def test_write_many__to_resource_many(self):
+        """Check that a Converter's to_resource_many() converts each batch."""
+        batches = []
+
+        class Converter(streams.Converter):
+            def to_resource_many(self, items):
+                batches.append(list(items))
+                return [-item for item in items]
+
+        backing = streams.ListResource()
+        resource = streams.ConvertingResource(backing, converter=Converter())
+        resource.write_many(range(3), batch_size=2)
+        self.assertEqual(batches, [[0, 1], [2]])
+        self.assertResourceContents(backing, [0, -1, -2])
@@ -0,0 +1,161 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+from fractions import Fraction
+
+from openrcv.counting import Tabulator
+from openrcv.stv import (count_stv_contest, get_droop_quota, make_arithmetic,
+                         FixedPointArithmetic, FractionArithmetic)
+from openrcv.test.test_counting import make_contest, make_random_ballots
+from openrcv.utiltest.helpers import UnitCase
+
+
+class ModuleTest(UnitCase):
+
+    def test_get_droop_quota(self):
+        cases = [
+            (100, 1, 51),
+            (100, 3, 26),
+            (11, 2, 4),
+            (0, 1, 1),
+        ]
+        for total, seat_count, expected in cases:
+            with self.subTest(total=total, seat_count=seat_count):
+                self.assertEqual(get_droop_quota(total, seat_count), expected)
+
+    def test_make_arithmetic(self):
+        self.assertIs(type(make_arithmetic()), FixedPointArithmetic)
+        self.assertIs(type(make_arithmetic('fraction')), FractionArithmetic)
+        arithmetic = FractionArithmetic()
+        self.assertIs(make_arithmetic(arithmetic), arithmetic)
+        with self.assertRaises(ValueError):
+            make_arithmetic('foo')
+
+
+class FixedPointArithmeticTest(UnitCase):
+
+    def test_transfer(self):
+        arithmetic = FixedPointArithmetic(places=3)
+        value = arithmetic.from_weight(2)
+        self.assertEqual(value, 2000)
+        transfer_value = arithmetic.transfer_value(1, 3)
+        self.assertEqual(transfer_value, 333)
+        self.assertEqual(arithmetic.transfer(value, transfer_value), 666)
+
+    def test_to_number(self):
+        arithmetic = FixedPointArithmetic(places=3)
+        self.assertEqual(arithmetic.to_number(2000), 2)
+        self.assertEqual(arithmetic.to_number(2500), Fraction(5, 2))
+
+
+class STVTabulatorTest(UnitCase):
+
+    def make_contest(self, ballots, candidate_count, seat_count):
+        contest = make_contest(ballots, candidate_count)
+        contest.seat_count = seat_count
+        return contest
+
+    def test_count__surplus_transfer(self):
+        # The quota is 4.  Candidate 1 is elected with a surplus of 2,
+        # which is exactly enough to elect candidate 3.
+        ballots = [(6, (1, 3)), (3, (2, )), (2, (3, ))]
+        contest = self.make_contest(ballots, 3, seat_count=2)
+        results = count_stv_contest(contest, arithmetic='fraction')
+        rounds = results.rounds
+        self.assertEqual(len(rounds), 2)
+        self.assertEqual(rounds[0].totals, {1: 6, 2: 3, 3: 2})
+        self.assertEqual(rounds[0].elected, [1])
+        self.assertEqual(rounds[1].totals, {1: 4, 2: 3, 3: 4})
+        self.assertEqual(rounds[1].elected, [3])
+        self.assertEqual(results.outcome.elected, [1, 3])
+
+    def test_count__fixed_point_truncation(self):
+        """Check that truncated transfer values still fill the seats."""
+        ballots = [(6, (1, 3)), (3, (2, )), (2, (3, ))]
+        contest = self.make_contest(ballots, 3, seat_count=2)
+        results = count_stv_contest(contest, arithmetic=FixedPointArithmetic(places=3))
+        # The transfer value 2/6 truncates to 0.333, so candidate 3 falls
+        # just short of the quota and is elected after candidate 2 is
+        # eliminated.
+        self.assertEqual(results.rounds[1].totals[3], Fraction(3998, 1000))
+        self.assertEqual(results.rounds[1].eliminated, [2])
+        self.assertEqual(results.outcome.elected, [1, 3])
+
+    def test_count__elimination(self):
+        # The quota is 5.  Candidate 4 is eliminated, which elects 2.
+        ballots = [(5, (1, )), (3, (2, )), (3, (3, )), (2, (4, 2))]
+        contest = self.make_contest(ballots, 4, seat_count=2)
+        results = count_stv_contest(contest)
+        rounds = results.rounds
+        self.assertEqual(rounds[0].elected, [1])
+        self.assertEqual(rounds[0].eliminated, [4])
+        self.assertEqual(rounds[1].elected, [2])
+        self.assertEqual(results.outcome.elected, [1, 2])
+
+    def test_count__tie(self):
+        ballots = [(5, (1, )), (2, (2, )), (2, (3, )), (1, (4, ))]
+        contest = self.make_contest(ballots, 4, seat_count=3)
+        results = count_stv_contest(contest, arithmetic='fraction')
+        # Candidate 4 is eliminated, and then 2 and 3 remain tied for two
+        # seats, which elects both.
+        self.assertEqual(results.outcome.elected, [1, 2, 3])
+        ballots = [(5, (1, )), (2, (2, )), (2, (3, )), (2, (4, ))]
+        contest = self.make_contest(ballots, 4, seat_count=2)
+        results = count_stv_contest(contest, arithmetic='fraction')
+        self.assertEqual(results.outcome.tied_last_place, {2, 3, 4})
+
+    def test_count__withdrawn(self):
+        # Without the withdrawal, candidate 3 would reach the quota of 5.
+        ballots = [(5, (3, 1, 2)), (3, (2, )), (2, (4, )), (2, (1, ))]
+        contest = self.make_contest(ballots, 4, seat_count=2)
+        contest.withdrawn = [3]
+        results = count_stv_contest(contest, arithmetic='fraction')
+        rounds = results.rounds
+        self.assertEqual(rounds[0].totals, {1: 7, 2: 3, 4: 2})
+        # Candidate 1's surplus of 2 moves 2/7 of the first ballots to 2.
+        self.assertEqual(rounds[1].totals, {1: 5, 2: Fraction(31, 7), 4: 2})
+        self.assertEqual(results.outcome.elected, [1, 2])
+
+    def test_count__single_seat_matches_irv(self):
+        for seed in range(10):
+            ballots = make_random_ballots(seed, ballot_count=200, candidate_count=6)
+            contest = self.make_contest(ballots, 6, seat_count=1)
+            irv_results = Tabulator(contest).count()
+            irv_winner = irv_results.rounds[-1].elected
+            if irv_winner is None:
+                continue
+            with self.subTest(seed=seed):
+                results = count_stv_contest(contest)
+                self.assertEqual(results.outcome.elected, irv_winner)
+
+    def test_count__arithmetic_agrees(self):
+        """Check that the arithmetic backends elect the same candidates."""
+        for seed in range(20):
+            ballots = make_random_ballots(seed, ballot_count=300, candidate_count=9)
+            contest = self.make_contest(ballots, 9, seat_count=3)
+            exact = count_stv_contest(contest, arithmetic='fraction')
+            if getattr(exact.outcome, 'tied_last_place', None):
+                continue
+            with self.subTest(seed=seed):
+                fixed = count_stv_contest(contest, arithmetic='fixed')
+                self.assertEqual(fixed.outcome.elected, exact.outcome.elected)
+                self.assertEqual(len(fixed.outcome.elected), 3)
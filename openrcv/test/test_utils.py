@@ -20,12 +20,96 @@
 # DEALINGS IN THE SOFTWARE.
 #
 
+import os
 import sys
+from tempfile import TemporaryDirectory
 
-from openrcv.utils import ObjectExtension, ReprMixin, StringInfo, UncloseableFile
+from openrcv.utils import (detect_compression, logged_open, ObjectExtension, ReprMixin,
+                           StringInfo, UncloseableFile, COMPRESSION_AUTO,
+                           COMPRESSION_EXTENSION)
 from openrcv.utiltest.helpers import UnitCase
 
 
+class LoggedOpenTest(UnitCase):
+
+    def test_compression(self):
+        cases = [
+            ("ballots.txt", None, b"1 2\n"),
+            ("ballots.txt.gz", 'gzip', b"\x1f\x8b"),
+            ("ballots.txt.bz2", 'bz2', b"BZh"),
+            ("ballots.txt.xz", 'xz', b"\xfd7zXZ\x00"),
+        ]
+        with TemporaryDirectory() as dir_path:
+            for file_name, compression, start in cases:
+                with self.subTest(file_name=file_name):
+                    path = os.path.join(dir_path, file_name)
+                    with logged_open(path, "w", encoding="ascii",
+                                     compression=COMPRESSION_EXTENSION) as f:
+                        f.write("1 2\n" * 1000)
+                    with open(path, "rb") as f:
+                        self.assertStartsWith(f.read(), start)
+                    self.assertEqual(detect_compression(path), compression)
+                    with logged_open(path, encoding="ascii",
+                                     compression=COMPRESSION_EXTENSION) as f:
+                        self.assertEqual(f.read(), "1 2\n" * 1000)
+                    # Check that COMPRESSION_AUTO detects the compression
+                    # from the magic bytes rather than the extension.
+                    new_path = os.path.join(dir_path, "ballots")
+                    os.replace(path, new_path)
+                    with logged_open(new_path, encoding="ascii",
+                                     compression=COMPRESSION_AUTO) as f:
+                        self.assertEqual(f.read(), "1 2\n" * 1000)
+                    with logged_open(new_path, "rb", compression=COMPRESSION_AUTO) as f:
+                        self.assertEqual(f.read(4), b"1 2\n")
+
+    def test_compression__explicit(self):
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "ballots.txt")
+            with logged_open(path, "wb", compression='gzip') as f:
+                f.write(b"abc")
+            with logged_open(path, "rb") as f:
+                self.assertStartsWith(f.read(), b"\x1f\x8b")
+            with logged_open(path, "rb", compression=COMPRESSION_AUTO) as f:
+                self.assertEqual(f.read(), b"abc")
+
+    def test_compression__default(self):
+        """Check that files are not compressed unless the caller opts in."""
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "ballots.txt.gz")
+            with logged_open(path, "w", encoding="ascii") as f:
+                f.write("1 2\n")
+            self.assertIsNone(detect_compression(path))
+            with logged_open(path, encoding="ascii") as f:
+                self.assertEqual(f.read(), "1 2\n")
+
+    def test_compression__no_sniffing(self):
+        """Check that text that looks compressed is read as is by default."""
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "notes.txt")
+            with open(path, "w") as f:
+                f.write("BZh is not bzip2\n")
+            with logged_open(path) as f:
+                self.assertEqual(f.read(), "BZh is not bzip2\n")
+
+    def test_compression__keyword_mode(self):
+        with TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, "ballots.txt.gz")
+            with logged_open(path, mode="wt", encoding="ascii",
+                             compression=COMPRESSION_EXTENSION) as f:
+                f.write("1 2\n")
+            # COMPRESSION_AUTO should not sniff a file opened for writing.
+            with logged_open(path, mode="wt", encoding="ascii",
+                             compression=COMPRESSION_AUTO) as f:
+                f.write("3 4\n")
+            self.assertEqual(detect_compression(path), 'gzip')
+            with logged_open(path, mode="rt", encoding="ascii",
+                             compression=COMPRESSION_AUTO) as f:
+                self.assertEqual(f.read(), "3 4\n")
+
+    def test_detect_compression__missing(self):
+        self.assertIsNone(detect_compression("/does/not/exist"))
+
+
 class ReprMixinTest(UnitCase):
 
     class ReprSample(ReprMixin):
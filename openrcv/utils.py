@@ -24,11 +24,16 @@
 Utility functions.
 """
 
+import bz2
 from contextlib import closing, contextmanager
 from datetime import datetime
+import gzip
+import io
 from io import StringIO
 import json
+from itertools import islice
 import logging
+import lzma
 import os
 import shutil
 import timeit
@@ -41,6 +46,40 @@ ENCODING_INTERNAL_BALLOTS = "ascii"
 ENCODING_JSON = "utf-8"
 FILE_ENCODING = "utf-8"
 
+# The compression modules, keyed by compression name.
+COMPRESSION_MODULES = {
+    'bz2': bz2,
+    'gzip': gzip,
+    'xz': lzma,
+}
+
+# The magic bytes at the start of a compressed file.
+COMPRESSION_MAGIC = (
+    (b"\x1f\x8b", 'gzip'),
+    (b"BZh", 'bz2'),
+    (b"\xfd7zXZ\x00", 'xz'),
+)
+
+# The compression argument to logged_open() to detect the compression of
+# a file from its magic bytes when reading, and to choose it from the file
+# extension when writing.
+COMPRESSION_AUTO = 'auto'
+
+# The compression argument to logged_open() to choose the compression of
+# a file from its extension (e.g. ".gz").
+COMPRESSION_EXTENSION = 'extension'
+
+# The compression of a file with the given extension.
+COMPRESSION_EXTENSIONS = {
+    '.bz2': 'bz2',
+    '.gz': 'gzip',
+    '.xz': 'xz',
+}
+
+# The size of the read buffer when decompressing.  Decompressors are
+# much faster when asked for large blocks.
+DECOMPRESS_BUFFER_SIZE = 1 << 20
+
 log = logging.getLogger(__name__)
 
 
@@ -64,6 +103,16 @@ def fill(text, width=70):
     return text
 
 
+def iter_batches(iterable, size):
+    """Return an iterator over lists of up to size items of an iterable."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
 def join_values(values):
     """Return the values as a space-delimited string."""
     return " ".join((str(v) for v in values))
@@ -86,20 +135,93 @@ def log_create_dir(path):
     log.info("creating dir: %s" % path)
 
 
-def logged_open(*args, **kwargs):
+def detect_compression(path):
+    """Return the compression of a file from its magic bytes, or None.
+
+    None is also returned if the file cannot be read.
+    """
     try:
-        mode = args[1]
-    except IndexError:
-        mode = 'r'
+        with open(path, "rb") as f:
+            start = f.read(6)
+    except OSError:
+        return None
+    for magic, compression in COMPRESSION_MAGIC:
+        if start.startswith(magic):
+            return compression
+    return None
+
+
+def get_path_compression(path):
+    """Return the compression of a file based on its extension, or None."""
+    ext = os.path.splitext(path)[1].lower()
+    return COMPRESSION_EXTENSIONS.get(ext)
+
+
+def get_compression(path, mode="r", compression=None):
+    """Return the compression logged_open() would use, or None for none.
+
+    Arguments:
+      compression: see logged_open().
+    """
+    if compression not in (COMPRESSION_AUTO, COMPRESSION_EXTENSION):
+        return compression or None
+    if not isinstance(path, str) or "+" in mode:
+        return None
+    if compression == COMPRESSION_AUTO and "r" in mode:
+        return detect_compression(path)
+    return get_path_compression(path)
+
+
+def open_compressed(path, mode, compression, buffering=-1, encoding=None, errors=None,
+                    newline=None):
+    """Open a compressed file, and return a file object.
+
+    Arguments:
+      compression: the name of the compression (e.g. "gzip").
+      buffering: a read buffer size larger than the default to use.
+    """
+    module = COMPRESSION_MODULES[compression]
+    f = module.open(path, mode.replace("t", "").replace("b", "") + "b")
+    if "r" in mode:
+        f = io.BufferedReader(f, buffer_size=max(buffering, DECOMPRESS_BUFFER_SIZE))
+    if "b" in mode:
+        return f
+    return io.TextIOWrapper(f, encoding=encoding, errors=errors, newline=newline)
+
 
-    _log = log.debug if (mode == 'r') else log.info
-    _log('opening file (options=%r, %r): %s' % (args[1:], kwargs, args[0]))
+def logged_open(*args, compression=None, **kwargs):
+    """Open a file like open(), and return a file object.
 
+    Compressed files are (de)compressed transparently if the caller
+    opts in with the compression argument.  By default, the file is
+    opened without compression.
+
+    Arguments:
+      compression: the name of a compression to use (e.g. "gzip"), None
+        or False for no compression, COMPRESSION_EXTENSION to choose the
+        compression from the file extension (e.g. ".gz"), or
+        COMPRESSION_AUTO to detect the compression from the file's magic
+        bytes when reading.  Readers of ballot files pass
+        COMPRESSION_AUTO so that compressed exports can be read whatever
+        their name.
+    """
+    path, args = args[0], args[1:]
+    mode = kwargs.pop('mode', args[0] if args else 'r')
+    args = args[1:]
+
+    _log = log.debug if (mode in ('r', 'rb', 'rt')) else log.info
+    _log('opening file (mode=%r, options=%r, %r): %s' % (mode, args, kwargs, path))
+
+    compression = get_compression(path, mode, compression)
     try:
-        return open(*args, **kwargs)
+        if compression:
+            log.debug("using compression %r: %s" % (compression, path))
+            return open_compressed(path, mode, compression, *args, **kwargs)
+        return open(path, mode, *args, **kwargs)
     except (OSError, TypeError) as exc:
         # TODO: DRY this up with StreamInfo.open().
-        raise type(exc)("arguments: open(*%r, **%r)" % (args, kwargs))
+        raise type(exc)("arguments: open(%r, %r, *%r, **%r)" %
+                        (path, mode, args, kwargs))
 
 
 def make_dirs(path):
@@ -338,9 +460,13 @@ class FileWriter(object):
 
     @contextmanager
     def open(self):
-        with self.resource.writing() as f:
-            self.file = f
+        with self.resource.batch_writing() as write_batch:
+            self.write_batch = write_batch
             yield
 
     def writeln(self, line):
-        self.file.send(line + "\n")
+        self.write_batch((line + "\n", ))
+
+    def writelines(self, lines):
+        """Write a sequence of lines, each with its line ending."""
+        self.write_batch(lines)
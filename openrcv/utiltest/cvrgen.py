@@ -0,0 +1,117 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+"""
+Support for generating synthetic CVR JSON exports for testing.
+
+The exports follow the layout read by openrcv.formats.cvr.  Sessions
+are written one at a time, so exports of any size can be generated in
+constant memory.
+
+"""
+
+import json
+import random
+
+
+def make_marks(choices):
+    """Return the "Marks" of a contest as a list of JSON objects.
+
+    Arguments:
+      choices: a sequence of candidate IDs in rank order.  An item can
+        also be a tuple of candidate IDs to mark an overvote at that rank.
+    """
+    marks = []
+    for rank, choice in enumerate(choices, start=1):
+        candidate_ids = choice if isinstance(choice, tuple) else (choice, )
+        for candidate_id in candidate_ids:
+            marks.append({"CandidateId": candidate_id, "PartyId": None,
+                          "Rank": rank, "MarkDensity": 100,
+                          "IsAmbiguous": False, "IsVote": True})
+    return marks
+
+
+def make_session(record_id, contests, modified=None):
+    """Return a session as a JSON object.
+
+    Arguments:
+      record_id: the session's record ID.
+      contests: a dict mapping contest ID to the choices of the contest
+        (in the form accepted by make_marks()).
+      modified: an optional dict like contests for the "Modified"
+        record of the session.
+    """
+    def make_record(contests):
+        return {"IsCurrent": True,
+                "Cards": [{"Id": record_id, "PaperIndex": 0,
+                           "Contests": [{"Id": contest_id, "Overvotes": 0,
+                                         "Undervotes": 0,
+                                         "Marks": make_marks(choices)}
+                                        for contest_id, choices in sorted(contests.items())]}]}
+    session = {"TabulatorId": 1, "BatchId": 1, "RecordId": record_id,
+               "CountingGroupId": 1, "Original": make_record(contests)}
+    if modified is not None:
+        session["Original"]["IsCurrent"] = False
+        session["Modified"] = make_record(modified)
+    return session
+
+
+def iter_random_sessions(count, candidate_ids, contest_ids=(1, ),
+                         modified_fraction=0.05, rng=None):
+    """Return an iterator over random sessions.
+
+    Arguments:
+      count: the number of sessions.
+      candidate_ids: a sequence of the candidate IDs to rank.
+      contest_ids: the IDs of the contests on each ballot.
+      modified_fraction: the fraction of sessions with a "Modified"
+        record.
+      rng: a random.Random instance.
+    """
+    if rng is None:
+        rng = random.Random()
+
+    def random_contests():
+        contests = {}
+        for contest_id in contest_ids:
+            length = rng.randint(0, len(candidate_ids))
+            contests[contest_id] = rng.sample(list(candidate_ids), length)
+        return contests
+
+    for record_id in range(1, count + 1):
+        modified = random_contests() if rng.random() < modified_fraction else None
+        yield make_session(record_id, random_contests(), modified=modified)
+
+
+def write_cvr(f, sessions):
+    """Write a CVR export to a text file object.
+
+    Arguments:
+      sessions: an iterable of sessions (e.g. from make_session()).
+    """
+    f.write('{"Version": "5.10.11.24", "ElectionId": "Test Election",\n'
+            ' "Sessions": [')
+    for i, session in enumerate(sessions):
+        if i:
+            f.write(",")
+        f.write("\n  ")
+        f.write(json.dumps(session))
+    f.write("\n]}\n")
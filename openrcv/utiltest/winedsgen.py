@@ -0,0 +1,84 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+"""
+Support for generating synthetic WinEDS files for testing.
+
+The files follow the layout read by openrcv.formats.wineds.
+
+"""
+
+# The record type field of the master-lookup file is 10 characters.
+_LOOKUP_FORMAT = "%-10s%07d%-50s%07d%07d%d%d"
+
+
+def format_ballot_records(contest_id, voter_id, choices, rank_count=3, precinct_id=1,
+                          tally_type=1):
+    """Return the ballot-image records of a ballot as a list of strings.
+
+    Arguments:
+      choices: a sequence of candidate IDs in rank order.  An item can
+        also be None to mark a blank rank, or a tuple of candidate IDs
+        to mark an overvote.  Ranks past the end are blank.
+      rank_count: the number of ranks (i.e. records) of each ballot.
+    """
+    records = []
+    for rank in range(1, rank_count + 1):
+        choice = choices[rank - 1] if rank <= len(choices) else None
+        overvote = isinstance(choice, tuple)
+        undervote = choice is None
+        candidate_id = 0 if (overvote or undervote) else choice
+        records.append("%07d%09d%07d%03d%07d%03d%07d%d%d" %
+                       (contest_id, voter_id, voter_id, tally_type, precinct_id, rank,
+                        candidate_id, overvote, undervote))
+    return records
+
+
+def write_ballot_image(f, ballots, contest_id=1, rank_count=3, first_voter_id=1,
+                       line_ending="\r\n"):
+    """Write a ballot-image file.
+
+    Arguments:
+      f: a binary file object.
+      ballots: an iterable of choices (in the form accepted by
+        format_ballot_records()), one per ballot.
+    """
+    for voter_id, choices in enumerate(ballots, start=first_voter_id):
+        records = format_ballot_records(contest_id, voter_id, choices, rank_count=rank_count)
+        f.write("".join(record + line_ending for record in records).encode('ascii'))
+
+
+def write_master_lookup(f, contests, line_ending="\r\n"):
+    """Write a master-lookup file.
+
+    Arguments:
+      f: a text file object.
+      contests: a dict mapping contest ID to a (name, candidates) pair,
+        where candidates is a list of (candidate_id, name) pairs in
+        list order.
+    """
+    for contest_id, (contest_name, candidates) in sorted(contests.items()):
+        f.write(_LOOKUP_FORMAT % ("Contest", contest_id, contest_name, contest_id, 0, 0, 0) +
+                line_ending)
+        for list_order, (candidate_id, name) in enumerate(candidates, start=1):
+            f.write(_LOOKUP_FORMAT % ("Candidate", candidate_id, name, list_order,
+                                      contest_id, 0, 0) + line_ending)
+    f.write(_LOOKUP_FORMAT % ("Precinct", 1, "Pct 1101", 1, 0, 0, 0) + line_ending)
@@ -0,0 +1,81 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+"""
+Compare the throughput of reading compressed and uncompressed ballots.
+
+Usage: python scripts/benchmark_compression.py [BALLOT_COUNT]
+
+This writes a random BLT file in each supported compression to a
+temporary directory and times counting it with count_blt_path().
+"""
+
+import os
+import random
+import sys
+from tempfile import TemporaryDirectory
+import timeit
+
+from openrcv.counting import count_blt_path
+from openrcv.utils import logged_open
+
+CANDIDATE_COUNT = 10
+DEFAULT_BALLOT_COUNT = 500000
+REPEAT = 3
+
+EXTENSIONS = ["", ".gz", ".bz2", ".xz"]
+
+
+def write_blt(path, ballot_count, seed=0):
+    rand = random.Random(seed)
+    numbers = list(range(1, CANDIDATE_COUNT + 1))
+    with logged_open(path, "w", encoding="ascii") as f:
+        f.write("%d 1\n\n" % CANDIDATE_COUNT)
+        for i in range(ballot_count):
+            choices = rand.sample(numbers, rand.randint(1, 5))
+            f.write("1 %s 0\n" % " ".join(str(c) for c in choices))
+        f.write("0\n")
+        for number in numbers:
+            f.write('"Candidate %d"\n' % number)
+        f.write('"Benchmark"\n')
+
+
+def main():
+    ballot_count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BALLOT_COUNT
+    print("ballots: %d" % ballot_count)
+    with TemporaryDirectory() as dir_path:
+        base_seconds = None
+        for ext in EXTENSIONS:
+            path = os.path.join(dir_path, "contest.blt" + ext)
+            write_blt(path, ballot_count)
+            size = os.path.getsize(path)
+            seconds = min(timeit.repeat(lambda: count_blt_path(path), number=1,
+                                        repeat=REPEAT))
+            if base_seconds is None:
+                base_seconds = seconds
+            print("%-5s %10d bytes  %7.3f s  %7.0f ballots/s  %5.2fx" %
+                  (ext or "none", size, seconds, ballot_count / seconds,
+                   seconds / base_seconds))
+
+
+if __name__ == "__main__":
+    main()
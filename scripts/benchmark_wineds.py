@@ -0,0 +1,108 @@
+#
+# Copyright (c) 2014 Chris Jerdonek. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+"""
+Compare the throughput of reading WinEDS and BLT files.
+
+Usage: python scripts/benchmark_wineds.py [BALLOT_COUNT]
+
+This writes the same random contest as a WinEDS ballot-image file (with
+a master lookup) and as a BLT file to a temporary directory, and times
+reading each into a BallotTrie.
+"""
+
+import os
+import random
+import sys
+from tempfile import TemporaryDirectory
+import timeit
+
+from openrcv.counting import read_blt_trie_contest
+from openrcv.formats.wineds import read_wineds_contest
+from openrcv.models import BallotTrie
+from openrcv.utiltest import winedsgen
+
+CANDIDATE_COUNT = 10
+CONTEST_ID = 1
+DEFAULT_BALLOT_COUNT = 500000
+RANK_COUNT = 3
+REPEAT = 3
+
+
+def make_ballots(ballot_count, seed=0):
+    """Return a list of ballots as lists of candidate numbers."""
+    rand = random.Random(seed)
+    numbers = list(range(1, CANDIDATE_COUNT + 1))
+    return [rand.sample(numbers, rand.randint(1, RANK_COUNT)) for i in range(ballot_count)]
+
+
+def write_blt(path, ballots):
+    with open(path, "w", encoding="ascii") as f:
+        f.write("%d 1\n\n" % CANDIDATE_COUNT)
+        for choices in ballots:
+            f.write("1 %s 0\n" % " ".join(str(c) for c in choices))
+        f.write("0\n")
+        for number in range(1, CANDIDATE_COUNT + 1):
+            f.write('"Candidate %d"\n' % number)
+        f.write('"Benchmark"\n')
+
+
+def write_wineds(ballots_path, lookup_path, ballots):
+    # Use candidate IDs unlike the candidate numbers.
+    with open(ballots_path, "wb") as f:
+        winedsgen.write_ballot_image(f, ([100 + c for c in choices] for choices in ballots),
+                                     contest_id=CONTEST_ID, rank_count=RANK_COUNT)
+    candidates = [(100 + n, "Candidate %d" % n) for n in range(1, CANDIDATE_COUNT + 1)]
+    with open(lookup_path, "w", encoding="latin-1") as f:
+        winedsgen.write_master_lookup(f, {CONTEST_ID: ("Benchmark", candidates)})
+
+
+def main():
+    ballot_count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BALLOT_COUNT
+    print("ballots: %d" % ballot_count)
+    ballots = make_ballots(ballot_count)
+    with TemporaryDirectory() as dir_path:
+        blt_path = os.path.join(dir_path, "contest.blt")
+        ballots_path = os.path.join(dir_path, "ballots.txt")
+        lookup_path = os.path.join(dir_path, "lookup.txt")
+        write_blt(blt_path, ballots)
+        write_wineds(ballots_path, lookup_path, ballots)
+
+        def read_blt():
+            read_blt_trie_contest(blt_path)
+
+        def read_wineds():
+            read_wineds_contest(ballots_path, lookup_path, BallotTrie())
+
+        base_seconds = None
+        for name, path, func in (("blt", blt_path, read_blt),
+                                 ("wineds", ballots_path, read_wineds)):
+            size = os.path.getsize(path)
+            seconds = min(timeit.repeat(func, number=1, repeat=REPEAT))
+            if base_seconds is None:
+                base_seconds = seconds
+            print("%-7s %10d bytes  %7.3f s  %7.0f ballots/s  %5.1f MB/s  %5.2fx" %
+                  (name, size, seconds, ballot_count / seconds,
+                   size / seconds / (1 << 20), seconds / base_seconds))
+
+
+if __name__ == "__main__":
+    main()
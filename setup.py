@@ -132,6 +132,10 @@ setup(
         'test':  [
             'coverage',
         ],
+        # Enables the vectorized counting and file-format code paths.
+        'numpy':  [
+            'numpy',
+        ],
     },
 
     # If there are data files included in your packages that need to be